@@ -0,0 +1,61 @@
+"""Microbenchmark of the per-call agent overhead with cached versus rebuilt chains.
+
+A fake chat model answers instantly, so the timings only contain prompt, parser
+and chain work. Run from the repository root with `python -m benchmarks.bench_agents`.
+"""
+import argparse
+import json
+import time
+from langchain.output_parsers import PydanticOutputParser
+from langchain.prompts import PromptTemplate
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from llm_utils.agents import QuestioningAgent
+from llm_utils.pydantic_models import QuestionAnswer
+from llm_utils.stream_handler import DebugHandler
+
+
+QUESTION_ANSWER = json.dumps({"question": "Where do you spend your weekends?",
+                              "answers": ["City cafes", "Mountain trails", "Home garden"]})
+PROPERTIES = ["Urban Living", "Comfort", "Has Kids"]
+PERSONA = "These are the customers properties we already collected previously: Aged: 3; Male: 2"
+
+
+def rebuilt_chain_call(agent: QuestioningAgent):
+    """Reproduces the previous behaviour of building parser, prompt and chain on every call."""
+    parser = PydanticOutputParser(pydantic_object=QuestionAnswer)
+    prompt = PromptTemplate(
+        template="{system_prompt}\n{persona}\n{format_instructions}\nThe Properties you need to create a question for: {properties}",
+        input_variables=["properties", "persona"],
+        partial_variables={"system_prompt": agent.system_prompt,
+                           "format_instructions": parser.get_format_instructions()},
+    )
+    chain = prompt | agent.model | parser
+    config = {"callbacks": [DebugHandler()]}
+    return chain.invoke(input={"properties": ", ".join(PROPERTIES), "persona": PERSONA}, config=config).dict()
+
+
+def time_calls(function, calls: int) -> float:
+    """Return the mean time per call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    agent = QuestioningAgent(FakeListChatModel(responses=[QUESTION_ANSWER]))
+
+    rebuilt = time_calls(lambda: rebuilt_chain_call(agent), args.calls)
+    cached = time_calls(lambda: agent(PROPERTIES, PERSONA), args.calls)
+
+    print(f"rebuilt chain per call: {rebuilt:8.1f} us")
+    print(f"cached chain per call:  {cached:8.1f} us")
+    print(f"overhead removed:       {rebuilt - cached:8.1f} us ({(rebuilt - cached) / rebuilt:.0%})")
+
+
+if __name__ == "__main__":
+    main()
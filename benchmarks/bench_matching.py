@@ -0,0 +1,65 @@
+"""Benchmark of the brute-force and KD-tree car matching backends.
+
+Run from the repository root with `python -m benchmarks.bench_matching`.
+"""
+import argparse
+import time
+import numpy
+from llm_utils.car_catalog import CarCatalog, PROPERTY_NAMES
+from llm_utils.spatial_index import IndexedCatalog
+
+
+def synthetic_catalog(rows: int, seed: int = 0) -> CarCatalog:
+    """Build a catalog of trims scattered around a few base models, like a real lineup."""
+    rng = numpy.random.default_rng(seed)
+    base_models = rng.integers(1, 6, (min(rows, 50), len(PROPERTY_NAMES)))
+    trims = base_models[rng.integers(0, len(base_models), rows)] + rng.normal(0, 0.4, (rows, len(PROPERTY_NAMES)))
+    weights = [1, 1, 1, 1, 2, 1, 1, 2, 2, 1, 2, 1, 1, 1]
+    metadata = {
+        "body_type": rng.choice(numpy.array(["SUV", "Sedan", "Van"]), rows),
+        "base_price_eur": rng.uniform(40000, 200000, rows),
+    }
+    return CarCatalog([f"trim_{i}" for i in range(rows)], numpy.clip(trims, 1, 5), weights,
+                      metadata=metadata)
+
+
+def time_queries(backend, personas, k, where=None) -> float:
+    """Return the mean time per query in microseconds."""
+    start = time.perf_counter()
+    for persona in personas:
+        backend.top_k(persona, k, where)
+    return (time.perf_counter() - start) / len(personas) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(42)
+    uniform_personas = rng.integers(1, 6, (args.queries, len(PROPERTY_NAMES))).astype(float)
+    where = {"body_type": "SUV", "base_price_eur": (None, 120000)}
+
+    print("Mean time per top-k query in microseconds. 'near' personas lie close to catalog trims,")
+    print("'uniform' personas are drawn uniformly from the 1-5 rating cube.")
+    print(f"{'rows':>8} {'personas':>9} {'build ms':>9} {'brute':>9} {'kdtree':>9} "
+          f"{'brute+filter':>13} {'kdtree+filter':>14}")
+    for rows in args.sizes:
+        catalog = synthetic_catalog(rows)
+        start = time.perf_counter()
+        index = IndexedCatalog(catalog)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        picks = catalog.matrix[rng.integers(0, rows, args.queries)]
+        near_personas = numpy.clip(picks + rng.normal(0, 0.3, picks.shape), 1, 5)
+        for label, personas in (("near", near_personas), ("uniform", uniform_personas)):
+            print(f"{rows:>8} {label:>9} {build_ms:>9.1f} "
+                  f"{time_queries(catalog, personas, args.k):>9.1f} "
+                  f"{time_queries(index, personas, args.k):>9.1f} "
+                  f"{time_queries(catalog, personas, args.k, where):>13.1f} "
+                  f"{time_queries(index, personas, args.k, where):>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Full rerun time of the Streamlit app for growing conversations.
+
+The app runs headless in Streamlit's AppTest with a session of synthetic rounds and an
+open question; models are replaced by a fake that is never called. Run from the
+repository root with `python -m benchmarks.bench_rerun`.
+"""
+import argparse
+import json
+import os
+import time
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from streamlit.testing.v1 import AppTest
+from llm_utils import model_registry
+from llm_utils.transcript import Role
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def app_with_rounds(rounds: int) -> AppTest:
+    """Starts the app and fills its session with answered rounds and one open question."""
+    app = AppTest.from_file(MAIN, default_timeout=60)
+    app.secrets["openai_api_key"] = "sk-benchmark"
+    app.secrets["google_api_key"] = "benchmark"
+    app.run()
+    transcript = app.session_state["questionnaire"].transcript
+    for index in range(rounds):
+        transcript.append(Role.ASSISTANT, json.dumps({"question": f"Question {index}: where do you spend weekends?",
+                                                      "answers": ["City cafes", "Mountain trails", "Home garden"]}))
+        transcript.append_text(Role.USER, "Mountain trails")
+        transcript.append(Role.USER, json.dumps({"reasoning": "Likes nature.", "properties": [
+            {"property_name": "Urban Living", "property_value": 2}]}))
+    transcript.append(Role.ASSISTANT, json.dumps({"question": "Open question?", "answers": ["Yes", "No"]}))
+    app.run()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[5, 25, 100, 200])
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    model_registry.ModelRegistry.get_model = lambda self, name, keys, streaming=False: FakeListChatModel(responses=[""])
+    model_registry.ModelRegistry.warm_up = lambda self, *args, **kwargs: None
+
+    for rounds in args.rounds:
+        app = app_with_rounds(rounds)
+        start = time.perf_counter()
+        for _ in range(args.reruns):
+            app.run()
+        elapsed = (time.perf_counter() - start) / args.reruns * 1000
+        print(f"{rounds:4d} rounds: {elapsed:6.1f} ms per rerun, {len(app.radio)} radio widgets, "
+              f"{len(app.chat_message)} chat messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Prompt-token report of native structured output versus format instructions.
+
+Each parsing agent is built on a fake tool-calling chat model and on a fake text-only
+model, which falls back to format instructions. The report compares the input tokens
+per call of both modes; in structured mode the tool schema is counted as well, since
+the provider bills it as input. Run from the repository root with
+`python -m benchmarks.bench_structured_output`; the behaviour of both modes is covered
+by tests/test_structured_output.py.
+"""
+import argparse
+import json
+from typing import Any, List
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from llm_utils.agents import AnalysingQuestioningAgent, PropertyMatchingAgent, QuestioningAgent, UIAgent
+from llm_utils.structured_output import tool_schema
+from llm_utils.token_budget import count_tokens, get_encoding
+
+
+PROPERTIES = "Urban Living, Comfort, Has Kids"
+NEXT_PROPERTIES = "Sustainability, Drive Range"
+PERSONA = "These are the customers properties we already collected previously: Aged: 3; Male: 2"
+QUESTION = "Where do you spend your weekends?"
+QUESTION_ANSWER = {"question": QUESTION, "answers": ["City cafes", "Mountain trails", "Home garden"]}
+PROPERTY_RATING = {"reasoning": "Prefers the city.",
+                   "properties": [{"property_name": name, "property_value": 4} for name in PROPERTIES.split(", ")]}
+OUTPUT = {"title": "Your choice", "ui_elements": [
+    {"type": "RadioButtons", "label": "Pick one", "options": ["EQA", "EQB"]}]}
+
+# (agent class, prompt inputs, response) for every parsing agent
+CASES = [
+    (QuestioningAgent, {"properties": PROPERTIES, "persona": PERSONA}, QUESTION_ANSWER),
+    (PropertyMatchingAgent, {"question": QUESTION, "user_answer": "City cafes", "properties": PROPERTIES},
+     PROPERTY_RATING),
+    (AnalysingQuestioningAgent, {"question": QUESTION, "user_answer": "City cafes", "properties": PROPERTIES,
+                                 "next_properties": NEXT_PROPERTIES, "persona": PERSONA},
+     {"rating": PROPERTY_RATING, "next_question": QUESTION_ANSWER}),
+    (UIAgent, {"message": "Here are your cars ␃ EQA, EQB"}, OUTPUT),
+]
+
+
+class FakeToolCallingChatModel(BaseChatModel):
+    """Fake chat model answering every call with a tool call to the bound tool."""
+
+    arguments: List[str]
+    calls: List[Any] = []
+    i: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tool-calling"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.bind(tools=tools, tool_choice=tool_choice, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls.append(kwargs)
+        arguments = self.arguments[self.i % len(self.arguments)]
+        self.i += 1
+        tool_call = {"id": f"call_{self.i}", "type": "function",
+                     "function": {"name": kwargs["tools"][0]["function"]["name"], "arguments": arguments}}
+        message = AIMessage(content="", additional_kwargs={"tool_calls": [tool_call]})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=6, help="question rounds per session for the totals")
+    args = parser.parse_args()
+
+    print(f"tokenizer: {'cl100k_base' if get_encoding() else 'estimate (4 characters per token)'}")
+    print(f"{'agent':28} {'text':>6} {'structured':>10} {'saved':>6}")
+
+    session_tokens = {"text": 0, "structured": 0}
+    for agent_class, inputs, response in CASES:
+        structured_agent = agent_class(FakeToolCallingChatModel(arguments=[json.dumps(response)]))
+        text_agent = agent_class(FakeListChatModel(responses=[json.dumps(response)]))
+
+        text_tokens = count_tokens(text_agent.prompt.format(**inputs))
+        structured_tokens = (count_tokens(structured_agent.prompt.format(**inputs))
+                             + count_tokens(json.dumps(tool_schema(agent_class.pydantic_object))))
+        saved = text_tokens - structured_tokens
+        print(f"{agent_class.__name__:28} {text_tokens:6} {structured_tokens:10} {saved:6} ({saved / text_tokens:.0%})")
+
+        if agent_class in (QuestioningAgent, PropertyMatchingAgent):
+            session_tokens["text"] += text_tokens * args.rounds
+            session_tokens["structured"] += structured_tokens * args.rounds
+
+    saved = session_tokens["text"] - session_tokens["structured"]
+    print(f"per session ({args.rounds} rounds of questioning and matching): "
+          f"{session_tokens['text']} -> {session_tokens['structured']} input tokens, {saved} saved "
+          f"({saved / session_tokens['text']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
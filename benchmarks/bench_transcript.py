@@ -0,0 +1,113 @@
+"""Memory per session of the transcript versus the previous duplicated message lists.
+
+The previous layout appended a LangChain message with the raw JSON string to both
+`messages` and `conv_history` and reparsed every question on each rerun. Run from the
+repository root with `python -m benchmarks.bench_transcript`.
+"""
+import argparse
+import json
+import pickle
+import random
+import time
+import tracemalloc
+from langchain_core.messages import AIMessage, HumanMessage
+from llm_utils.car_catalog import PROPERTY_NAMES
+from llm_utils.transcript import Role, Transcript
+
+
+def session_responses(rounds: int, seed: int = 0):
+    """Returns (question JSON, analysis JSON) pairs as the agents produce them."""
+    rng = random.Random(seed)
+    responses = []
+    for index in range(rounds):
+        properties = rng.sample(PROPERTY_NAMES, 3)
+        question = json.dumps({"question": f"Question {index}: how do you usually spend a free Saturday afternoon?",
+                               "answers": ["City cafes", "Mountain trails", "Home garden", "Shopping mall"]})
+        analysis = json.dumps({"reasoning": f"Answer {index} points to an active lifestyle outside of the city "
+                                           "with an interest in nature and a moderate budget.",
+                               "properties": [{"property_name": name, "property_value": rng.randint(1, 5)}
+                                              for name in properties]})
+        responses.append((question, analysis))
+    return responses
+
+
+def build_lists(responses):
+    """Builds the previous messages and conv_history lists."""
+    messages, conv_history = [], []
+    for question, analysis in responses:
+        conv_history.append(AIMessage(role="assistant", content=question))
+        messages.append(AIMessage(role="assistant", content=question))
+        conv_history.append(HumanMessage(role="user", content=analysis))
+        messages.append(HumanMessage(role="user", content=analysis))
+    return messages, conv_history
+
+
+def build_transcript(responses):
+    """Builds the transcript."""
+    transcript = Transcript()
+    for question, analysis in responses:
+        transcript.append(Role.ASSISTANT, question)
+        transcript.append(Role.USER, analysis)
+    return transcript
+
+
+def traced_bytes(build, responses) -> tuple:
+    """Returns the bytes a structure keeps alive, including response strings it retains, and the structure."""
+    tracemalloc.start()
+    # Fresh copies of the responses, as every agent call returns new strings
+    copies = [(question[:-1] + "}", analysis[:-1] + "}") for question, analysis in responses]
+    structure = build(copies)
+    del copies
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, structure
+
+
+def rerun_lists(messages):
+    """Reproduces the per-rerun JSON parsing of the previous display loop."""
+    for message in messages:
+        if message.role == "assistant":
+            data = json.loads(message.content)
+            data["question"], data["answers"]
+
+
+def rerun_transcript(transcript):
+    """Reads the pre-parsed payloads like the display loop."""
+    for _, message in transcript.display_view():
+        message.payload.question, message.payload.answers
+
+
+def time_calls(function, calls: int) -> float:
+    """Return the mean time per call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    responses = session_responses(args.rounds)
+    list_bytes, (messages, conv_history) = traced_bytes(build_lists, responses)
+    transcript_bytes, transcript = traced_bytes(build_transcript, responses)
+    assert [message.content for message in messages] == [message.content for message in transcript]
+
+    list_pickle = len(pickle.dumps((messages, conv_history)))
+    transcript_pickle = len(pickle.dumps(transcript.to_records()))
+    list_rerun = time_calls(lambda: rerun_lists(messages), args.calls)
+    transcript_rerun = time_calls(lambda: rerun_transcript(transcript), args.calls)
+
+    print(f"{args.rounds} rounds, {len(transcript)} messages")
+    print(f"messages + conv_history: {list_bytes:9d} bytes in memory, {list_pickle:7d} pickled, "
+          f"{list_rerun:7.1f} us per rerun")
+    print(f"transcript:              {transcript_bytes:9d} bytes in memory, {transcript_pickle:7d} pickled, "
+          f"{transcript_rerun:7.1f} us per rerun")
+    print(f"memory saved: {1 - transcript_bytes / list_bytes:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Deterministic fake chat model answering the questionnaire prompts with simulated latency.
+
+The model recognises the questioning, analysing, fused and conversational prompts and
+returns well-formed responses for them. A seeded share of responses is cut off to
+exercise the parsing agents' repair and retry paths.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+RECOMMENDATION = ("Based on everything you told me, these cars fit you best. Each of them combines the range "
+                  "you need with the comfort you value, and I am happy to arrange a test drive.")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits a response into word tokens with their leading whitespace, as chat models stream them."""
+    return re.findall(r"\s*\S+", text)
+
+
+def respond(prompt: str, rng: random.Random) -> str:
+    """Returns a well-formed response to one of the questionnaire prompts."""
+    if "interviews a customer" in prompt:
+        properties = re.search(r"Properties: (.*)\n", prompt).group(1).split(", ")
+        next_properties = re.search(r"next question for: (.*)\n", prompt).group(1)
+        return json.dumps({
+            "rating": {"reasoning": "The answer hints at an active lifestyle.",
+                       "properties": [{"property_name": name, "property_value": rng.randint(1, 5)}
+                                      for name in properties]},
+            "next_question": {"question": f"How would you plan a day around {next_properties}?",
+                              "answers": ["Spontaneously", "With a detailed plan", "Together with friends"]}})
+    if "create a question for: " in prompt:
+        properties = prompt.rsplit("create a question for: ", 1)[-1].strip()
+        return json.dumps({"question": f"How would you plan a day around {properties}?",
+                           "answers": ["Spontaneously", "With a detailed plan", "Together with friends"]})
+    match = re.search(r"Properties: (.*)\n", prompt)
+    if match:
+        return json.dumps({"reasoning": "The answer hints at an active lifestyle.",
+                           "properties": [{"property_name": name, "property_value": rng.randint(1, 5)}
+                                          for name in match.group(1).split(", ")]})
+    return RECOMMENDATION
+
+
+class FakeLatencyChatModel(BaseChatModel):
+    """
+    Chat model with a fixed time to first token, a token rate and a rate of malformed outputs.
+
+    Responses take `latency` seconds plus one `1 / tokens_per_second` per token; streamed
+    responses deliver the tokens at that rate. Responses and malformed outputs follow a
+    seeded random generator, so runs with the same calls produce the same outputs.
+    """
+
+    latency: float = 0.2
+    tokens_per_second: float = 50.0
+    malformed_rate: float = 0.0
+    seed: int = 0
+    calls: int = 0
+    malformed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    def next_response(self, messages: List[BaseMessage]) -> str:
+        """Returns the response to the last message, malformed at the configured rate."""
+        with self._lock:
+            self.calls += 1
+            response = respond(messages[-1].content, self._rng)
+            if response.startswith("{") and self._rng.random() < self.malformed_rate:
+                self.malformed += 1
+                # A response cut off mid-way, as with an exhausted token limit
+                response = response[:len(response) // 2]
+        return response
+
+    def duration(self, response: str) -> float:
+        """Returns the simulated generation time of a response."""
+        return self.latency + len(tokenize(response)) / self.tokens_per_second
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        response = self.next_response(messages)
+        time.sleep(self.duration(response))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        response = self.next_response(messages)
+        await asyncio.sleep(self.duration(response))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for token in tokenize(self.next_response(messages)):
+            time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in tokenize(self.next_response(messages)):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,195 @@
+"""Load test of the questionnaire flow with simulated users and a fake LLM.
+
+Every user runs a full session on the QuestionnaireEngine: questions are asked,
+a random answer is picked and analysed into the person until every property is rated,
+then the cars are matched and the recommendation is streamed. All agents use a
+FakeLatencyChatModel, so the run measures the process itself. Run from the repository
+root with `python -m benchmarks.load_test --users 200`.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import resource
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from benchmarks.fake_llm import FakeLatencyChatModel
+from llm_utils.agent_pool import AgentPool
+from llm_utils.agents import ParsingAgent
+from llm_utils.deadlines import AgentError
+from llm_utils.model_registry import get_model_registry
+from llm_utils.prefetch import shutdown_prefetching
+from llm_utils.question_bank import get_question_bank
+from llm_utils.questionnaire import QuestionnaireEngine, car_list, is_complete
+from llm_utils.session_store import InMemorySessionStore
+
+STAGES = ("questioning", "analysing", "matching", "recommendation", "session")
+
+
+class TokenCounter(BaseCallbackHandler):
+    """Counts the streamed tokens of the recommendation."""
+
+    def __init__(self):
+        self.tokens = 0
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.tokens += 1
+
+
+class LoadTest:
+    """Runs simulated users against one engine and collects stage latencies and errors."""
+
+    def __init__(self, engine: QuestionnaireEngine, seed: int = 0, max_attempts: int = 3):
+        self.engine = engine
+        self.seed = seed
+        self.max_attempts = max_attempts
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.completed = 0
+        self.rounds = 0
+        self.tokens = 0
+
+    async def stage(self, name: str, step):
+        """Awaits a flow step, retrying it like a user pressing Submit again after an error."""
+        for _ in range(self.max_attempts):
+            start = time.perf_counter()
+            try:
+                result = await step()
+            except AgentError:
+                self.errors[name] += 1
+                continue
+            self.latencies[name].append(time.perf_counter() - start)
+            return result
+        raise AgentError(f"{name} failed {self.max_attempts} times")
+
+    async def user(self, index: int):
+        """Runs one complete session."""
+        rng = random.Random(self.seed * 1_000_003 + index)
+        session_id = f"load-{index}"
+        state = self.engine.load(session_id)
+        start = time.perf_counter()
+        try:
+            while not is_complete(state):
+                question = await self.stage("questioning", lambda: self.engine.aask(session_id, state))
+                answer = rng.choice(question.payload.answers)
+                await self.stage("analysing", lambda: self.engine.aanswer(session_id, state, answer))
+                self.engine.save(session_id, state)
+                self.rounds += 1
+
+            async def matching():
+                return car_list(state.person)
+            await self.stage("matching", matching)
+
+            counter = TokenCounter()
+            await self.stage("recommendation", lambda: self.engine.arecommend(state, counter))
+            self.tokens += counter.tokens
+            self.engine.save(session_id, state)
+        except AgentError:
+            self.errors["abandoned"] += 1
+            return
+        finally:
+            self.engine.delete(session_id)
+        self.latencies["session"].append(time.perf_counter() - start)
+        self.completed += 1
+
+    async def run(self, users: int, concurrency: int) -> float:
+        """Runs all users with at most `concurrency` sessions at a time and returns the wall time."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(index: int):
+            async with semaphore:
+                await self.user(index)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited(index) for index in range(users)))
+        return time.perf_counter() - start
+
+
+def parsing_agents(pool: AgentPool) -> List[ParsingAgent]:
+    """Returns the parsing agents behind the pool's facades."""
+    return [pool.questioning.questioning_agent, pool.analysing.pm_agent, pool.analysing_questioning.aq_agent]
+
+
+def agent_counters(pool: AgentPool) -> Dict[str, int]:
+    """Sums the repair, retry and hedging counters of the pool's parsing agents."""
+    totals: Counter = Counter()
+    for agent in parsing_agents(pool):
+        totals.update(agent.counters)
+    return dict(totals)
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of the process in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=None, help="concurrent sessions, all users by default")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds to the first token")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="generated tokens per second")
+    parser.add_argument("--malformed-rate", type=float, default=0.05, help="share of cut-off JSON responses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fuse", action="store_true", help="rate answers and ask the next question in one call")
+    parser.add_argument("--no-prefetch", action="store_true", help="do not prefetch the following question")
+    parser.add_argument("--question-bank", action="store_true", help="serve pre-generated questions")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the agents' output, e.g. validation errors")
+    args = parser.parse_args()
+
+    model = FakeLatencyChatModel(latency=args.latency, tokens_per_second=args.token_rate,
+                                 malformed_rate=args.malformed_rate, seed=args.seed)
+    get_model_registry().get_model = lambda model_name, api_keys, streaming=False: model
+
+    pool = AgentPool({"openai": "sk-load-test"}, get_question_bank() if args.question_bank else None)
+    # Every simulated user renders similar prompts; cached responses would hide the model calls
+    for agent in parsing_agents(pool):
+        agent.cache = None
+    engine = QuestionnaireEngine(pool, InMemorySessionStore(), prefetch_questions=not args.no_prefetch,
+                                 fuse_analysing_questioning=args.fuse)
+
+    load_test = LoadTest(engine, seed=args.seed)
+    agent_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with agent_output:
+        wall_time = asyncio.run(load_test.run(args.users, args.concurrency or args.users))
+        shutdown_prefetching()
+
+    report = {
+        "users": args.users,
+        "completed": load_test.completed,
+        "wall_time_s": round(wall_time, 3),
+        "sessions_per_s": round(load_test.completed / wall_time, 2),
+        "rounds_per_s": round(load_test.rounds / wall_time, 2),
+        "streamed_tokens_per_s": round(load_test.tokens / wall_time, 1),
+        "llm_calls": model.calls,
+        "malformed_responses": model.malformed,
+        "agents": agent_counters(pool),
+        "errors": dict(load_test.errors),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "latency_ms": {stage: {f"p{p}": round(float(np.percentile(load_test.latencies[stage], p)) * 1000, 1)
+                               for p in (50, 95, 99)}
+                       for stage in STAGES if load_test.latencies[stage]},
+    }
+
+    print(f"{report['completed']}/{args.users} sessions in {wall_time:.2f} s: "
+          f"{report['sessions_per_s']} sessions/s, {report['rounds_per_s']} rounds/s, "
+          f"{report['streamed_tokens_per_s']} streamed tokens/s")
+    print(f"{'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, percentiles in report["latency_ms"].items():
+        print(f"{stage:<16}" + "".join(f"{value:>10.1f}" for value in percentiles.values()))
+    print(f"LLM calls {model.calls}, malformed {model.malformed}, agents {report['agents']}")
+    print(f"errors {report['errors']}, peak RSS {report['peak_rss_mb']} MB")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Microbenchmark suite of the CPU work done on every request or rerun, with a regression gate.
+
+    python -m benchmarks.suite run [--output results.json]   time all benchmarks
+    python -m benchmarks.suite baseline                      time them and store benchmarks/baseline.json
+    python -m benchmarks.suite compare [--threshold 0.25]    time them and fail on regressions confirmed by a second timing
+
+Every benchmark uses fixed fixtures and reports the best of several repeats in
+nanoseconds per operation. Comparisons use the median time relative to a pure Python
+reference loop timed alongside each repeat, so baselines recorded on another
+machine stay comparable; `--absolute` compares the raw timings instead. The
+changes shown are relative ones. Run from the repository root.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from llm_utils.agents import PropertyMatchingAgent, QuestioningAgent
+from llm_utils.car_catalog import PROPERTY_NAMES
+from llm_utils.matching import match_car
+from llm_utils.prompt_assembly import get_non_zero_properties, prompt_assembly
+from llm_utils.questionnaire import separate_and_select, update_person
+from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
+from llm_utils.transcript import Role, Transcript, parse_payload
+from streamlit_utils.view_models import TranscriptViews
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+QUESTION_JSON = json.dumps({"question": "Where do you usually spend a free Saturday afternoon?",
+                            "answers": ["City cafes", "Mountain trails", "Home garden", "Shopping mall"]})
+RATING_JSON = json.dumps({"reasoning": "The answer points to an active lifestyle outside of the city.",
+                          "properties": [{"property_name": "Urban Living", "property_value": 2},
+                                         {"property_name": "Comfort", "property_value": 4},
+                                         {"property_name": "Has Kids", "property_value": 3}]})
+RECOMMENDATION_TOKENS = ["Based", " on", " your", " answers", " the", " EQS", " SUV", " fits", " you", " best", "."] * 8 + [
+    " ␃", '{"title"', ': "Cars"}']
+
+
+class NullContainer:
+    """Stands in for the Streamlit placeholder the stream handler renders to."""
+
+    def markdown(self, text: str):
+        pass
+
+
+def person_fixture() -> Dict[str, float]:
+    """Returns a person with about half of the properties rated."""
+    return {name: (index % 5) + 1.0 if index % 2 else 0 for index, name in enumerate(PROPERTY_NAMES)}
+
+
+def transcript_fixture(rounds: int = 20) -> Transcript:
+    """Returns a transcript of answered rounds with one open question."""
+    transcript = Transcript()
+    for _ in range(rounds):
+        transcript.append(Role.ASSISTANT, QUESTION_JSON)
+        transcript.append_text(Role.USER, "Mountain trails")
+        transcript.append(Role.USER, RATING_JSON)
+    transcript.append(Role.ASSISTANT, QUESTION_JSON)
+    return transcript
+
+
+def reference_loop():
+    """Pure Python work used to normalize timings across machines."""
+    total = 0
+    values = {}
+    for index in range(200):
+        values[index & 15] = total
+        total += index * 3 % 7
+    return total
+
+
+def benchmarks() -> Dict[str, Callable[[], object]]:
+    """Returns the benchmarks by name, with their fixtures bound."""
+    person = person_fixture()
+    full_person = {name: 3.0 for name in PROPERTY_NAMES}
+    person_values = [value or 3.0 for value in person.values()]
+    rating = parse_payload(RATING_JSON)
+    user_inputs = {"Where do you usually spend a free Saturday afternoon?": "Mountain trails",
+                   "How do you travel to work?": "None"}
+    questioning = QuestioningAgent(FakeListChatModel(responses=[QUESTION_JSON]))
+    property_matching = PropertyMatchingAgent(FakeListChatModel(responses=[RATING_JSON]))
+    malformed_rating = RATING_JSON[:-1] + ",}"
+    transcript = transcript_fixture()
+    random.seed(0)
+
+    def stream_recommendation():
+        handler = StreamUntilSpecialTokenHandler(NullContainer())
+        for token in RECOMMENDATION_TOKENS:
+            handler.on_llm_new_token(token)
+        handler.on_llm_end(None)
+        return handler.text
+
+    return {
+        "match_car": lambda: match_car(person_values, k=3),
+        "match_car_indexed": lambda: match_car(person_values, k=3, indexed=True),
+        "prompt_assembly": lambda: prompt_assembly(user_inputs, "I like long drives"),
+        "get_non_zero_properties": lambda: get_non_zero_properties(person),
+        "separate_and_select": lambda: separate_and_select(person),
+        "update_person": lambda: update_person(dict(full_person), rating),
+        "parse_question_answer": lambda: questioning.parse(QUESTION_JSON),
+        "parse_property_rating": lambda: property_matching.parse(RATING_JSON),
+        "parse_property_rating_repaired": lambda: property_matching.parse(malformed_rating),
+        "stream_special_token_handler": stream_recommendation,
+        "parse_payload_question": lambda: parse_payload(QUESTION_JSON),
+        "transcript_views_20_rounds": lambda: TranscriptViews(transcript).update(),
+    }
+
+
+def calibrate(function: Callable[[], object], target: float) -> int:
+    """Returns the number of calls that take about `target` seconds."""
+    function()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target / 10:
+            return max(1, int(loops * target / elapsed))
+        loops *= 10
+
+
+def time_loops(function: Callable[[], object], loops: int) -> float:
+    """Returns the nanoseconds per call of `loops` calls."""
+    start = time.perf_counter()
+    for _ in range(loops):
+        function()
+    return (time.perf_counter() - start) / loops * 1e9
+
+
+def time_benchmark(function: Callable[[], object], repeats: int, target: float) -> Tuple[float, float, float]:
+    """
+    Returns the best and median nanoseconds per call and the median time relative to the reference loop.
+
+    Every repeat also times the reference loop right before the benchmark, so both see the
+    same machine state; the relative time cancels frequency scaling and noisy neighbours.
+    """
+    loops = calibrate(function, target)
+    reference_loops = calibrate(reference_loop, target / 4)
+    timings, ratios = [], []
+    for _ in range(repeats):
+        reference = time_loops(reference_loop, reference_loops)
+        timing = time_loops(function, loops)
+        timings.append(timing)
+        ratios.append(timing / reference)
+    return min(timings), statistics.median(timings), statistics.median(ratios)
+
+
+def run(names: List[str], repeats: int, target: float) -> dict:
+    """Times the selected benchmarks."""
+    suite = benchmarks()
+    selected = [name for name in suite if not names or any(part in name for part in names)]
+    results = {}
+    for name in selected:
+        best, median, relative = time_benchmark(suite[name], repeats, target)
+        results[name] = {"ns": round(best, 1), "median_ns": round(median, 1), "relative": round(relative, 5)}
+        print(f"{name:32} {best:12.0f} ns  (median {median:.0f}, {relative:.4f} x reference)")
+    return {"python": sys.version.split()[0], "results": results}
+
+
+def compare(current: dict, baseline: dict, threshold: float, absolute: bool) -> List[str]:
+    """Prints the change of every benchmark against the baseline and returns the regressed ones."""
+    key = "ns" if absolute else "relative"
+    regressions = []
+    print(f"{'benchmark':32} {'baseline ns':>12} {'current ns':>12} {'change':>8}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        change = result[key] / baseline["results"][name][key] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:32} {baseline['results'][name]['ns']:12.0f} {result['ns']:12.0f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["run", "baseline", "compare"])
+    parser.add_argument("names", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--repeats", type=int, default=15)
+    parser.add_argument("--target", type=float, default=0.03, help="seconds per repeat")
+    parser.add_argument("--output", default=None, help="write the results to this file")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--results", default=None, help="compare these stored results instead of running")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--absolute", action="store_true", help="compare raw timings without normalization")
+    args = parser.parse_args()
+
+    if args.command == "compare" and args.results:
+        current = json.loads(Path(args.results).read_text())
+    else:
+        current = run(args.names, args.repeats, args.target)
+
+    output = args.baseline if args.command == "baseline" else args.output
+    if output:
+        Path(output).write_text(json.dumps(current, indent=2) + "\n")
+        print(f"results written to {output}")
+
+    if args.command == "compare":
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(current, baseline, args.threshold, args.absolute)
+        if regressions and not args.results:
+            # A single slow sample on a busy machine should not fail the gate; time the regressed ones again
+            print(f"timing {', '.join(regressions)} again")
+            current["results"].update(run(regressions, args.repeats, args.target)["results"])
+            regressions = compare({"results": {name: current["results"][name] for name in regressions}},
+                                  baseline, args.threshold, args.absolute)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
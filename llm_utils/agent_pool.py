@@ -0,0 +1,45 @@
+"""Process-wide pool of the stateless agent facades shared by all sessions."""
+import threading
+from typing import Dict, List, Optional, Tuple
+from llm_utils.conversation import Conversation
+from llm_utils.questioning import Questioning
+from llm_utils.analysing import Analysing
+from llm_utils.analysing_questioning import AnalysingQuestioning
+from llm_utils.question_bank import QuestionBank
+from llm_utils.response_cache import get_response_cache
+
+
+class AgentPool:
+    """
+    Questioning, analysing and fused agents for one set of API keys.
+
+    These facades keep no per-session state, so sessions share them instead of
+    building and storing their own.
+    """
+
+    def __init__(self, api_keys: dict, question_bank: Optional[QuestionBank] = None):
+        self.api_keys = api_keys
+        cache = get_response_cache()
+        self.questioning = Questioning(api_keys, cache=cache, question_bank=question_bank)
+        self.analysing = Analysing(api_keys, cache=cache)
+        self.analysing_questioning = AnalysingQuestioning(api_keys, cache=cache)
+
+    def conversation(self, responses: Optional[List[str]] = None) -> Conversation:
+        """Builds a conversation for one session, as it keeps the session's earlier responses in memory."""
+        conversation = Conversation(self.api_keys)
+        conversation.restore_memory(responses or [])
+        return conversation
+
+
+_pools: Dict[Tuple, AgentPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_agent_pool(api_keys: dict, question_bank: Optional[QuestionBank] = None) -> AgentPool:
+    """Returns the shared agent pool for the API keys, creating it on first use."""
+    key = (tuple(sorted(api_keys.items(), key=lambda item: item[0])), id(question_bank))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = AgentPool(api_keys, question_bank)
+    return pool
@@ -1,22 +1,59 @@
 """Module for defining agents that interact with LLMs for conversational and UI responses."""
-from typing import Callable, List
-import traceback
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+import asyncio
+import copy
+import json
+import logging
+import threading
+import time
+import httpx
 from langchain.schema import StrOutputParser
 from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate, PromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+from openai import APITimeoutError
 from pydantic import ValidationError
-from llm_utils.pydantic_models import Output, QuestionAnswer, PropertyRating
-from llm_utils.config_loader import load_few_shot_examples, load_config
-from llm_utils.stream_handler import DebugHandler
+from llm_utils.pydantic_models import Output, QuestionAnswer, PropertyRating, RatingAndQuestion
+from llm_utils.config_loader import AppConfig, get_config
+from llm_utils.stream_handler import SpecialTokenReached
+from llm_utils.response_cache import ResponseCache, make_key
+from llm_utils.json_repair import repair_and_validate
+from llm_utils.deadlines import AgentTimeoutError, ahedged_call, get_latency_tracker, hedged_call
+from llm_utils.instrumentation import InstrumentationHandler, Span, get_instrumentation
+from llm_utils.structured_output import bind_structured_output, tool_arguments
+from llm_utils.usage_ledger import get_usage_ledger
+from llm_utils.token_budget import compact_turns, count_tokens, truncate_to_tokens
 
 
-class Agent:
+logger = logging.getLogger(__name__)
+
+# Errors of a call that missed its deadline, also when the HTTP request itself timed out
+REQUEST_TIMEOUTS = (AgentTimeoutError, APITimeoutError, httpx.TimeoutException)
+
+
+def render_static(template: str, **static_values: str) -> str:
+    """
+    Renders the static parts of a prompt template once.
+
+    The given values are substituted (with their braces escaped), while all other
+    placeholders are kept for per-call substitution.
+    """
+    class _KeepPlaceholder(dict):
+        def __missing__(self, key):
+            return "{" + key + "}"
+
+    escaped = {key: value.replace("{", "{{").replace("}", "}}") for key, value in static_values.items()}
+    return template.format_map(_KeepPlaceholder(escaped))
+
+
+class Agent(ABC):
     """Base class for agents interacting with LLMs."""
 
     def __init__(self, model):
         self.model = model
-        self.config = load_config()
+        self.config: AppConfig = get_config()
 
         self.example_prompt = ChatPromptTemplate.from_messages(
             [
@@ -25,14 +62,69 @@ class Agent:
             ]
         )
 
+        self.chain = None
+        self._config_lock = threading.Lock()
+
+    def apply_config(self):
+        """Sets up the parts of the agent that depend on the config, e.g. its prompt."""
+        # Maximum prompt tokens per call, None for no limit
+        self.max_prompt_tokens = self.config.prompt_budgets.get(type(self).__name__)
+
+    def refresh_config(self):
+        """
+        Applies the config again if it was reloaded since the agent last applied it.
+
+        Agents are shared across sessions, so the new prompts and chains are built on a
+        copy of the agent and swapped in with a single update instead of one by one.
+        """
+        config = get_config()
+        if config is self.config:
+            return
+        with self._config_lock:
+            if config is self.config:
+                return
+            fresh = copy.copy(self)
+            before = dict(vars(fresh))
+            fresh.config = config
+            fresh.apply_config()
+            vars(self).update({key: value for key, value in vars(fresh).items() if before.get(key) is not value})
+
     def update_model(self, model):
-        """Updates the agent's model."""
+        """Updates the agent's model and rebuilds its chain."""
         self.model = model
+        self.chain = self.build_chain()
+
+    @abstractmethod
+    def build_chain(self):
+        """Builds the agent's prompt, model and parser chain."""
 
     def get_model(self):
         """Returns the agent's model."""
         return self.model
 
+    def get_model_name(self) -> str:
+        """Returns the name of the agent's model."""
+        return getattr(self.model, "model_name", None) or type(self.model).__name__
+
+    def count_tokens(self, text: str) -> int:
+        """Counts the tokens of a text with the tokenizer of the agent's model."""
+        return count_tokens(text, self.get_model_name())
+
+    def start_span(self) -> Span:
+        """Starts the instrumentation span of a call."""
+        return get_instrumentation().start_span(type(self).__name__, self.get_model_name())
+
+    @staticmethod
+    def record_span(span: Span, status: Optional[str] = None):
+        """Exports the span of a finished call and books its tokens in the usage ledger."""
+        get_instrumentation().record(span, status)
+        get_usage_ledger().charge(span)
+
+    def log_tokens(self, before: int, after: int):
+        """Logs the prompt token count of a call before and after compaction."""
+        logger.info("%s prompt tokens: %d -> %d (budget %s)",
+                    type(self).__name__, before, after, self.max_prompt_tokens)
+
 
 class ConversationalAgent(Agent):
     """Agent for handling conversations."""
@@ -40,151 +132,459 @@ class ConversationalAgent(Agent):
     def __init__(self, model):
         super().__init__(model)
         self.memory = []
-        self.system_prompt = self.config["conversational_prompt"]
-
-    def __call__(self, persona: str, cars: str, stream_handler: Callable) -> str:
-
-        prompt = PromptTemplate(
-            template="{system_prompt}\n{cars}\n{memory}",
-            input_variables=["persona", "cars"],
-            partial_variables={"system_prompt": self.system_prompt, "memory": '\n'.join([str(msg) for msg in self.memory])},
-        )
+        self.apply_config()
+
+    def apply_config(self):
+        """Renders the system prompt into the template and reads the memory settings."""
+        super().apply_config()
+        self.system_prompt = self.config.conversational_prompt
+        self.memory_window = self.config.memory.window  # Most recent turns kept verbatim
+        self.summary_tokens = self.config.memory.summary_tokens  # Tokens per compacted older turn
+        self.max_memory_turns = self.config.memory.max_turns
+        self.prompt = PromptTemplate.from_template(
+            render_static("{system_prompt}\n{persona}\n{cars}\n{memory}", system_prompt=self.system_prompt))
+        self.chain = self.build_chain()
+
+    def build_chain(self):
+        """Builds the chain with the system prompt rendered into the template."""
+        return self.prompt | self.model | StrOutputParser()
+
+    def inputs(self, persona: str, cars: str) -> dict:
+        """
+        Builds the prompt variables with the memory fitted into the token budget.
+
+        Older turns beyond the memory window are compacted; if the prompt is still over
+        budget the oldest remaining turns are dropped and finally the memory is cut.
+        """
+        turns = [msg.content for msg in self.memory]
+        inputs = {"persona": persona, "cars": cars, "memory": "\n".join(turns)}
+        before = self.count_tokens(self.prompt.format(**inputs))
+
+        turns = compact_turns(turns, self.memory_window, self.summary_tokens, self.get_model_name())
+        inputs["memory"] = "\n".join(turns)
+        after = self.count_tokens(self.prompt.format(**inputs))
+        while self.max_prompt_tokens and after > self.max_prompt_tokens and len(turns) > 1:
+            turns = turns[1:]
+            inputs["memory"] = "\n".join(turns)
+            after = self.count_tokens(self.prompt.format(**inputs))
+        if self.max_prompt_tokens and after > self.max_prompt_tokens:
+            memory_budget = self.count_tokens(inputs["memory"]) - (after - self.max_prompt_tokens)
+            inputs["memory"] = truncate_to_tokens(inputs["memory"], memory_budget, self.get_model_name())
+            after = self.count_tokens(self.prompt.format(**inputs))
+
+        self.log_tokens(before, after)
+        return inputs
+
+    def memory_limit(self) -> int:
+        """Returns the most turns that can reach the prompt: the window and the compacted turns fitting the budget."""
+        if not self.summary_tokens:
+            return min(self.memory_window, self.max_memory_turns)
+        compacted = self.max_memory_turns
+        if self.max_prompt_tokens:
+            compacted = self.max_prompt_tokens // self.summary_tokens
+        return min(self.memory_window + compacted, self.max_memory_turns)
+
+    def remember(self, response: str):
+        """Adds a response to the memory, forgetting the turns that could no longer reach the prompt."""
+        self.memory.append(AIMessage(role="assistant", content=response))
+        self.trim_memory()
 
-        chain = (
-            prompt
-            | self.model
-            | StrOutputParser()
-        )
+    def trim_memory(self):
+        """Keeps only the most recent turns within the memory limit."""
+        del self.memory[:max(len(self.memory) - self.memory_limit(), 0)]
 
-        config = {"callbacks": [stream_handler]}
-        response = chain.invoke(input={"persona": persona, "cars": cars}, config=config)
-        self.memory.append(AIMessage(role="assistant", content=response))
+    def __call__(self, persona: str, cars: str, stream_handler: Callable) -> str:
+        self.refresh_config()
+        span = self.start_span()
+        config = {"callbacks": [InstrumentationHandler(span), stream_handler]}
+        try:
+            response = self.chain.invoke(input=self.inputs(persona, cars), config=config)
+        except SpecialTokenReached as e:
+            response = e.text
+        except Exception:
+            self.record_span(span, "error")
+            raise
+        self.record_span(span)
+        self.remember(response)
         return response
 
+    async def acall(self, persona: str, cars: str, stream_handler: Callable) -> str:
+        """Asynchronous counterpart of __call__ that streams the response."""
+        self.refresh_config()
+        span = self.start_span()
+        config = {"callbacks": [InstrumentationHandler(span), stream_handler]}
+        chunks = []
+        try:
+            async for chunk in self.chain.astream(input=self.inputs(persona, cars), config=config):
+                chunks.append(chunk)
+            response = "".join(chunks)
+        except SpecialTokenReached as e:
+            response = e.text
+        except Exception:
+            self.record_span(span, "error")
+            raise
+        self.record_span(span)
+        self.remember(response)
+        return response
 
-class QuestioningAgent(Agent):
-    """Agent for generating responses based on a list of properties."""
 
-    def __init__(self, model):
-        super().__init__(model)
-        self.system_prompt = self.config["questioning_prompt"]
+class ParsingAgent(Agent):
+    """Base class for agents whose output is parsed into a pydantic model."""
 
-    def __call__(self, properties: List[str], persona: str) -> str:
-        properties = ", ".join(properties)
-        parser = PydanticOutputParser(pydantic_object=QuestionAnswer)
+    pydantic_object = None
+    prompt_key = ""
+    template = ""
+    compactable = ()  # Inputs that may be cut to fit the prompt budget
+    retry_backoff = 0.5  # Seconds before the first re-call, doubled on every further attempt
 
-        prompt = PromptTemplate(
-            template="{system_prompt}\n{persona}\n{format_instructions}\nThe Properties you need to create a question for: {properties}",
-            input_variables=["properties", "persona"],
-            partial_variables={"system_prompt": self.system_prompt,
-                               "format_instructions": parser.get_format_instructions()},
-        )
+    def __init__(self, model, cache: Optional[ResponseCache] = None, hedge_model=None):
+        super().__init__(model)
+        self.cache = cache
+        self.hedge_model = hedge_model
+        self.counters = {"repaired": 0, "retried": 0, "failed": 0, "hedged": 0, "timeouts": 0}
+        self.parser = PydanticOutputParser(pydantic_object=self.pydantic_object)
+        self.apply_config()
+
+    def apply_config(self):
+        """Renders the system prompt into the templates and builds the chains."""
+        super().apply_config()
+        self.system_prompt = getattr(self.config, self.prompt_key)
+        self.text_prompt = PromptTemplate.from_template(render_static(
+            self.template,
+            system_prompt=self.system_prompt,
+            format_instructions=self.parser.get_format_instructions()))
+        # With native structured output the schema is sent as a tool instead of in the prompt
+        self.structured_prompt = PromptTemplate.from_template(render_static(
+            self.template,
+            system_prompt=self.system_prompt,
+            format_instructions=""))
+
+        # Seconds the user may wait for a validated response, None for no deadline
+        self.deadline = self.config.deadlines.get(type(self).__name__)
+        self.hedging = self.config.hedging
+        self.configure_output()
+        self.chain = self.build_chain()
+        self.hedge_chain = None if self.hedge_model is None else self.build_chain(self.hedge_model)
 
-        chain = (
-            prompt
-            | self.model
-            | parser
-        )
+    def update_model(self, model):
+        """Updates the agent's model and rebuilds its chain."""
+        self.model = model
+        self.configure_output()
+        self.chain = self.build_chain()
+
+    def configure_output(self):
+        """Uses native structured output if enabled and supported by the model, otherwise format instructions."""
+        self.structured = (self.config.structured_output
+                           and bind_structured_output(self.model, self.pydantic_object) is not None)
+        self.prompt = self.structured_prompt if self.structured else self.text_prompt
+        self.latency = get_latency_tracker(f"{type(self).__name__}:{self.get_model_name()}")
+
+    def build_chain(self, model=None):
+        """Builds the model chain returning the raw completion; prompt and parsing are handled separately."""
+        model = model or self.model
+        structured = bind_structured_output(model, self.pydantic_object) if self.structured else None
+        if structured is not None:
+            # The raw tool call arguments go through the same parsing and repair as text completions
+            return structured | RunnableLambda(tool_arguments)
+        return model | StrOutputParser()
+
+    @staticmethod
+    def with_timeout(chain, expires: Optional[float]):
+        """
+        Returns the chain with the HTTP timeout bound to the time left until `expires`.
+
+        Raises AgentTimeoutError if the deadline passed already, e.g. while the call waited
+        for a worker, so that no request is sent whose response would be ignored.
+        """
+        if expires is None:
+            return chain
+        timeout = expires - time.monotonic()
+        if timeout <= 0:
+            raise AgentTimeoutError("Deadline reached before the request was sent")
+        # Lets the request itself give up instead of lingering after the deadline
+        return chain.first.bind(timeout=timeout) | chain.last
+
+    def hedge_after(self) -> Optional[float]:
+        """Returns the seconds after which a hedged request is sent, or None while hedging is off."""
+        if not self.hedging.enabled or len(self.latency) < self.hedging.min_samples:
+            return None
+        return self.latency.percentile(self.hedging.percentile)
+
+    def render(self, inputs: dict):
+        """
+        Renders the prompt within the token budget.
+
+        If the prompt is over budget, the variable inputs listed in `compactable` are
+        cut, in order, until it fits.
+        """
+        prompt_value = self.prompt.invoke(inputs)
+        before = after = self.count_tokens(prompt_value.to_string())
+        if self.max_prompt_tokens and before > self.max_prompt_tokens:
+            for key in self.compactable:
+                excess = after - self.max_prompt_tokens
+                value_budget = self.count_tokens(inputs[key]) - excess
+                inputs = {**inputs, key: truncate_to_tokens(inputs[key], value_budget, self.get_model_name())}
+                prompt_value = self.prompt.invoke(inputs)
+                after = self.count_tokens(prompt_value.to_string())
+                if after <= self.max_prompt_tokens:
+                    break
+        self.log_tokens(before, after)
+        return prompt_value
+
+    def invoke(self, inputs: dict) -> Optional[dict]:
+        """Renders the prompt and returns the validated response, using the cache if configured."""
+        self.refresh_config()
+        span = self.start_span()
+        prompt_value = self.render(inputs)
+        if self.cache is None:
+            return self.finish_span(span, self.generate(prompt_value, span))
+
+        key = make_key(self.get_model_name(), prompt_value.to_string())
+        # Stays set if the response comes from the cache or from a concurrent identical call
+        span.cache_hit = True
+        response = self.cache.get_or_compute(key, lambda: self.generate(prompt_value, span))
+        return self.finish_span(span, response)
+
+    async def ainvoke(self, inputs: dict) -> Optional[dict]:
+        """Asynchronous counterpart of invoke."""
+        self.refresh_config()
+        span = self.start_span()
+        prompt_value = self.render(inputs)
+        if self.cache is None:
+            return self.finish_span(span, await self.agenerate(prompt_value, span))
+
+        key = make_key(self.get_model_name(), prompt_value.to_string())
+        span.cache_hit = True
+        response = await self.cache.aget_or_compute(key, lambda: self.agenerate(prompt_value, span))
+        return self.finish_span(span, response)
+
+    def finish_span(self, span: Span, response: Optional[dict]) -> Optional[dict]:
+        """Records the span of a call and passes its response through."""
+        if response is None and span.status == "ok":
+            span.status = "failed"
+        self.record_span(span)
+        return response
 
-        handler = DebugHandler()
-        config = {"callbacks": [handler]}
+    def parse(self, text: str):
+        """Parses a completion into the pydantic model, repairing malformed JSON locally."""
+        try:
+            return self.pydantic_object.model_validate(json.loads(text))
+        except (json.JSONDecodeError, ValidationError):
+            validated_data = repair_and_validate(text, self.pydantic_object)
+            self.counters["repaired"] += 1
+            return validated_data
+
+    def attempt(self, chain, prompt_value, config, expires: Optional[float] = None):
+        """
+        Calls a chain once before `expires` and parses its completion.
+
+        The duration of every call of the primary model is recorded, also when it failed,
+        so that the hedging percentile is not biased towards the calls that succeeded.
+        """
+        start = time.monotonic()
+        try:
+            text = self.with_timeout(chain, expires).invoke(prompt_value, config=config)
+        finally:
+            if chain is self.chain:
+                self.latency.record(time.monotonic() - start)
+        return self.parse(text)
+
+    async def aattempt(self, chain, prompt_value, config, expires: Optional[float] = None):
+        """
+        Asynchronous counterpart of attempt.
+
+        A call cancelled because the hedged one won is recorded with the time it ran,
+        which is a lower bound of its latency.
+        """
+        start = time.monotonic()
+        try:
+            text = await self.with_timeout(chain, expires).ainvoke(prompt_value, config=config)
+        finally:
+            if chain is self.chain:
+                self.latency.record(time.monotonic() - start)
+        return self.parse(text)
+
+    def request(self, prompt_value, config, timeout: Optional[float]):
+        """
+        Returns the first valid parsed response within the timeout.
+
+        Once enough latencies are recorded, a second request (to the hedge model if one is
+        set) is sent when the first one is slower than the configured percentile. Each
+        request only gets the time left until the timeout.
+        """
+        hedge_after = self.hedge_after()
+        expires = None if timeout is None else time.monotonic() + timeout
+        if timeout is None and hedge_after is None:
+            return self.attempt(self.chain, prompt_value, config)
+        return hedged_call(lambda: self.attempt(self.chain, prompt_value, config, expires),
+                           lambda: self.attempt(self.hedge_chain or self.chain, prompt_value, config, expires),
+                           hedge_after, timeout, on_hedge=self.record_hedge)
+
+    async def arequest(self, prompt_value, config, timeout: Optional[float]):
+        """Asynchronous counterpart of request."""
+        hedge_after = self.hedge_after()
+        expires = None if timeout is None else time.monotonic() + timeout
+        if timeout is None and hedge_after is None:
+            return await self.aattempt(self.chain, prompt_value, config)
+        return await ahedged_call(lambda: self.aattempt(self.chain, prompt_value, config, expires),
+                                  lambda: self.aattempt(self.hedge_chain or self.chain, prompt_value, config, expires),
+                                  hedge_after, timeout, on_hedge=self.record_hedge)
+
+    def record_hedge(self):
+        """Counts a hedged request."""
+        self.counters["hedged"] += 1
+
+    def remaining(self, start: float) -> Optional[float]:
+        """Returns the seconds left until the deadline of a call started at `start`."""
+        if self.deadline is None:
+            return None
+        return self.deadline - (time.monotonic() - start)
+
+    def generate(self, prompt_value, span: Span) -> Optional[dict]:
+        """Sends a rendered prompt to the model and validates the response, retrying if repair fails."""
+        span.cache_hit = False
+        config = {"callbacks": [InstrumentationHandler(span)]}
+        start = time.monotonic()
 
-        retries = 3
+        retries = 3  # Number of retries
         for attempt in range(retries):
             try:
-                validated_data = chain.invoke(
-                    input={"properties": properties, "persona": persona}, config=config)
-                return validated_data.dict()
-
-            except ValidationError as e:
-                print(f"Validation error on attempt {attempt+1}: {e}")
-                if attempt == retries - 1:
+                return self.request(prompt_value, config, self.remaining(start)).dict()
+            except REQUEST_TIMEOUTS as e:
+                return self.timed_out(e, span)
+            except ValueError as e:
+                if not self.should_retry(attempt, retries, e, span):
                     return None
-                print("Retrying...")
+                delay = self.retry_backoff * 2 ** attempt
+                if self.remaining(start) is not None and self.remaining(start) <= delay:
+                    return self.timed_out(AgentTimeoutError("Deadline reached before retrying"), span)
+                time.sleep(delay)
             except Exception as e:
-                print(f"Unexpected error: {traceback.format_exc()} - {e}")
+                logger.exception("%s failed with an unexpected error", type(self).__name__)
+                span.record_error(e)
+                span.status = "error"
                 return None
-            
-class PropertyMatchingAgent(Agent):
-    """Agent for generating responses based on a question and user's answer."""
 
-    def __init__(self, model):
-        super().__init__(model)
-        self.system_prompt = self.config["property_matching_prompt"]
-
-    def __call__(self, question: str, user_answer: str, properties: List[str]) -> PropertyRating:
-        properties = ", ".join(properties)
-        parser = PydanticOutputParser(pydantic_object=PropertyRating)
-
-        prompt = PromptTemplate(
-            template="{system_prompt}\nQuestion: {question}\nUser Answer: {user_answer}\nProperties: {properties}\n{format_instructions}",
-            input_variables=["question", "user_answer"],
-            partial_variables={"system_prompt": self.system_prompt,
-                               "format_instructions": parser.get_format_instructions(),
-                               "properties": properties
-                               },
-        )
-
-        chain = (
-            prompt
-            | self.model
-            | parser
-        )
-
-        handler = DebugHandler()
-        config = {"callbacks": [handler]}
+    async def agenerate(self, prompt_value, span: Span) -> Optional[dict]:
+        """Asynchronous counterpart of generate."""
+        span.cache_hit = False
+        config = {"callbacks": [InstrumentationHandler(span)]}
+        start = time.monotonic()
 
         retries = 3  # Number of retries
         for attempt in range(retries):
             try:
-                validated_data = chain.invoke(
-                    input={"question": question, "user_answer": user_answer}, config=config)
-                return validated_data.dict()
-            except ValidationError as e:
-                print(f"Validation error on attempt {attempt+1}: {e}")
-                if attempt == retries - 1:
+                return (await self.arequest(prompt_value, config, self.remaining(start))).dict()
+            except REQUEST_TIMEOUTS as e:
+                return self.timed_out(e, span)
+            except ValueError as e:
+                if not self.should_retry(attempt, retries, e, span):
                     return None
-                print("Retrying...")
+                delay = self.retry_backoff * 2 ** attempt
+                if self.remaining(start) is not None and self.remaining(start) <= delay:
+                    return self.timed_out(AgentTimeoutError("Deadline reached before retrying"), span)
+                await asyncio.sleep(delay)
             except Exception as e:
-                print(f"Unexpected error: {traceback.format_exc()} - {e}")
+                logger.exception("%s failed with an unexpected error", type(self).__name__)
+                span.record_error(e)
+                span.status = "error"
                 return None
-class UIAgent(Agent):
-    """Agent for generating UI responses based on model outputs."""
 
-    def __init__(self, model):
-        super().__init__(model)
-        self.system_prompt = self.config["ui_prompt"]
+    def timed_out(self, error: Exception, span: Span) -> None:
+        """Records a call that missed its deadline."""
+        logger.warning("%s timed out: %s", type(self).__name__, error)
+        span.record_error(error)
+        self.counters["timeouts"] += 1
+        span.status = "timeout"
+        return None
+
+    def should_retry(self, attempt: int, retries: int, error: ValueError, span: Span) -> bool:
+        """Records a validation failure and decides whether the model should be called again."""
+        logger.warning("%s validation error on attempt %d of %d: %s", type(self).__name__, attempt + 1, retries, error)
+        span.record_error(error)
+        span.validation_failures += 1
+        if attempt == retries - 1:
+            self.counters["failed"] += 1
+            return False
+        self.counters["retried"] += 1
+        span.retries += 1
+        return True
+
+
+class QuestioningAgent(ParsingAgent):
+    """Agent for generating responses based on a list of properties."""
 
-    def __call__(self, message) -> str:
-        parser = PydanticOutputParser(pydantic_object=Output)
+    pydantic_object = QuestionAnswer
+    prompt_key = "questioning_prompt"
+    template = ("{system_prompt}\n{persona}\n{format_instructions}\n"
+                "The Properties you need to create a question for: {properties}")
+    compactable = ("persona",)
 
-        prompt = PromptTemplate(
-            template="{system_prompt}\n{format_instructions}\n{message}",
-            input_variables=["message"],
-            partial_variables={"system_prompt": self.system_prompt,
-                               "format_instructions": parser.get_format_instructions()},
-        )
+    def __call__(self, properties: List[str], persona: str) -> dict:
+        return self.invoke({"properties": ", ".join(properties), "persona": persona})
 
-        chain = (
-            prompt
-            | self.model
-            | parser
-        )
+    async def acall(self, properties: List[str], persona: str) -> dict:
+        """Asynchronous counterpart of __call__."""
+        return await self.ainvoke({"properties": ", ".join(properties), "persona": persona})
 
-        handler = DebugHandler()
-        config = {"callbacks": [handler]}
 
-        retries = 3  # Number of retries
-        for attempt in range(retries):
-            try:
-                validated_data = chain.invoke(
-                    input={"message": message}, config=config)
-                return validated_data.dict()
-            except ValidationError as e:
-                print(f"Validation error on attempt {attempt+1}: {e}")
-                if attempt == retries - 1:
-                    return None
-                print("Retrying...")
-            except Exception as e:
-                print(f"Unexpected error: {traceback.format_exc()} - {e}")
-                return None
+class PropertyMatchingAgent(ParsingAgent):
+    """Agent for generating responses based on a question and user's answer."""
+
+    pydantic_object = PropertyRating
+    prompt_key = "property_matching_prompt"
+    template = ("{system_prompt}\nQuestion: {question}\nUser Answer: {user_answer}\n"
+                "Properties: {properties}\n{format_instructions}")
+    compactable = ("user_answer",)
+
+    def __call__(self, question: str, user_answer: str, properties: List[str]) -> dict:
+        return self.invoke({"question": question, "user_answer": user_answer,
+                            "properties": ", ".join(properties)})
+
+    async def acall(self, question: str, user_answer: str, properties: List[str]) -> dict:
+        """Asynchronous counterpart of __call__."""
+        return await self.ainvoke({"question": question, "user_answer": user_answer,
+                                   "properties": ", ".join(properties)})
+
+
+class AnalysingQuestioningAgent(ParsingAgent):
+    """Agent rating the user's answer and generating the next question in a single response."""
+
+    pydantic_object = RatingAndQuestion
+    prompt_key = "analysing_questioning_prompt"
+    template = ("{system_prompt}\nQuestion: {question}\nUser Answer: {user_answer}\n"
+                "Properties: {properties}\n{persona}\n"
+                "The Properties you need to create the next question for: {next_properties}\n"
+                "{format_instructions}")
+    compactable = ("persona", "user_answer")
+
+    def __call__(self, question: str, user_answer: str, properties: List[str],
+                 next_properties: List[str], persona: str) -> dict:
+        return self.invoke(self.inputs(question, user_answer, properties, next_properties, persona))
+
+    async def acall(self, question: str, user_answer: str, properties: List[str],
+                    next_properties: List[str], persona: str) -> dict:
+        """Asynchronous counterpart of __call__."""
+        return await self.ainvoke(self.inputs(question, user_answer, properties, next_properties, persona))
+
+    @staticmethod
+    def inputs(question, user_answer, properties, next_properties, persona) -> dict:
+        """Maps the call arguments to the prompt variables."""
+        return {"question": question, "user_answer": user_answer, "properties": ", ".join(properties),
+                "next_properties": ", ".join(next_properties), "persona": persona}
+
+
+class UIAgent(ParsingAgent):
+    """Agent for generating UI responses based on model outputs."""
+
+    pydantic_object = Output
+    prompt_key = "ui_prompt"
+    template = "{system_prompt}\n{format_instructions}\n{message}"
+    compactable = ("message",)
+
+    def __call__(self, message) -> dict:
+        return self.invoke({"message": message})
+
+    async def acall(self, message) -> dict:
+        """Asynchronous counterpart of __call__."""
+        return await self.ainvoke({"message": message})
@@ -2,10 +2,13 @@ import json
 import random
 from typing import Callable
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from llm_utils.model_registry import get_model_registry
 from llm_utils.agents import PropertyMatchingAgent
+from llm_utils.response_cache import ResponseCache
 from llm_utils.pydantic_models import QuestionAnswer
-from typing import List
+from llm_utils.deadlines import AgentError
+from llm_utils.usage_ledger import degraded_agent, select_agent
+from typing import List, Optional
 
 class Analysing:
     """Initializes questioning agent with specified models and API keys."""
@@ -14,23 +17,43 @@ class Analysing:
             self,
             api_keys: dict,
             model_name_pm="gpt-3.5-turbo-1106",
+            cache: Optional[ResponseCache] = None,
+            model_name_hedge: Optional[str] = None,
             ) -> None:
         """Initialize questioning agent using given API keys and model names."""
         self.api_keys = api_keys
 
         pm_model = self.create_model(model_name_pm, streaming=False)
 
-        self.pm_agent = PropertyMatchingAgent(pm_model)
+        hedge_model = self.create_model(model_name_hedge, streaming=False) if model_name_hedge else None
+
+        self.pm_agent = PropertyMatchingAgent(pm_model, cache, hedge_model)
+
+        # Used once the usage budget is exhausted
+        self.degraded_agent = degraded_agent(
+            lambda model_name: PropertyMatchingAgent(self.create_model(model_name, streaming=False), cache),
+            model_name_pm)
 
 
     def __call__(self, question: str, user_answer: str, properties: List[str]) -> str:
         """Process a list of properties through the questioning agent and generate a QuestionAnswer response."""
-        property_matching = self.pm_agent(question, user_answer, properties)
+        property_matching = select_agent(self.pm_agent, self.degraded_agent)(question, user_answer, properties)
+        if property_matching is None:
+            raise AgentError("The answer could not be analysed.")
 
         question_answer = json.dumps(property_matching)
 
         return question_answer
 
+    async def acall(self, question: str, user_answer: str, properties: List[str]) -> str:
+        """Asynchronous counterpart of __call__."""
+        property_matching = await select_agent(self.pm_agent, self.degraded_agent).acall(
+            question, user_answer, properties)
+        if property_matching is None:
+            raise AgentError("The answer could not be analysed.")
+
+        return json.dumps(property_matching)
+
     def update_agent(self, model_name_qa: str):
         """Update questioning agent with new model."""
         print(f"Updating agent with model {model_name_qa}")
@@ -39,9 +62,5 @@ class Analysing:
         self.questioning_agent.update_model(qa_agent_model)
 
     def create_model(self, model_name: str, streaming=False):
-        """Create a model instance based on model name and streaming capability."""
-        if model_name in ("gpt-3.5-turbo-1106", "gpt-4-turbo-preview"):
-            api_key = self.api_keys["openai"]
-            return ChatOpenAI(openai_api_key=api_key, model_name=model_name, streaming=streaming)
-
-        return None
\ No newline at end of file
+        """Get the shared model instance for a model name and streaming capability."""
+        return get_model_registry().get_model(model_name, self.api_keys, streaming)
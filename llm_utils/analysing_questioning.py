@@ -0,0 +1,64 @@
+"""Defines the AnalysingQuestioning class that rates an answer and asks the next question in one call."""
+import json
+from typing import List, Optional, Tuple
+from llm_utils.model_registry import get_model_registry
+from llm_utils.agents import AnalysingQuestioningAgent
+from llm_utils.response_cache import ResponseCache
+from llm_utils.usage_ledger import degraded_agent, select_agent
+
+
+class AnalysingQuestioning:
+    """Initializes the fused analysing and questioning agent with specified models and API keys."""
+
+    def __init__(
+            self,
+            api_keys: dict,
+            model_name_aq="gpt-3.5-turbo-1106",
+            cache: Optional[ResponseCache] = None,
+            model_name_hedge: Optional[str] = None,
+            ) -> None:
+        """Initialize the fused agent using given API keys and model name."""
+        self.api_keys = api_keys
+
+        aq_model = self.create_model(model_name_aq, streaming=False)
+
+        hedge_model = self.create_model(model_name_hedge, streaming=False) if model_name_hedge else None
+
+        self.aq_agent = AnalysingQuestioningAgent(aq_model, cache, hedge_model)
+
+        # Used once the usage budget is exhausted
+        self.degraded_agent = degraded_agent(
+            lambda model_name: AnalysingQuestioningAgent(self.create_model(model_name, streaming=False), cache),
+            model_name_aq)
+
+    def __call__(self, question: str, user_answer: str, properties: List[str],
+                 next_properties: List[str], persona: str) -> Optional[Tuple[str, str]]:
+        """Rate the answer for the properties and create the next question, as (PropertyRating, QuestionAnswer) JSON."""
+        agent = select_agent(self.aq_agent, self.degraded_agent)
+        response = agent(question, user_answer, properties, next_properties, persona)
+        return self.split_response(response)
+
+    async def acall(self, question: str, user_answer: str, properties: List[str],
+                    next_properties: List[str], persona: str) -> Optional[Tuple[str, str]]:
+        """Asynchronous counterpart of __call__."""
+        agent = select_agent(self.aq_agent, self.degraded_agent)
+        response = await agent.acall(question, user_answer, properties, next_properties, persona)
+        return self.split_response(response)
+
+    @staticmethod
+    def split_response(response: Optional[dict]) -> Optional[Tuple[str, str]]:
+        """Split the fused response into the analysis and question JSON strings."""
+        if response is None:
+            return None
+        return json.dumps(response["rating"]), json.dumps(response["next_question"])
+
+    def update_agent(self, model_name_aq: str):
+        """Update the fused agent with a new model."""
+        print(f"Updating agent with model {model_name_aq}")
+        aq_agent_model = self.create_model(model_name=model_name_aq, streaming=False)
+
+        self.aq_agent.update_model(aq_agent_model)
+
+    def create_model(self, model_name: str, streaming=False):
+        """Get the shared model instance for a model name and streaming capability."""
+        return get_model_registry().get_model(model_name, self.api_keys, streaming)
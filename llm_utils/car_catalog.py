@@ -0,0 +1,272 @@
+"""Car catalog loading, compilation and caching for persona matching."""
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy
+
+
+PROPERTY_NAMES = [
+    "Aged",
+    "Male",
+    "Wealthy",
+    "Urban Living",
+    "Comfort",
+    "Information Needs",
+    "Convenience",
+    "Car Dependence",
+    "Price Sensitivity",
+    "Brand Loyalty",
+    "Has Kids",
+    "Digital Features",
+    "Sustainability",
+    "Drive Range",
+]
+
+DEFAULT_CATALOG_FILE = "configs/cars.json"
+DEFAULT_CACHE_DIR = ".catalog_cache"
+CACHE_FORMAT_VERSION = "1"
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+class CarCatalog:
+    """Precompiled car catalog holding a (cars x properties) matrix and a weight vector."""
+
+    def __init__(
+            self,
+            codes: Sequence[str],
+            vectors,
+            weights,
+            full_names: Optional[Sequence[str]] = None,
+            metadata: Optional[Dict[str, numpy.ndarray]] = None,
+            scaled_matrix: Optional[numpy.ndarray] = None,
+            scaled_sq_norms: Optional[numpy.ndarray] = None):
+        self.codes = numpy.asarray(codes)
+        self.matrix = numpy.asarray(vectors, dtype=numpy.float64)
+        self.weights = numpy.asarray(weights, dtype=numpy.float64)
+        self.names = numpy.asarray(full_names if full_names is not None else [""] * len(self.codes))
+        self.metadata = dict(metadata or {})
+
+        if self.matrix.ndim != 2 or self.matrix.shape[0] != len(self.codes):
+            raise ValueError("Catalog matrix must have one row per car code")
+        if self.weights.shape != (self.matrix.shape[1],):
+            raise ValueError("Weight vector must have one entry per property")
+
+        # Weighted Euclidean distance equals the plain distance on pre-scaled vectors.
+        if scaled_matrix is None:
+            scaled_matrix = self.matrix * self.weights
+        if scaled_sq_norms is None:
+            scaled_sq_norms = numpy.einsum("ij,ij->i", scaled_matrix, scaled_matrix)
+        self.scaled_matrix = scaled_matrix
+        self.scaled_sq_norms = scaled_sq_norms
+
+        self._full_names = None
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def distances(self, personas) -> numpy.ndarray:
+        """Returns the weighted distances of one persona (n,) or many personas (m, n) to every car."""
+        scaled = numpy.asarray(personas, dtype=numpy.float64) * self.weights
+        if scaled.ndim == 1:
+            sq_dist = self.scaled_sq_norms - 2.0 * (self.scaled_matrix @ scaled) + scaled @ scaled
+        else:
+            sq_dist = (self.scaled_sq_norms[None, :]
+                       - 2.0 * (scaled @ self.scaled_matrix.T)
+                       + numpy.einsum("ij,ij->i", scaled, scaled)[:, None])
+        return numpy.sqrt(numpy.maximum(sq_dist, 0.0))
+
+    def top_k(self, persona, k: int = 3, where: Optional[dict] = None) -> List[Tuple[float, str]]:
+        """Returns the k closest cars to a persona as (distance, car_code) tuples, closest first."""
+        distances = self.distances(persona)
+        if where:
+            mask = self.filter_mask(where)
+            distances = numpy.where(mask, distances, numpy.inf)
+            k = min(k, int(mask.sum()))
+        indices = _smallest_k(distances[None, :], k)[0]
+        return [(float(distances[i]), str(self.codes[i])) for i in indices]
+
+    def top_k_batch(self, personas_matrix, k: int = 3, where: Optional[dict] = None) -> List[List[Tuple[float, str]]]:
+        """Returns the top-k matches for every persona in a matrix, scoring all of them at once."""
+        distances = self.distances(numpy.atleast_2d(personas_matrix))
+        if where:
+            mask = self.filter_mask(where)
+            distances = numpy.where(mask[None, :], distances, numpy.inf)
+            k = min(k, int(mask.sum()))
+        indices = _smallest_k(distances, k)
+        top_distances = numpy.take_along_axis(distances, indices, axis=1)
+        return [[(float(distance), str(code)) for distance, code in zip(row, self.codes[row_indices])]
+                for row, row_indices in zip(top_distances, indices)]
+
+    def filter_mask(self, where: dict) -> numpy.ndarray:
+        """
+        Returns a boolean mask of the cars matching all metadata conditions.
+
+        A condition is either a single value (equality), a (low, high) tuple on a numeric
+        column (inclusive range, None for an open bound) or a list/set of allowed values.
+        """
+        mask = numpy.ones(len(self), dtype=bool)
+        for column, condition in where.items():
+            if column not in self.metadata:
+                raise KeyError(f"Unknown catalog metadata column: {column}")
+            values = self.metadata[column]
+            if isinstance(condition, tuple) and len(condition) == 2 and values.dtype.kind == "f":
+                low, high = condition
+                if low is not None:
+                    mask &= values >= low
+                if high is not None:
+                    mask &= values <= high
+            elif isinstance(condition, (list, tuple, set, frozenset)):
+                mask &= numpy.isin(values, list(condition))
+            else:
+                mask &= values == condition
+        return mask
+
+    def get_full_name(self, car_code: str) -> str:
+        """Returns the display name of a car code."""
+        if self._full_names is None:
+            self._full_names = dict(zip(self.codes.tolist(), self.names.tolist()))
+        return self._full_names.get(car_code) or "Unknown car model"
+
+
+def _smallest_k(distances: numpy.ndarray, k: int) -> numpy.ndarray:
+    """Returns the row-wise indices of the k smallest distances, sorted ascending."""
+    k = max(min(k, distances.shape[1]), 0)
+    if k < distances.shape[1]:
+        candidates = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = numpy.broadcast_to(numpy.arange(k), (distances.shape[0], k))
+    order = numpy.argsort(numpy.take_along_axis(distances, candidates, axis=1), axis=1, kind="stable")
+    return numpy.take_along_axis(candidates, order, axis=1)
+
+
+def load_catalog(catalog_file=DEFAULT_CATALOG_FILE, weights: Optional[dict] = None,
+                 cache_dir=DEFAULT_CACHE_DIR) -> CarCatalog:
+    """
+    Load a car catalog from a JSON or CSV file, using the compiled on-disk cache when possible.
+
+    The catalog is compiled into .npy arrays in a directory keyed by the hash of the
+    source file, which are memory-mapped on load so that workers share the pages.
+    """
+    catalog_path = ROOT_DIR / catalog_file
+    if cache_dir is None:
+        return _compile_catalog(catalog_path, weights)
+
+    entry_dir = ROOT_DIR / cache_dir / _catalog_key(catalog_path, weights)
+    if not entry_dir.is_dir():
+        catalog = _compile_catalog(catalog_path, weights)
+        _write_cache(catalog, entry_dir)
+    return _read_cache(entry_dir)
+
+
+def _catalog_key(catalog_path: Path, weights: Optional[dict]) -> str:
+    """Hash the catalog file contents and weight overrides into a cache key."""
+    digest = hashlib.sha256(CACHE_FORMAT_VERSION.encode())
+    with catalog_path.open("rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    if weights is not None:
+        digest.update(json.dumps(weights, sort_keys=True).encode())
+    return digest.hexdigest()[:32]
+
+
+def _compile_catalog(catalog_path: Path, weights: Optional[dict]) -> CarCatalog:
+    """Parse a catalog file into a CarCatalog."""
+    if catalog_path.suffix.lower() == ".csv":
+        rows, file_weights = _read_csv_rows(catalog_path), None
+    else:
+        rows, file_weights = _read_json_rows(catalog_path)
+
+    weights = weights or file_weights or _default_weights()
+    weight_vector = [float(weights[name]) for name in PROPERTY_NAMES]
+
+    codes, names, vectors = [], [], []
+    for row in rows:
+        codes.append(str(row["code"]))
+        names.append(str(row.get("name", "")))
+        try:
+            vectors.append([float(row[name]) for name in PROPERTY_NAMES])
+        except KeyError as e:
+            raise ValueError(f"Car {codes[-1]} in {catalog_path} is missing property {e}") from e
+
+    reserved = set(PROPERTY_NAMES) | {"code", "name"}
+    columns = [column for column in dict.fromkeys(key for row in rows for key in row) if column not in reserved]
+    metadata = {column: _metadata_array([row.get(column) for row in rows]) for column in columns}
+
+    return CarCatalog(
+        codes, numpy.array(vectors, dtype=numpy.float64).reshape(-1, len(PROPERTY_NAMES)),
+        weight_vector, names, metadata)
+
+
+def _read_json_rows(catalog_path: Path):
+    """Read a JSON catalog of the form {"weights": {...}, "cars": [{"code", "name", "properties"}]}."""
+    with catalog_path.open("r", encoding="utf-8") as file:
+        data = json.load(file)
+    rows = []
+    for car in data["cars"]:
+        row = {key: value for key, value in car.items() if key != "properties"}
+        row.update(car.get("properties", {}))
+        rows.append(row)
+    return rows, data.get("weights")
+
+
+def _read_csv_rows(catalog_path: Path):
+    """Read a CSV catalog with code, name and one column per property."""
+    with catalog_path.open("r", encoding="utf-8", newline="") as file:
+        return list(csv.DictReader(file))
+
+
+def _default_weights() -> dict:
+    """Return the weights of the bundled catalog."""
+    _, weights = _read_json_rows(ROOT_DIR / DEFAULT_CATALOG_FILE)
+    return weights
+
+
+def _metadata_array(values: list) -> numpy.ndarray:
+    """Convert a metadata column to a numeric array if possible, else to a string array."""
+    try:
+        return numpy.array([numpy.nan if value in (None, "") else float(value) for value in values])
+    except (TypeError, ValueError):
+        return numpy.array(["" if value is None else str(value) for value in values])
+
+
+def _write_cache(catalog: CarCatalog, entry_dir: Path):
+    """Write the compiled catalog arrays to a cache directory atomically."""
+    entry_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=entry_dir.parent, prefix=".tmp-"))
+    try:
+        numpy.save(tmp_dir / "matrix.npy", catalog.matrix)
+        numpy.save(tmp_dir / "weights.npy", catalog.weights)
+        numpy.save(tmp_dir / "scaled_matrix.npy", catalog.scaled_matrix)
+        numpy.save(tmp_dir / "scaled_sq_norms.npy", catalog.scaled_sq_norms)
+        numpy.save(tmp_dir / "codes.npy", catalog.codes)
+        numpy.save(tmp_dir / "names.npy", catalog.names)
+        for index, (column, values) in enumerate(catalog.metadata.items()):
+            numpy.save(tmp_dir / f"meta_{index}.npy", values)
+        with (tmp_dir / "metadata.json").open("w", encoding="utf-8") as file:
+            json.dump(list(catalog.metadata), file)
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # Another worker compiled the same catalog first.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not entry_dir.is_dir():
+            raise
+
+
+def _read_cache(entry_dir: Path) -> CarCatalog:
+    """Memory-map a compiled catalog from its cache directory."""
+    def load(name):
+        return numpy.load(entry_dir / name, mmap_mode="r")
+
+    with (entry_dir / "metadata.json").open("r", encoding="utf-8") as file:
+        columns = json.load(file)
+
+    return CarCatalog(
+        load("codes.npy"), load("matrix.npy"), load("weights.npy"), load("names.npy"),
+        {column: load(f"meta_{index}.npy") for index, column in enumerate(columns)},
+        scaled_matrix=load("scaled_matrix.npy"), scaled_sq_norms=load("scaled_sq_norms.npy"))
@@ -1,25 +1,208 @@
-"""module to load few-shot examples and configuration files."""
+"""module to load few-shot examples and configuration files.
+
+The config and the few-shot files are parsed and validated once per process into
+frozen models that all sessions share. Every file is checked for changes at most once
+per `CHECK_INTERVAL` seconds and parsed again only when its mtime changed, so edits,
+e.g. to the prompts, are picked up without a restart.
+"""
 import json
+import threading
+import time
 from pathlib import Path
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar, Union
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+
+DEFAULT_CONFIG_FILE = "configs/config.json"
+CHECK_INTERVAL = 1.0  # Seconds between checks of a file's mtime
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+T = TypeVar("T")
+
+
+class ConfigError(ValueError):
+    """Raised when a config or few-shot file is missing, not valid JSON or does not match its schema."""
+
+
+class FrozenModel(BaseModel):
+    """Base of the config models, which are shared read-only across sessions."""
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+
+class MemoryConfig(FrozenModel):
+    """Conversational memory kept in the prompt."""
+    window: int = Field(4, ge=0, description="Most recent turns kept verbatim")
+    summary_tokens: int = Field(40, ge=0, description="Tokens per compacted older turn")
+    max_turns: int = Field(50, ge=0, description="Turns kept at most, also without a prompt budget")
+
+
+class HedgingConfig(FrozenModel):
+    """Second requests sent when the first one is slow."""
+    enabled: bool = False
+    percentile: float = Field(90, gt=0, lt=100)
+    min_samples: int = Field(20, ge=1)
+
+
+class InstrumentationConfig(FrozenModel):
+    """Export of the agent call spans."""
+    spans_file: Optional[str] = None
+
+
+class UsageConfig(FrozenModel):
+    """Prices, budgets and the fallback model of the usage ledger."""
+    ledger_file: Optional[str] = ".usage.sqlite3"
+    prices_per_1k_tokens: Dict[str, Tuple[float, float]] = Field(
+        default_factory=dict, description="USD per 1000 prompt and completion tokens by model name")
+    session_budget_usd: Optional[float] = Field(None, ge=0)
+    process_budget_usd: Optional[float] = Field(None, ge=0)
+    degraded_model: Optional[str] = None
+    max_tracked: int = Field(10000, ge=1, description="Sessions and clients kept in memory, least recently charged dropped first")
+    client_header: Optional[str] = Field(
+        None, description="Header naming the client behind a trusted reverse proxy, e.g. X-Forwarded-For")
+
+
+class AppConfig(FrozenModel):
+    """The main configuration file."""
+    conversational_prompt: str
+    ui_prompt: str
+    questioning_prompt: str
+    analysing_questioning_prompt: str
+    property_matching_prompt: str
+    structured_output: bool = False
+    deadlines: Dict[str, float] = Field(default_factory=dict, description="Seconds per agent call by agent")
+    prompt_budgets: Dict[str, int] = Field(default_factory=dict, description="Maximum prompt tokens by agent")
+    memory: MemoryConfig = MemoryConfig()
+    hedging: HedgingConfig = HedgingConfig()
+    instrumentation: InstrumentationConfig = InstrumentationConfig()
+    usage: UsageConfig = UsageConfig()
+    properties: List[List[str]] = Field(default_factory=list)
+
+
+class FewShotExample(FrozenModel):
+    """One example input with its expected output."""
+    input: str
+    output: Union[str, dict]
+
+
+class ConfigFile(Generic[T]):
+    """A parsed file that is shared by all callers and parsed again when its mtime changes."""
+
+    def __init__(self, path: Path, parse: Callable[[Path], T], check_interval: float = CHECK_INTERVAL):
+        self.path = path
+        self.parse = parse
+        self.check_interval = check_interval
+        self.version = 0  # Incremented on every successful parse
+        self._value: Optional[T] = None
+        self._mtime: Optional[int] = None  # Of the version in use
+        self._failed_mtime: Optional[int] = None  # Of the last edit that did not parse
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        """Returns the parsed file, reloading it first if it changed since the last check."""
+        if self._value is not None and time.monotonic() - self._checked < self.check_interval:
+            return self._value
+        with self._lock:
+            if self._value is None or time.monotonic() - self._checked >= self.check_interval:
+                self._reload()
+        return self._value
+
+    def _reload(self):
+        self._checked = time.monotonic()
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError as e:
+            if self._value is None:
+                raise ConfigError(f"File {self.path} not found.") from e
+            print(f"File {self.path} not found, keeping the loaded version.")
+            return
+        if mtime in (self._mtime, self._failed_mtime):
+            return
+        try:
+            value = self.parse(self.path)
+        except ConfigError as e:
+            if self._value is None:
+                raise
+            # A broken edit is reported once and does not replace the version in use
+            self._failed_mtime = mtime
+            print(f"{e} Keeping the loaded version.")
+            return
+        self._value = value
+        self._mtime = mtime
+        self.version += 1
+
+
+def load_json(path: Path):
+    """
+    Load JSON data from a given file path.
+    """
+    try:
+        with path.open("r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError as e:
+        raise ConfigError(f"File {path} not found.") from e
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"Error decoding JSON file {path}: {e}") from e
+
+
+def parse_config(path: Path) -> AppConfig:
+    """Parses and validates the main configuration file."""
+    try:
+        return AppConfig.model_validate(load_json(path))
+    except ValidationError as e:
+        raise ConfigError(f"Invalid config file {path}: {e}") from e
+
+
+def parse_few_shot_examples(path: Path) -> Tuple[FewShotExample, ...]:
+    """Parses and validates a file with a list of few-shot examples."""
+    examples = load_json(path)
+    if not isinstance(examples, list):
+        raise ConfigError(f"Few-shot file {path} must contain a list of examples.")
+    try:
+        return tuple(FewShotExample.model_validate(example) for example in examples)
+    except ValidationError as e:
+        raise ConfigError(f"Invalid few-shot file {path}: {e}") from e
+
+
+_files: Dict[Tuple[str, Callable], ConfigFile] = {}
+_files_lock = threading.Lock()
+
+
+def get_config_file(file_name: str, parse: Callable[[Path], T]) -> ConfigFile[T]:
+    """Returns the process-wide handle of a file relative to the repository root."""
+    key = (file_name, parse)
+    config_file = _files.get(key)
+    if config_file is None:
+        with _files_lock:
+            config_file = _files.get(key)
+            if config_file is None:
+                config_file = _files[key] = ConfigFile(ROOT_DIR / file_name, parse)
+    return config_file
+
+
+def get_config(config_file: str = DEFAULT_CONFIG_FILE) -> AppConfig:
+    """Returns the current main configuration."""
+    return get_config_file(config_file, parse_config).get()
+
+
+def get_few_shot_examples(examples_file: str) -> Tuple[FewShotExample, ...]:
+    """Returns the current few-shot examples of a file."""
+    return get_config_file(examples_file, parse_few_shot_examples).get()
 
 
 def load_few_shot_examples(examples_file):
     """
     Load few-shot examples from the specified JSON file and process them.
     """
-    examples_path = Path(__file__).parent.parent / examples_file
-    examples = load_json(examples_path)
-    return examples
+    return [example.model_dump() for example in get_few_shot_examples(examples_file)]
 
 
 def load_few_shot_json_examples(examples_file):
     """
     Load few-shot examples from the specified JSON file and process them.
     """
-    examples_path = Path(__file__).parent.parent / examples_file
-    examples = load_json(examples_path)
-    processed_examples = process_json_examples(examples)
-    return processed_examples
+    return process_json_examples(load_few_shot_examples(examples_file))
 
 
 def process_json_examples(examples):
@@ -29,27 +212,3 @@ def process_json_examples(examples):
     for item in examples:
         item['output'] = json.dumps(item['output'])
     return examples
-
-
-def load_json(path):
-    """
-    Load JSON data from a given file path.
-    """
-    try:
-        with path.open("r", encoding="utf-8") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        print(f"File {path} not found.")
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON file {path}.")
-    return None
-
-
-def load_config(config_file='configs/config.json'):
-    """
-    Load the main configuration file.
-    """
-    config_path = Path(__file__).resolve().parent.parent / config_file
-
-    config = load_json(config_path)
-    return config
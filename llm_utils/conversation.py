@@ -1,9 +1,15 @@
 """Defines the Conversation class for managing chat interactions using different language models."""
 import json
-from typing import Callable
-from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+import uuid
+from typing import Callable, List
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.outputs import LLMResult
+from llm_utils.model_registry import get_model_registry
 from llm_utils.agents import ConversationalAgent, UIAgent
+from llm_utils.usage_ledger import budget_exceeded
+
+# Presents the matched cars without a model call once the usage budget is exhausted
+BUDGET_RECOMMENDATION = "Based on your answers, these electric Mercedes match you best:\n\n{cars}"
 
 
 class Conversation:
@@ -23,9 +29,30 @@ class Conversation:
 
     def __call__(self, persona: str, cars: str, stream_handler: Callable) -> str:
         """Process a chat message through the conversational agent and generate UI response."""
+        if budget_exceeded():
+            return self.recommend_without_model(cars, stream_handler)
         textual_response = self.conversational_agent(persona, cars, stream_handler)
         return textual_response
 
+    async def acall(self, persona: str, cars: str, stream_handler: Callable) -> str:
+        """Asynchronous counterpart of __call__."""
+        if budget_exceeded():
+            return self.recommend_without_model(cars, stream_handler)
+        return await self.conversational_agent.acall(persona, cars, stream_handler)
+
+    def recommend_without_model(self, cars: str, stream_handler: Callable) -> str:
+        """Stream the templated recommendation of the matched cars through the handler."""
+        response = BUDGET_RECOMMENDATION.format(cars=cars)
+        stream_handler.on_llm_new_token(response)
+        stream_handler.on_llm_end(LLMResult(generations=[]), run_id=uuid.uuid4())
+        self.conversational_agent.remember(response)
+        return response
+
+    def restore_memory(self, responses: List[str]):
+        """Restore the conversational memory from earlier responses, e.g. of a stored session."""
+        self.conversational_agent.memory = [AIMessage(role="assistant", content=response) for response in responses]
+        self.conversational_agent.trim_memory()
+
     def update_agents(self, model_name_conv: str, model_name_ui: str):
         """Update conversational and UI agents with new models."""
         print(
@@ -36,9 +63,5 @@ class Conversation:
         self.conversational_agent.update_model(conv_agent_model)
 
     def create_model(self, model_name: str, streaming=False):
-        """Create a model instance based on model name and streaming capability."""
-        if model_name in ("gpt-3.5-turbo-1106", "gpt-4-turbo-preview"):
-            api_key = self.api_keys["openai"]
-            return ChatOpenAI(openai_api_key=api_key, model_name=model_name, streaming=streaming)
-
-        return None
+        """Get the shared model instance for a model name and streaming capability."""
+        return get_model_registry().get_model(model_name, self.api_keys, streaming)
@@ -0,0 +1,178 @@
+"""Per-call deadlines, hedged requests and latency tracking for agent calls."""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="agent-call")
+# Hedged requests have their own workers, so they do not queue behind the calls they back up
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-hedge")
+
+
+class AgentError(Exception):
+    """Raised when an agent could not produce a valid response."""
+
+
+class AgentTimeoutError(AgentError):
+    """Raised when an agent call did not complete within its deadline."""
+
+
+class LatencyTracker:
+    """Keeps a sliding window of call latencies and reports percentiles."""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def record(self, seconds: float):
+        """Records the latency of a completed call."""
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Returns the latency percentile of the window, or None without samples."""
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self) -> dict:
+        """Returns the p50, p90 and p99 latencies and the sample count."""
+        return {"count": len(self), "p50": self.percentile(50), "p90": self.percentile(90),
+                "p99": self.percentile(99)}
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    """Returns the process-wide latency tracker of an agent."""
+    with _trackers_lock:
+        return _trackers.setdefault(name, LatencyTracker())
+
+
+def latency_summaries() -> Dict[str, dict]:
+    """Returns the latency summary of every tracked agent."""
+    with _trackers_lock:
+        trackers = dict(_trackers)
+    return {name: tracker.summary() for name, tracker in trackers.items()}
+
+
+def submit(executor: ThreadPoolExecutor, call: Callable[[], T]) -> "Future[T]":
+    """Submits a call, running it in the current thread once the executor no longer accepts calls, e.g. at exit."""
+    try:
+        return executor.submit(call)
+    except RuntimeError:
+        future: "Future[T]" = Future()
+        try:
+            future.set_result(call())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def hedged_call(primary: Callable[[], T], backup: Optional[Callable[[], T]] = None,
+                hedge_after: Optional[float] = None, deadline: Optional[float] = None,
+                on_hedge: Optional[Callable[[], None]] = None) -> T:
+    """
+    Runs `primary` with an optional deadline and hedge.
+
+    If the primary call has not completed after `hedge_after` seconds, `backup` is
+    started as well and the first call that returns without raising wins. Raises
+    AgentTimeoutError once the deadline passes, counted from this call and so including
+    the time a call waits for a worker, and re-raises the last error when every started
+    call failed. `on_hedge` is called when the backup is started.
+
+    A thread can not be stopped: a losing call that already started runs to completion
+    in the background, and its tokens are charged. Only calls still waiting for a worker
+    are cancelled. Use ahedged_call to cancel the losing request.
+    """
+    start = time.monotonic()
+    pending = {submit(_executor, primary)}
+    hedged = backup is None or hedge_after is None
+    error: Optional[BaseException] = None
+
+    while True:
+        elapsed = time.monotonic() - start
+        timeouts = []
+        if not hedged:
+            timeouts.append(max(0.0, hedge_after - elapsed))
+        if deadline is not None:
+            timeouts.append(max(0.0, deadline - elapsed))
+
+        done, pending = wait(pending, timeout=min(timeouts) if timeouts else None,
+                             return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            for other in pending:
+                other.cancel()
+            return result
+
+        elapsed = time.monotonic() - start
+        if deadline is not None and elapsed >= deadline:
+            for other in pending:
+                other.cancel()
+            raise AgentTimeoutError(f"No response within {deadline:.1f}s")
+        if not hedged and elapsed >= hedge_after:
+            pending.add(submit(_hedge_executor, backup))
+            hedged = True
+            if on_hedge is not None:
+                on_hedge()
+        elif not pending:
+            raise error
+
+
+async def ahedged_call(primary: Callable[[], Awaitable[T]], backup: Optional[Callable[[], Awaitable[T]]] = None,
+                       hedge_after: Optional[float] = None, deadline: Optional[float] = None,
+                on_hedge: Optional[Callable[[], None]] = None) -> T:
+    """Asynchronous counterpart of hedged_call; the losing call is cancelled."""
+    start = time.monotonic()
+    pending = {asyncio.ensure_future(primary())}
+    hedged = backup is None or hedge_after is None
+    error: Optional[BaseException] = None
+
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            timeouts = []
+            if not hedged:
+                timeouts.append(max(0.0, hedge_after - elapsed))
+            if deadline is not None:
+                timeouts.append(max(0.0, deadline - elapsed))
+
+            done, pending = await asyncio.wait(pending, timeout=min(timeouts) if timeouts else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                return task.result()
+
+            elapsed = time.monotonic() - start
+            if deadline is not None and elapsed >= deadline:
+                raise AgentTimeoutError(f"No response within {deadline:.1f}s")
+            if not hedged and elapsed >= hedge_after:
+                pending.add(asyncio.ensure_future(backup()))
+                hedged = True
+                if on_hedge is not None:
+                    on_hedge()
+            elif not pending:
+                raise error
+    finally:
+        for task in pending:
+            task.cancel()
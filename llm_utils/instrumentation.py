@@ -0,0 +1,343 @@
+"""Per-call instrumentation of the agents: spans, Prometheus metrics and a JSONL span log."""
+import atexit
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from llm_utils.config_loader import get_config
+from llm_utils.token_budget import count_tokens
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+_session_id: ContextVar[Optional[str]] = ContextVar("session_id", default=None)
+_client_id: ContextVar[Optional[str]] = ContextVar("client_id", default=None)
+_span_ids = itertools.count(1)
+
+
+@contextmanager
+def session_context(session_id: Optional[str]) -> Iterator[None]:
+    """Tags the spans of agent calls made within the block with a session id."""
+    token = _session_id.set(session_id)
+    try:
+        yield
+    finally:
+        _session_id.reset(token)
+
+
+def current_session() -> Optional[str]:
+    """Returns the session id of the current context, if any."""
+    return _session_id.get()
+
+
+@contextmanager
+def client_context(client_id: Optional[str]) -> Iterator[None]:
+    """Tags the spans of agent calls made within the block with the client making them, e.g. a browser tab."""
+    token = _client_id.set(client_id)
+    try:
+        yield
+    finally:
+        _client_id.reset(token)
+
+
+def current_client() -> Optional[str]:
+    """Returns the client of the current context, falling back to the session for calls without one."""
+    return _client_id.get() or _session_id.get()
+
+
+class Span:
+    """One agent call with its model calls, tokens, retries and outcome."""
+    __slots__ = ("span_id", "agent", "model", "session", "client", "start", "started", "duration", "ttft",
+                 "prompt_tokens", "completion_tokens", "llm_calls", "llm_errors", "retries",
+                 "validation_failures", "cache_hit", "status", "error", "_lock")
+
+    def __init__(self, agent: str, model: str, session: Optional[str] = None, client: Optional[str] = None):
+        self.span_id = f"{os.getpid():x}-{next(_span_ids):x}"
+        self.agent = agent
+        self.model = model
+        self.session = session
+        self.client = client
+        self.start = time.time()
+        self.started = time.monotonic()
+        self.duration: Optional[float] = None
+        self.ttft: Optional[float] = None  # Seconds from the start of the call to the first token
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_calls = 0
+        self.llm_errors = 0
+        self.retries = 0
+        self.validation_failures = 0
+        self.cache_hit = False
+        self.status = "ok"
+        self.error: Optional[str] = None  # The last error of the call, as "ExceptionType: message"
+        self._lock = threading.Lock()
+
+    def first_token(self):
+        """Records the time to the first token unless an earlier model call delivered one."""
+        elapsed = time.monotonic() - self.started
+        with self._lock:
+            if self.ttft is None:
+                self.ttft = elapsed
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        """Adds the tokens of one model call."""
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def llm_error(self):
+        """Counts a model call that raised an error."""
+        with self._lock:
+            self.llm_errors += 1
+
+    def record_error(self, error: BaseException):
+        """Records an error of the call, replacing an earlier one."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self, status: Optional[str] = None):
+        """Ends the span, keeping an outcome recorded earlier unless a new one is given."""
+        self.duration = time.monotonic() - self.started
+        if status is not None:
+            self.status = status
+
+    def to_dict(self) -> dict:
+        return {"span_id": self.span_id, "agent": self.agent, "model": self.model, "session": self.session,
+                "client": self.client, "start": round(self.start, 6), "duration": self.duration, "ttft": self.ttft,
+                "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+                "llm_calls": self.llm_calls, "llm_errors": self.llm_errors, "retries": self.retries,
+                "validation_failures": self.validation_failures, "cache_hit": self.cache_hit,
+                "status": self.status, "error": self.error}
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """
+    Records the model calls of an agent call into its span.
+
+    Streamed calls set the time to first token on their first token; for calls without
+    streaming it is the time until the first completion arrived. Token counts come from
+    the provider's usage report and are estimated with the tokenizer when it is missing.
+    """
+
+    run_inline = True  # Timestamps are taken when the events happen, not when a worker gets to them
+
+    def __init__(self, span: Span):
+        self.span = span
+        self.prompt_tokens: Dict[Any, int] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id=None, **kwargs: Any) -> None:
+        self.prompt_tokens[run_id] = sum(count_tokens(prompt, self.span.model) for prompt in prompts)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id=None, **kwargs: Any) -> None:
+        self.prompt_tokens[run_id] = sum(count_tokens(str(message.content), self.span.model)
+                                         for batch in messages for message in batch)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.span.first_token()
+
+    def on_llm_end(self, response: LLMResult, *, run_id=None, **kwargs: Any) -> None:
+        self.span.first_token()
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        estimated_prompt_tokens = self.prompt_tokens.pop(run_id, 0)
+        if usage:
+            self.span.add_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+            return
+        completion = "".join(completion_text(generation) for generations in response.generations
+                             for generation in generations)
+        self.span.add_tokens(estimated_prompt_tokens, count_tokens(completion, self.span.model))
+
+    def on_llm_error(self, error: BaseException, *, run_id=None, **kwargs: Any) -> None:
+        self.prompt_tokens.pop(run_id, None)
+        self.span.llm_error()
+
+
+def completion_text(generation) -> str:
+    """Returns the text of a generation, or the arguments of its tool calls."""
+    if generation.text:
+        return generation.text
+    message = getattr(generation, "message", None)
+    tool_calls = getattr(message, "additional_kwargs", {}).get("tool_calls") or []
+    return "".join(call.get("function", {}).get("arguments", "") for call in tool_calls)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram."""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(DURATION_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+METRICS = {
+    "agent_calls_total": ("counter", "Agent calls by outcome."),
+    "agent_llm_calls_total": ("counter", "Model calls made by agent calls, including retries and hedges."),
+    "agent_llm_errors_total": ("counter", "Model calls that raised an error."),
+    "agent_prompt_tokens_total": ("counter", "Prompt tokens sent to the model."),
+    "agent_completion_tokens_total": ("counter", "Completion tokens received from the model."),
+    "agent_retries_total": ("counter", "Repeated model calls after a response failed validation."),
+    "agent_validation_failures_total": ("counter", "Responses that failed validation even after local repair."),
+    "agent_cache_hits_total": ("counter", "Agent calls answered by the response cache."),
+    "agent_call_duration_seconds": ("histogram", "Duration of agent calls."),
+    "agent_time_to_first_token_seconds": ("histogram", "Time from the start of an agent call to its first token."),
+}
+
+
+class Metrics:
+    """
+    Aggregates spans into Prometheus counters and histograms.
+
+    Metrics are labelled by agent and model only; the session is kept on the spans, as a
+    label per session would grow the exposition without bound.
+    """
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, span: Span):
+        """Adds a finished span."""
+        labels = (("agent", span.agent), ("model", span.model))
+        with self._lock:
+            self._add("agent_calls_total", labels + (("status", span.status),), 1)
+            self._add("agent_llm_calls_total", labels, span.llm_calls)
+            self._add("agent_llm_errors_total", labels, span.llm_errors)
+            self._add("agent_prompt_tokens_total", labels, span.prompt_tokens)
+            self._add("agent_completion_tokens_total", labels, span.completion_tokens)
+            self._add("agent_retries_total", labels, span.retries)
+            self._add("agent_validation_failures_total", labels, span.validation_failures)
+            self._add("agent_cache_hits_total", labels, int(span.cache_hit))
+            self._observe("agent_call_duration_seconds", labels, span.duration)
+            if span.ttft is not None:
+                self._observe("agent_time_to_first_token_seconds", labels, span.ttft)
+
+    def _add(self, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def render(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in self.counters.items():
+                        if metric == name:
+                            lines.append(f"{name}{format_labels(labels)} {value:g}")
+                    continue
+                for (metric, labels), histogram in self.histograms.items():
+                    if metric != name:
+                        continue
+                    for bound, count in zip(DURATION_BUCKETS, histogram.counts):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: Labels) -> str:
+    """Formats Prometheus labels, escaping backslashes, quotes and newlines in the values."""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+
+def escape_label(value: Any) -> str:
+    """Escapes a label value for the text exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class SpanLog:
+    """Appends spans as JSON lines from a background thread, so agent calls never wait for the disk."""
+
+    def __init__(self, path: Path, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue: "queue.SimpleQueue[Optional[dict]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="span-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, span: Span):
+        """Queues a finished span for writing."""
+        self._queue.put(span.to_dict())
+
+    def close(self):
+        """Writes the queued spans and stops the writer."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _write(self):
+        with self.path.open("a", encoding="utf-8") as file:
+            while True:
+                try:
+                    record = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    file.flush()
+                    continue
+                if record is None:
+                    file.flush()
+                    return
+                file.write(json.dumps(record) + "\n")
+
+
+class Instrumentation:
+    """Collects finished spans into the metrics and, if configured, the span log."""
+
+    def __init__(self, span_log: Optional[SpanLog] = None):
+        self.metrics = Metrics()
+        self.span_log = span_log
+
+    def start_span(self, agent: str, model: str) -> Span:
+        """Starts the span of an agent call in the current session."""
+        return Span(agent, model, current_session(), current_client())
+
+    def record(self, span: Span, status: Optional[str] = None):
+        """Finishes a span and exports it."""
+        span.finish(status)
+        self.metrics.observe(span)
+        if self.span_log is not None:
+            self.span_log.append(span)
+
+
+_default_instrumentation: Optional[Instrumentation] = None
+_default_instrumentation_lock = threading.Lock()
+
+
+def get_instrumentation() -> Instrumentation:
+    """Returns the process-wide instrumentation, logging spans to the file set in the config."""
+    global _default_instrumentation
+    with _default_instrumentation_lock:
+        if _default_instrumentation is None:
+            spans_file = get_config().instrumentation.spans_file
+            _default_instrumentation = Instrumentation(SpanLog(ROOT_DIR / spans_file) if spans_file else None)
+    return _default_instrumentation
@@ -0,0 +1,189 @@
+"""Local repair of malformed JSON completions and coercion to the pydantic schemas.
+
+A completion cut off mid-way, e.g. by the token limit, is repaired by dropping its
+incomplete last member and closing the brackets; list items that lost required fields
+are dropped as long as a complete item remains. Required fields that are missing
+altogether are not invented, so such completions still fail and the model is called again.
+"""
+import json
+import re
+import typing
+from typing import Any, List, Type
+from annotated_types import Ge, Gt, Le, Lt
+from pydantic import BaseModel
+
+
+CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)\s*```", re.DOTALL)
+NUMBER = re.compile(r"^\s*-?\d+(\.\d+)?\s*$")
+CLOSERS = {"{": "}", "[": "]"}
+MAX_CUTS = 8  # Incomplete trailing members dropped at most
+
+
+def strip_code_fences(text: str) -> str:
+    """Returns the content of the first fenced code block, or the text unchanged."""
+    match = CODE_FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def extract_json(text: str) -> str:
+    """Cuts away prose before the first opening bracket."""
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    return text[min(starts):] if starts else text
+
+
+def remove_trailing_commas(text: str) -> str:
+    """Removes commas directly before a closing bracket, outside of strings."""
+    output = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            in_string = not (char == '"' and not escaped)
+            escaped = char == "\\" and not escaped
+        elif char == '"':
+            in_string = True
+        elif char in "}]":
+            while output and output[-1].isspace():
+                output.pop()
+            if output and output[-1] == ",":
+                output.pop()
+        output.append(char)
+    return "".join(output)
+
+
+def balance_brackets(text: str) -> str:
+    """Drops an unterminated string, closes unbalanced brackets and drops surplus closers."""
+    output = []
+    stack = []
+    in_string = escaped = False
+    string_start = 0
+    for char in text:
+        if in_string:
+            in_string = not (char == '"' and not escaped)
+            escaped = char == "\\" and not escaped
+        elif char == '"':
+            in_string = True
+            string_start = len(output)
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+        elif char in "}]":
+            if not stack or stack[-1] != char:
+                continue
+            stack.pop()
+        output.append(char)
+        if not stack and not in_string and output and output[-1] in "}]":
+            break
+
+    # A string cut off mid-way would be taken for a complete value
+    repaired = "".join(output[:string_start] if in_string else output)
+    return remove_trailing_commas(repaired.rstrip().rstrip(",") + "".join(reversed(stack)))
+
+
+def member_ends(text: str) -> List[int]:
+    """Returns the positions after the complete members of a truncated text, the last one first."""
+    ends = []
+    depth = 0
+    in_string = escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            in_string = not (char == '"' and not escaped)
+            escaped = char == "\\" and not escaped
+        elif char == '"':
+            in_string = True
+        elif char in CLOSERS:
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            ends.append(index + 1)
+        elif char == "," and depth > 0:
+            ends.append(index)
+    return ends[::-1][:MAX_CUTS]
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parses a model completion as JSON, repairing common defects.
+
+    Raises ValueError if the text cannot be repaired.
+    """
+    candidate = extract_json(strip_code_fences(text.strip()))
+    for repair in (lambda t: t, remove_trailing_commas, balance_brackets):
+        try:
+            return json.loads(repair(candidate))
+        except json.JSONDecodeError:
+            continue
+    # Truncated: drops the incomplete members from the end until the rest parses
+    for end in member_ends(candidate):
+        try:
+            return json.loads(balance_brackets(candidate[:end]))
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Completion is not repairable JSON")
+
+
+def coerce_to_schema(data: Any, annotation: Any) -> Any:
+    """
+    Coerces parsed JSON towards a type annotation or pydantic model.
+
+    Numeric strings become numbers for numeric fields and values of fields with
+    ge/le bounds are clamped into range. Anything else is left for pydantic to judge.
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        if not isinstance(data, dict):
+            return data
+        coerced = dict(data)
+        for name, field in annotation.model_fields.items():
+            if name in coerced:
+                value = coerce_to_schema(coerced[name], field.annotation)
+                coerced[name] = _clamp(value, field.metadata)
+        return coerced
+
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Annotated:
+        return _clamp(coerce_to_schema(data, args[0]), args[1:])
+    if origin in (list, typing.List) and isinstance(data, list) and args:
+        items = [coerce_to_schema(item, args[0]) for item in data]
+        complete = [item for item in items if _has_required_fields(item, args[0])]
+        # Items cut off by truncation are dropped, unless that would leave none
+        return complete if complete else items
+    if origin is typing.Union:
+        for option in args:
+            if isinstance(option, type) and issubclass(option, BaseModel) and isinstance(data, dict):
+                if set(data) >= {name for name, field in option.model_fields.items() if field.is_required()}:
+                    return coerce_to_schema(data, option)
+        return data
+
+    if annotation in (int, float) and isinstance(data, str) and NUMBER.match(data):
+        number = float(data)
+        return int(round(number)) if annotation is int else number
+    if annotation is int and isinstance(data, float):
+        return int(round(data))
+    return data
+
+
+def _has_required_fields(data: Any, annotation: Any) -> bool:
+    """Returns whether a dict has every required field of a pydantic model annotation; other values pass."""
+    if not (isinstance(annotation, type) and issubclass(annotation, BaseModel) and isinstance(data, dict)):
+        return True
+    return all(name in data for name, field in annotation.model_fields.items() if field.is_required())
+
+
+def _clamp(value: Any, metadata) -> Any:
+    """Clamps a number into the bounds given by annotated-types constraints."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return value
+    for constraint in metadata:
+        if isinstance(constraint, (Ge, Gt)):
+            value = max(value, constraint.ge if isinstance(constraint, Ge) else constraint.gt)
+        elif isinstance(constraint, (Le, Lt)):
+            value = min(value, constraint.le if isinstance(constraint, Le) else constraint.lt)
+    return value
+
+
+def repair_and_validate(text: str, model: Type[BaseModel]) -> BaseModel:
+    """
+    Repairs a completion and validates it against a pydantic model.
+
+    Raises ValueError (including pydantic's ValidationError) if repair fails.
+    """
+    return model.model_validate(coerce_to_schema(repair_json(text), model))
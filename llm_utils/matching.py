@@ -1,54 +1,47 @@
-import numpy
+"""Matching of customer personas to the electric car catalog."""
+from typing import Optional
+from llm_utils.car_catalog import CarCatalog, load_catalog
+from llm_utils.spatial_index import IndexedCatalog
 
-def match_car(person):
-    eqa = [3,3,1,4,1,3,3,5,5,3,2,3,3,3]
-    eqb = [3,3,1,4,2,3,3,5,5,3,3,3,3,3]
-    eqel = [4,3,2,3,3,3,3,4,4,3,2,3,3,4]
-    eqes = [4,3,3,2,4,3,3,4,3,3,4,3,3,4]
-    eqsl = [4,4,4,2,4,3,3,3,3,3,1,3,3,5]
-    eqss = [3,3,4,2,4,3,3,4,3,3,3,3,3,5]
-    eqg = [3,3,5,3,2,3,3,1,2,3,2,3,3,2]
-    eqs_may = [5,4,5,3,5,3,3,2,1,3,1,3,3,4]
-    eqv = [2,3,3,3,3,3,3,3,3,3,5,3,3,1]
-    eqt = [2,3,1,5,2,3,3,3,5,3,5,3,3,1]
 
+_default_catalog: Optional[CarCatalog] = None
+_default_index: Optional[IndexedCatalog] = None
 
-    cars = [
-        (numpy.array(eqa), "eqa"),
-        (numpy.array(eqb), "eqb"),
-        (numpy.array(eqel), "eqel"),
-        (numpy.array(eqes), "eqes"),
-        (numpy.array(eqsl), "eqsl"),
-        (numpy.array(eqss), "eqss"),
-        (numpy.array(eqg), "eqg"),
-        (numpy.array(eqs_may), "eqs_may"),
-        (numpy.array(eqv), "eqv"),
-        (numpy.array(eqt), "eqt"),
-        ]
 
-    gewichtung = [1,1,1,1,2,1,1,2,2,1,2,1,1,1]
+def get_catalog() -> CarCatalog:
+    """Returns the process-wide car catalog, loading it on first use."""
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = load_catalog()
+    return _default_catalog
 
-    ret = []
-    for car in cars:
-        delta = numpy.linalg.norm((car[0]-numpy.array(person))*gewichtung)
-        ret.append((delta,car[1]))
 
-    return sorted(ret)
+def get_index() -> IndexedCatalog:
+    """Returns the process-wide KD-tree index over the car catalog, building it on first use."""
+    global _default_index
+    if _default_index is None or _default_index.catalog is not get_catalog():
+        _default_index = IndexedCatalog(get_catalog())
+    return _default_index
 
 
+def reload_catalog() -> CarCatalog:
+    """Reloads the process-wide car catalog, e.g. after the catalog file changed."""
+    global _default_catalog, _default_index
+    _default_catalog = load_catalog()
+    _default_index = None
+    return _default_catalog
+
+
+def match_car(person, k: Optional[int] = None, where: Optional[dict] = None, indexed: bool = False):
+    """
+    Returns cars as (distance, car_code) tuples sorted by their distance to the person.
+
+    Without k all cars are returned. `where` filters on catalog metadata such as
+    body_type or a base_price_eur range, and `indexed` uses the KD-tree backend.
+    """
+    backend = get_index() if indexed else get_catalog()
+    return sorted(backend.top_k(person, len(backend) if k is None else k, where))
+
 
 def get_full_name(car_code):
-    cars_full_names = {
-        "eqa": "Mercedes-Benz EQA (Compact SUV)",
-        "eqb": "Mercedes-Benz EQB (Compact SUV)",
-        "eqel": "Mercedes-Benz EQE (Electric Sedan)",
-        "eqes": "Mercedes-Benz EQE SUV (Electric SUV)",
-        "eqsl": "Mercedes-Benz EQS Sedan (High-End Luxury Electric Sedan)",
-        "eqss": "Mercedes-Benz EQS SUV (Luxury Electric SUV)",
-        "eqg": "Mercedes-Benz EQG (Electric Version of G-Class SUV)",
-        "eqs_may": "Mercedes-Benz EQS (Extended Range Version)",
-        "eqv": "Mercedes-Benz EQV (Electric Version of V-Class Van)",
-        "eqt": "Mercedes-Benz EQT (Compact Van)"
-    }
-
-    return cars_full_names.get(car_code, "Unknown car model")
+    return get_catalog().get_full_name(car_code)
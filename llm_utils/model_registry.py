@@ -0,0 +1,157 @@
+"""Process-wide registry of chat model clients sharing pooled HTTP connections."""
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+import httpx
+from langchain_openai import ChatOpenAI
+
+
+SUPPORTED_MODELS = {
+    "openai": ("gpt-3.5-turbo-1106", "gpt-3.5-turbo-0125", "gpt-4-turbo-preview"),
+}
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+logger = logging.getLogger(__name__)
+
+
+def get_provider(model_name: str) -> Optional[str]:
+    """Returns the provider serving a model name, or None if the model is not supported."""
+    for provider, model_names in SUPPORTED_MODELS.items():
+        if model_name in model_names:
+            return provider
+    return None
+
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport keeping one connection pool per event loop.
+
+    Pooled connections belong to the loop that opened them, so a client shared by
+    loops running in different threads, or created one after another by `asyncio.run`,
+    must not hand them across. Pools of closed loops are dropped when a new loop
+    opens its pool.
+    """
+
+    def __init__(self, limits: httpx.Limits):
+        self.limits = limits
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+        self._lock = threading.Lock()
+
+    def transport(self) -> httpx.AsyncHTTPTransport:
+        """Returns the pool of the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=self.limits)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport().handle_async_request(request)
+
+    async def aclose(self):
+        """Closes the pool of the running event loop."""
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class ModelRegistry:
+    """
+    Hands out shared chat model clients keyed by (provider, model, streaming, api key).
+
+    All clients use the same pooled sync and async HTTP transports, so sessions reuse
+    open connections instead of each creating their own pool and TLS handshakes.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 timeout: float = 60.0):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections)
+        self.timeout = timeout
+        self._models: Dict[Tuple[str, str, bool, str], ChatOpenAI] = {}
+        self._lock = threading.Lock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._warmed_up = False
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """Returns the shared synchronous HTTP client."""
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+            return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        """Returns the shared asynchronous HTTP client, with a connection pool per event loop."""
+        with self._lock:
+            if self._http_async_client is None:
+                self._http_async_client = httpx.AsyncClient(transport=LoopLocalTransport(self.limits),
+                                                            timeout=self.timeout)
+            return self._http_async_client
+
+    def get_model(self, model_name: str, api_keys: dict, streaming: bool = False):
+        """Returns the shared client for a model, creating it on first use. Unsupported models return None."""
+        provider = get_provider(model_name)
+        if provider is None:
+            return None
+
+        api_key = api_keys.get(provider)
+        key = (provider, model_name, streaming, api_key or "")
+        model = self._models.get(key)
+        if model is None:
+            model = ChatOpenAI(openai_api_key=api_key, model_name=model_name, streaming=streaming,
+                               http_client=self.http_client, http_async_client=self.http_async_client)
+            with self._lock:
+                model = self._models.setdefault(key, model)
+        return model
+
+    def warm_up(self, api_keys: dict, background: bool = True):
+        """
+        Opens pooled connections to the providers ahead of the first request.
+
+        Runs once per process, as soon as an API key is available; by default in a daemon
+        thread so start-up is not blocked.
+        """
+        api_key = api_keys.get("openai")
+        if not api_key:
+            return
+        with self._lock:
+            if self._warmed_up:
+                return
+            self._warmed_up = True
+
+        def connect():
+            try:
+                self.http_client.get(f"{OPENAI_BASE_URL}/models",
+                                     headers={"Authorization": f"Bearer {api_key}"})
+            except httpx.HTTPError as e:
+                logger.warning("Model registry warm-up failed: %s", e)
+
+        if background:
+            threading.Thread(target=connect, name="model-registry-warm-up", daemon=True).start()
+        else:
+            connect()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+_default_registry: Optional[ModelRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Returns the process-wide model registry."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ModelRegistry()
+    return _default_registry
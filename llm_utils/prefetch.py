@@ -0,0 +1,145 @@
+"""Speculative prefetching of the next question while the current one is being answered.
+
+Prefetches started on an event loop, e.g. by the service, run as asyncio tasks awaiting
+the agent's async call, and discarding one cancels its request. Without a running loop,
+e.g. in the Streamlit app, they run on a small thread pool; a prefetch is skipped rather
+than queued when every worker is busy, and one that is already running can not be
+cancelled and finishes in the background.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from llm_utils.questioning import Questioning
+
+
+MAX_THREADS = 8
+
+_executor = ThreadPoolExecutor(max_workers=MAX_THREADS, thread_name_prefix="question-prefetch")
+_slots = threading.BoundedSemaphore(MAX_THREADS)
+
+Pending = Union[Future, asyncio.Task]  # A prefetch on the thread pool or on an event loop
+
+
+class QuestionPrefetcher:
+    """Generates the following question in the background and hands it over on demand."""
+
+    def __init__(self, questioning: Questioning):
+        self.questioning = questioning
+        self.properties: List[str] = []
+        self.basis: Dict[str, float] = {}
+        self.future: Optional[Pending] = None
+
+    def start(self, properties: List[str], persona: str, basis: Optional[Dict[str, float]] = None):
+        """
+        Starts generating a question for the given properties, replacing any pending one.
+
+        `basis` holds the ratings the question is written for, i.e. the known properties
+        of the persona and the still unknown properties it asks about; it is passed to the
+        validity check on hand-over.
+        """
+        self.discard()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            # The task copies the context, which keeps the session of the instrumentation spans
+            future = loop.create_task(self.questioning.acall(list(properties), persona))
+            # A discarded prefetch may fail without being awaited
+            future.add_done_callback(lambda task: task.cancelled() or task.exception())
+        else:
+            future = self.submit(list(properties), persona)
+            if future is None:
+                return
+        self.future = future
+        self.properties = list(properties)
+        self.basis = dict(basis if basis is not None else dict.fromkeys(properties, 0))
+
+    def submit(self, properties: List[str], persona: str) -> Optional[Future]:
+        """Runs the questioning on the thread pool, or returns None if every worker is busy or it shut down."""
+        slots = _slots
+        if not slots.acquire(blocking=False):
+            return None
+        try:
+            # The copied context keeps the session of the instrumentation spans in the worker thread
+            future = _executor.submit(contextvars.copy_context().run, self.questioning, properties, persona)
+        except RuntimeError:
+            slots.release()
+            return None
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def take(self, is_valid: Callable[[Dict[str, float]], bool]) -> Optional[Tuple[List[str], str]]:
+        """
+        Returns the prefetched (properties, question_answer) if it is still valid.
+
+        `is_valid` receives the ratings the question was written for and decides
+        whether the question still fits the updated persona. Invalid or failed
+        prefetches are discarded.
+        """
+        pending = self.hand_over(is_valid)
+        if pending is None:
+            return None
+        future, properties = pending
+        if isinstance(future, asyncio.Future):
+            # A task of an event loop can not be waited for here
+            future.cancel()
+            return None
+        try:
+            return properties, future.result()
+        except Exception as e:
+            print(f"Prefetching question failed: {e}")
+            return None
+
+    async def atake(self, is_valid: Callable[[Dict[str, float]], bool]) -> Optional[Tuple[List[str], str]]:
+        """Asynchronous counterpart of take that awaits the prefetch without blocking the event loop."""
+        pending = self.hand_over(is_valid)
+        if pending is None:
+            return None
+        future, properties = pending
+        try:
+            if isinstance(future, asyncio.Future):
+                return properties, await future
+            return properties, await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return None
+            raise
+        except Exception as e:
+            print(f"Prefetching question failed: {e}")
+            return None
+
+    def hand_over(self, is_valid: Callable[[Dict[str, float]], bool]) -> Optional[Tuple[Pending, List[str]]]:
+        """Detaches the pending prefetch and returns it with its properties if it is still valid."""
+        if self.future is None:
+            return None
+        future, properties, basis = self.future, self.properties, self.basis
+        self.future, self.properties, self.basis = None, [], {}
+
+        if not is_valid(basis):
+            cancel(future)
+            return None
+        return future, properties
+
+    def discard(self):
+        """Drops the pending prefetch, cancelling its request where possible."""
+        if self.future is not None:
+            cancel(self.future)
+        self.future, self.properties, self.basis = None, [], {}
+
+
+def cancel(future: Pending):
+    """Cancels a prefetch; a task is cancelled on its own loop, as discards may come from another thread."""
+    if isinstance(future, asyncio.Future):
+        loop = future.get_loop()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(future.cancel)
+    else:
+        future.cancel()
+
+
+def shutdown_prefetching():
+    """Waits for running prefetches and stops accepting new ones, e.g. before the process exits."""
+    _executor.shutdown(wait=True, cancel_futures=True)
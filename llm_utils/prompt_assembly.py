@@ -25,9 +25,8 @@ def prompt_assembly(user_ui_inputs: dict, user_text_input: str) -> str:
 
 
 def get_non_zero_properties(person):
-    output = ""
-    non_zero_properties = [f"{property}: {value}" for property, value in person.items() if value != 0]
-    if non_zero_properties:
-        output += "These are the customers properties we already collected previously: "
-        output += "; ".join(non_zero_properties)
-    return output
\ No newline at end of file
+    """Encodes the already rated properties compactly, e.g. "Known properties (1-5): Aged 3, Comfort 4.5"."""
+    non_zero_properties = [f"{property} {round(value, 1):g}" for property, value in person.items() if value != 0]
+    if not non_zero_properties:
+        return ""
+    return "Known properties (1-5): " + ", ".join(non_zero_properties)
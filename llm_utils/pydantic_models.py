@@ -46,7 +46,7 @@ class Output(BaseModel):
 class QuestionAnswer(BaseModel):
     """Defines a model for a question and its possible answers."""
     question: str = Field(..., description="A question that could be answered by the following answers.")
-    answers: List[str] = Field(..., description="List of 2-word answers that answer the question.")
+    answers: List[str] = Field(..., min_length=2, description="List of 2-word answers that answer the question.")
 
 class Property(BaseModel):
     """Defines a model for a property with a name and a value."""
@@ -57,3 +57,8 @@ class PropertyRating(BaseModel):
     """Defines a model for persona matching with a reasoning and a list of properties."""
     reasoning: str = Field(..., description="Reason for the following ratings.")
     properties: List[Property] = Field(..., description="List of properties for the persona.")
+
+class RatingAndQuestion(BaseModel):
+    """Defines a model for the rating of the last answer together with the next question."""
+    rating: PropertyRating = Field(..., description="Ratings of the given properties based on the users answer.")
+    next_question: QuestionAnswer = Field(..., description="The next question for the properties of the next question.")
@@ -0,0 +1,143 @@
+"""Offline pre-generated question bank and the batch CLI that fills it.
+
+Generate the bank from the repository root with
+`OPENAI_API_KEY=... python -m llm_utils.question_bank --variants 3`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+from llm_utils.car_catalog import PROPERTY_NAMES
+
+
+DEFAULT_BANK_FILE = "configs/question_bank.sqlite3"
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def bank_key(properties: Iterable[str]) -> str:
+    """Builds the bank key of a property combination, independent of the property order."""
+    return "|".join(sorted(properties))
+
+
+def property_combinations(property_names: Sequence[str] = PROPERTY_NAMES, max_size: int = 3) -> List[tuple]:
+    """
+    Returns every property combination separate_and_select can produce.
+
+    It selects up to three properties: two or three unknown ones, optionally one known
+    one, or the last remaining unknown property on its own.
+    """
+    return [combination
+            for size in range(1, max_size + 1)
+            for combination in itertools.combinations(property_names, size)]
+
+
+class QuestionBank:
+    """Pre-generated QuestionAnswer variants per property combination, stored in SQLite."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "key TEXT NOT NULL, variant INTEGER NOT NULL, question_answer TEXT NOT NULL, "
+            "PRIMARY KEY (key, variant))")
+        self._variants: Dict[str, List[str]] = {}
+        for key, question_answer in self._db.execute(
+                "SELECT key, question_answer FROM questions ORDER BY key, variant"):
+            self._variants.setdefault(key, []).append(question_answer)
+
+        self.counters = {"hits": 0, "misses": 0}
+
+    def __len__(self) -> int:
+        return sum(len(variants) for variants in self._variants.values())
+
+    def variant_count(self, properties: Iterable[str]) -> int:
+        """Returns the number of stored variants for a property combination."""
+        return len(self._variants.get(bank_key(properties), []))
+
+    def add(self, properties: Iterable[str], question_answer: dict):
+        """Stores a QuestionAnswer variant for a property combination."""
+        key = bank_key(properties)
+        serialized = json.dumps(question_answer)
+        with self._lock:
+            variants = self._variants.setdefault(key, [])
+            self._db.execute(
+                "INSERT INTO questions (key, variant, question_answer) VALUES (?, ?, ?)",
+                (key, len(variants), serialized))
+            variants.append(serialized)
+
+    def draw(self, properties: Iterable[str]) -> Optional[str]:
+        """Returns a random QuestionAnswer JSON variant for a property combination, or None on a miss."""
+        variants = self._variants.get(bank_key(properties))
+        with self._lock:
+            self.counters["hits" if variants else "misses"] += 1
+        return random.choice(variants) if variants else None
+
+
+_default_bank: Optional[QuestionBank] = None
+_default_bank_lock = threading.Lock()
+
+
+def get_question_bank() -> Optional[QuestionBank]:
+    """Returns the process-wide question bank, or None if it has not been generated."""
+    global _default_bank
+    with _default_bank_lock:
+        if _default_bank is None and (ROOT_DIR / DEFAULT_BANK_FILE).exists():
+            _default_bank = QuestionBank(ROOT_DIR / DEFAULT_BANK_FILE)
+    return _default_bank
+
+
+async def generate_bank(bank: QuestionBank, agent, combinations: Sequence[tuple], variants: int,
+                        concurrency: int):
+    """Fills the bank up to the requested number of variants for every combination."""
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def generate(properties):
+        nonlocal done
+        missing = variants - bank.variant_count(properties)
+        for _ in range(missing):
+            async with semaphore:
+                question_answer = await agent.acall(list(properties), "")
+            if question_answer is not None:
+                bank.add(properties, question_answer)
+        done += 1
+        if done % 50 == 0 or done == len(combinations):
+            print(f"{done}/{len(combinations)} property combinations")
+
+    await asyncio.gather(*(generate(properties) for properties in combinations))
+
+
+def main():
+    # Imported here so that serving the bank does not depend on the agent stack.
+    from llm_utils.agents import QuestioningAgent
+    from llm_utils.model_registry import get_model_registry
+
+    parser = argparse.ArgumentParser(description="Pre-generate QuestionAnswer variants for every property combination.")
+    parser.add_argument("--variants", type=int, default=3, help="variants per property combination")
+    parser.add_argument("--model", default="gpt-3.5-turbo-1106")
+    parser.add_argument("--output", default=str(ROOT_DIR / DEFAULT_BANK_FILE))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None, help="only generate the first N combinations")
+    args = parser.parse_args()
+
+    model = get_model_registry().get_model(args.model, {"openai": os.environ.get("OPENAI_API_KEY")})
+    if model is None:
+        parser.error(f"Unsupported model {args.model}")
+
+    bank = QuestionBank(args.output)
+    combinations = property_combinations()[:args.limit]
+    asyncio.run(generate_bank(bank, QuestioningAgent(model), combinations, args.variants, args.concurrency))
+    print(f"Question bank {args.output} holds {len(bank)} questions")
+
+
+if __name__ == "__main__":
+    main()
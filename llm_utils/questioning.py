@@ -1,10 +1,14 @@
 import json
 from typing import Callable
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from llm_utils.model_registry import get_model_registry
 from llm_utils.agents import QuestioningAgent
+from llm_utils.response_cache import ResponseCache
+from llm_utils.question_bank import QuestionBank, get_question_bank
 from llm_utils.pydantic_models import QuestionAnswer
-from typing import List
+from llm_utils.deadlines import AgentError
+from llm_utils.usage_ledger import budget_exceeded, degraded_agent, select_agent
+from typing import List, Optional
 
 class Questioning:
     """Initializes questioning agent with specified models and API keys."""
@@ -13,23 +17,57 @@ class Questioning:
             self,
             api_keys: dict,
             model_name_qa="gpt-3.5-turbo-1106",
+            cache: Optional[ResponseCache] = None,
+            question_bank: Optional[QuestionBank] = None,
+            model_name_hedge: Optional[str] = None,
             ) -> None:
         """Initialize questioning agent using given API keys and model names."""
         self.api_keys = api_keys
+        self.question_bank = question_bank
 
         qa_model = self.create_model(model_name_qa, streaming=False)
 
-        self.questioning_agent = QuestioningAgent(qa_model)
+        hedge_model = self.create_model(model_name_hedge, streaming=False) if model_name_hedge else None
 
+        self.questioning_agent = QuestioningAgent(qa_model, cache, hedge_model)
+
+        # Used once the usage budget is exhausted and no pre-generated question matches
+        self.degraded_agent = degraded_agent(
+            lambda model_name: QuestioningAgent(self.create_model(model_name, streaming=False), cache), model_name_qa)
 
     def __call__(self, properties: List[str], persona: str) -> str:
         """Process a list of properties through the questioning agent and generate a QuestionAnswer response."""
-        question_answer = self.questioning_agent(properties, persona)
+        question_answer = self.draw(properties)
+        if question_answer is not None:
+            return question_answer
+
+        question_answer = select_agent(self.questioning_agent, self.degraded_agent)(properties, persona)
+        if question_answer is None:
+            raise AgentError("No question could be generated.")
 
         question_answer = json.dumps(question_answer)
 
         return question_answer
 
+    async def acall(self, properties: List[str], persona: str) -> str:
+        """Asynchronous counterpart of __call__."""
+        question_answer = self.draw(properties)
+        if question_answer is not None:
+            return question_answer
+
+        question_answer = await select_agent(self.questioning_agent, self.degraded_agent).acall(properties, persona)
+        if question_answer is None:
+            raise AgentError("No question could be generated.")
+
+        return json.dumps(question_answer)
+
+    def draw(self, properties: List[str]) -> Optional[str]:
+        """Draw a pre-generated question, from the process-wide bank as well once the budget is exhausted."""
+        question_bank = self.question_bank
+        if question_bank is None and budget_exceeded():
+            question_bank = get_question_bank()
+        return question_bank.draw(properties) if question_bank is not None else None
+
     def update_agent(self, model_name_qa: str):
         """Update questioning agent with new model."""
         print(f"Updating agent with model {model_name_qa}")
@@ -38,9 +76,5 @@ class Questioning:
         self.questioning_agent.update_model(qa_agent_model)
 
     def create_model(self, model_name: str, streaming=False):
-        """Create a model instance based on model name and streaming capability."""
-        if model_name in ("gpt-3.5-turbo-1106", "gpt-4-turbo-preview"):
-            api_key = self.api_keys["openai"]
-            return ChatOpenAI(openai_api_key=api_key, model_name=model_name, streaming=streaming)
-
-        return None
\ No newline at end of file
+        """Get the shared model instance for a model name and streaming capability."""
+        return get_model_registry().get_model(model_name, self.api_keys, streaming)
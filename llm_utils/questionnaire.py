@@ -0,0 +1,274 @@
+"""UI-agnostic questionnaire flow: asking questions, analysing answers and recommending cars."""
+import asyncio
+import random
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from llm_utils.agent_pool import AgentPool
+from llm_utils.conversation import Conversation
+from llm_utils.instrumentation import session_context
+from llm_utils.matching import get_full_name, match_car
+from llm_utils.prefetch import QuestionPrefetcher
+from llm_utils.prompt_assembly import get_non_zero_properties
+from llm_utils.session_store import SessionState, SessionStore
+from llm_utils.transcript import Message, RatingPayload, Role
+
+
+class QuestionnaireError(Exception):
+    """Raised when a flow step does not fit the state of the session."""
+
+
+def separate_and_select(person: dict, exclude: Iterable[str] = ()) -> List[str]:
+    """Selects two or three unknown properties and, with two, one already known property to ask about."""
+    output = []
+    zero_properties = []
+    non_zero_properties = []
+
+    for property, value in person.items():
+        if property in exclude:
+            continue
+        if value == 0:
+            zero_properties.append(property)
+        else:
+            non_zero_properties.append(property)
+
+    num_new_properties = random.choice([2, 3])
+    selected_zero_properties = random.sample(
+        zero_properties, min(num_new_properties, len(zero_properties)))
+
+    selected_non_zero_property = None
+    if len(selected_zero_properties) == 2 and non_zero_properties:
+        selected_non_zero_property = random.choice(non_zero_properties)
+
+    output.extend(selected_zero_properties)
+    if selected_non_zero_property:
+        output.append(selected_non_zero_property)
+    return output
+
+
+def update_person(person: dict, rating: RatingPayload):
+    """Merges a rating into the person, averaging with earlier ratings of a property."""
+    for property_name, property_value in rating.properties:
+        if person[property_name] != 0:
+            person[property_name] = (person[property_name] + property_value) / 2
+        else:
+            person[property_name] = property_value
+
+
+def is_complete(state: SessionState) -> bool:
+    """Returns whether every property of the person has been rated."""
+    return all(value != 0 for value in state.person.values())
+
+
+def car_list(person: dict, count: int = 3) -> str:
+    """Returns the best matching cars as a numbered list."""
+    matches = match_car(list(person.values()), k=count)
+    return "".join(f"{i+1}. {get_full_name(car_code)}\n" for i, (_, car_code) in enumerate(matches))
+
+
+class QuestionnaireEngine:
+    """
+    Runs the questionnaire on a SessionState, independent of the UI.
+
+    `prefetch_questions` generates the following question in the background while the
+    user answers; `fuse_analysing_questioning` rates the answer and asks the next question
+    in one call. Prefetches are kept per session id in process memory.
+    """
+
+    def __init__(self, pool: AgentPool, store: Optional[SessionStore] = None, prefetch_questions: bool = True,
+                 fuse_analysing_questioning: bool = False, max_prefetchers: int = 1024):
+        self.pool = pool
+        self.store = store
+        self.prefetch_questions = prefetch_questions and not fuse_analysing_questioning
+        self.fuse_analysing_questioning = fuse_analysing_questioning
+        self.max_prefetchers = max_prefetchers
+        self._prefetchers: "OrderedDict[str, QuestionPrefetcher]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> SessionState:
+        """Returns the stored state of a session, or a new state for an unknown session."""
+        return self.store.load(session_id) or SessionState()
+
+    def save(self, session_id: str, state: SessionState):
+        """Stores the state of a session."""
+        self.store.save(session_id, state)
+
+    def delete(self, session_id: str):
+        """Removes a session and its pending prefetch."""
+        self.discard_prefetch(session_id)
+        self.store.delete(session_id)
+
+    async def aload(self, session_id: str) -> SessionState:
+        """Asynchronous counterpart of load that reads the store in a worker thread."""
+        return await asyncio.to_thread(self.load, session_id)
+
+    async def asave(self, session_id: str, state: SessionState):
+        """Asynchronous counterpart of save that writes the store in a worker thread."""
+        await asyncio.to_thread(self.save, session_id, state)
+
+    def ask(self, session_id: str, state: SessionState) -> Message:
+        """Appends the next question to the transcript and returns it."""
+        with session_context(session_id):
+            prefetched = state.next_question or self.take_prefetched(session_id, state)
+            if prefetched:
+                properties, question_answer = prefetched
+            else:
+                properties = separate_and_select(state.person)
+                question_answer = self.pool.questioning(properties, get_non_zero_properties(state.person))
+            return self.asked(session_id, state, properties, question_answer)
+
+    async def aask(self, session_id: str, state: SessionState) -> Message:
+        """Asynchronous counterpart of ask."""
+        with session_context(session_id):
+            prefetched = state.next_question or await self.atake_prefetched(session_id, state)
+            if prefetched:
+                properties, question_answer = prefetched
+            else:
+                properties = separate_and_select(state.person)
+                question_answer = await self.pool.questioning.acall(properties, get_non_zero_properties(state.person))
+            return self.asked(session_id, state, properties, question_answer)
+
+    def asked(self, session_id: str, state: SessionState, properties: List[str], question_answer: str) -> Message:
+        """Records a question and starts prefetching the following one."""
+        state.next_question = None
+        state.last_properties = list(properties)
+        self.start_prefetch(session_id, state)
+        return state.transcript.append(Role.ASSISTANT, question_answer)
+
+    def answer(self, session_id: str, state: SessionState, user_answer: str) -> Message:
+        """Rates the answer to the last question, updates the person and returns the analysis."""
+        with session_context(session_id):
+            question = self.last_question(state)
+            analysis = None
+            next_properties = self.next_properties(state)
+            if next_properties:
+                result = self.pool.analysing_questioning(
+                    question, user_answer, state.last_properties, next_properties,
+                    get_non_zero_properties(state.person))
+                analysis = self.fused(state, next_properties, result)
+            if analysis is None:
+                analysis = self.pool.analysing(question, user_answer, state.last_properties)
+            return self.analysed(session_id, state, user_answer, analysis)
+
+    async def aanswer(self, session_id: str, state: SessionState, user_answer: str) -> Message:
+        """Asynchronous counterpart of answer."""
+        with session_context(session_id):
+            question = self.last_question(state)
+            analysis = None
+            next_properties = self.next_properties(state)
+            if next_properties:
+                result = await self.pool.analysing_questioning.acall(
+                    question, user_answer, state.last_properties, next_properties,
+                    get_non_zero_properties(state.person))
+                analysis = self.fused(state, next_properties, result)
+            if analysis is None:
+                analysis = await self.pool.analysing.acall(question, user_answer, state.last_properties)
+            return self.analysed(session_id, state, user_answer, analysis)
+
+    @staticmethod
+    def last_question(state: SessionState) -> str:
+        """Returns the question awaiting an answer."""
+        last = state.transcript.last
+        if last is None or last.role != Role.ASSISTANT:
+            raise QuestionnaireError("There is no open question to answer.")
+        return last.payload.question
+
+    def next_properties(self, state: SessionState) -> List[str]:
+        """Selects the properties of the next question for the fused mode, or none if it is off."""
+        if not self.fuse_analysing_questioning:
+            return []
+        return separate_and_select(state.person, exclude=state.last_properties)
+
+    @staticmethod
+    def fused(state: SessionState, next_properties: List[str], result: Optional[Tuple[str, str]]) -> Optional[str]:
+        """Keeps the question of a fused response for the next round and returns its analysis."""
+        if result is None:
+            return None
+        analysis, question_answer = result
+        state.next_question = (next_properties, question_answer)
+        return analysis
+
+    def analysed(self, session_id: str, state: SessionState, user_answer: str, analysis: str) -> Message:
+        """Records the answer with its analysis and updates the person."""
+        state.transcript.append_text(Role.USER, user_answer)
+        message = state.transcript.append(Role.USER, analysis)
+        update_person(state.person, message.payload)
+        if is_complete(state):
+            self.discard_prefetch(session_id)
+            state.next_question = None
+        return message
+
+    def recommend(self, state: SessionState, stream_handler: Callable,
+                  conversation: Optional[Conversation] = None) -> str:
+        """Presents the best matching cars, streaming through the handler, and appends the recommendation."""
+        conversation = conversation or self.conversation(state)
+        response = conversation(get_non_zero_properties(state.person), car_list(state.person), stream_handler)
+        state.transcript.append_text(Role.AI, response)
+        return response
+
+    async def arecommend(self, state: SessionState, stream_handler: Callable,
+                         conversation: Optional[Conversation] = None) -> str:
+        """Asynchronous counterpart of recommend."""
+        conversation = conversation or self.conversation(state)
+        response = await conversation.acall(get_non_zero_properties(state.person), car_list(state.person),
+                                            stream_handler)
+        state.transcript.append_text(Role.AI, response)
+        return response
+
+    def conversation(self, state: SessionState) -> Conversation:
+        """Builds the session's conversation with its earlier recommendations in memory."""
+        return self.pool.conversation([message.payload for message in state.transcript if message.role == Role.AI])
+
+    def prefetcher(self, session_id: str, create: bool = False) -> Optional[QuestionPrefetcher]:
+        """Returns the prefetcher of a session, evicting the least recently used ones."""
+        with self._lock:
+            prefetcher = self._prefetchers.get(session_id)
+            if prefetcher is None and create:
+                prefetcher = self._prefetchers[session_id] = QuestionPrefetcher(self.pool.questioning)
+                while len(self._prefetchers) > self.max_prefetchers:
+                    self._prefetchers.popitem(last=False)[1].discard()
+            if prefetcher is not None:
+                self._prefetchers.move_to_end(session_id)
+            return prefetcher
+
+    def start_prefetch(self, session_id: str, state: SessionState):
+        """Start generating the following question for properties other than the ones just asked."""
+        if not self.prefetch_questions:
+            return
+        properties = separate_and_select(state.person, exclude=state.last_properties)
+        if not properties:
+            return
+        # The ratings the question is written for: the persona in its prompt and the unknown properties it explores
+        basis = {prop: value for prop, value in state.person.items() if value != 0}
+        basis.update((prop, 0) for prop in properties if state.person[prop] == 0)
+        self.prefetcher(session_id, create=True).start(properties, get_non_zero_properties(state.person), basis)
+
+    @staticmethod
+    def prefetch_is_valid(state: SessionState) -> Callable[[Dict[str, float]], bool]:
+        """
+        Returns the validity check of a prefetched question against the updated person.
+
+        The question is discarded, and a new one generated, if the analysis changed a rating
+        it was written for: a known property was rated differently, so the persona in its
+        prompt is outdated, or one of its new properties was rated already, so it no longer
+        asks for new information. Ratings of the properties just asked about are expected.
+        """
+        # Compared at the precision of the persona in the prompt
+        return lambda basis: all(round(state.person[prop], 1) == round(value, 1) for prop, value in basis.items())
+
+    def take_prefetched(self, session_id: str, state: SessionState) -> Optional[Tuple[List[str], str]]:
+        """Return the prefetched (properties, question) unless the persona update invalidated it."""
+        prefetcher = self.prefetcher(session_id)
+        return prefetcher.take(self.prefetch_is_valid(state)) if prefetcher is not None else None
+
+    async def atake_prefetched(self, session_id: str, state: SessionState) -> Optional[Tuple[List[str], str]]:
+        """Asynchronous counterpart of take_prefetched."""
+        prefetcher = self.prefetcher(session_id)
+        return await prefetcher.atake(self.prefetch_is_valid(state)) if prefetcher is not None else None
+
+    def discard_prefetch(self, session_id: str):
+        """Drops the pending prefetch of a session."""
+        with self._lock:
+            prefetcher = self._prefetchers.pop(session_id, None)
+        if prefetcher is not None:
+            prefetcher.discard()
@@ -0,0 +1,265 @@
+"""Response cache for LLM agents with an in-memory LRU tier and a SQLite tier."""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+DEFAULT_CACHE_FILE = ".response_cache.sqlite3"
+PRUNE_INTERVAL = 256
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def make_key(model_name: str, prompt: str) -> str:
+    """Builds the cache key of a fully rendered prompt sent to a model."""
+    return hashlib.sha256(f"{model_name}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caches JSON-serializable agent responses keyed by model name and rendered prompt.
+
+    Lookups go to an in-memory LRU first and then to an optional SQLite file shared
+    between processes. Entries expire after `ttl` seconds. Concurrent requests for the
+    same key are collapsed into a single call of the compute function.
+    """
+
+    def __init__(
+            self,
+            path: Optional[Path] = None,
+            ttl: float = 24 * 3600,
+            max_memory_entries: int = 1024,
+            max_disk_entries: int = 100_000):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._async_inflight: Dict[tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "inflight_joins": 0}
+        self._disk_writes = 0
+
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value for a key or None."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        return self._disk_result(key, self._disk_get(key, now))
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """Asynchronous counterpart of get that reads the SQLite tier in a worker thread."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        entry = await asyncio.to_thread(self._disk_get, key, now) if self._db is not None else None
+        return self._disk_result(key, entry)
+
+    def set(self, key: str, value: Any):
+        """Stores a value in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        self._disk_set(key, now, value)
+
+    async def aset(self, key: str, value: Any):
+        """Asynchronous counterpart of set that writes the SQLite tier in a worker thread."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, now, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for a key, computing and storing it on a miss.
+
+        Only one caller computes a missing key; concurrent callers wait for its result.
+        The memory lookup and the registration of that caller happen under one lock, so a
+        caller arriving just after it finished finds the stored value. None results are
+        returned but not cached.
+        """
+        now = time.time()
+        with self._lock:
+            value = self._memory_lookup(key, now)
+            if value is not None:
+                return value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.counters["inflight_joins"] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = self._disk_result(key, self._disk_get(key, now))
+            if value is None:
+                value = compute()
+                if value is not None:
+                    self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Asynchronous counterpart of get_or_compute taking a coroutine function.
+
+        Concurrent requests on the same event loop share one task; waiters are shielded
+        so that cancelling one of them does not cancel the shared call. The SQLite tier is
+        accessed in worker threads, so the event loop is not blocked.
+        """
+        now = time.time()
+
+        async def load_or_compute():
+            entry = await asyncio.to_thread(self._disk_get, key, now) if self._db is not None else None
+            result = self._disk_result(key, entry)
+            if result is None:
+                result = await compute()
+                if result is not None:
+                    await self.aset(key, result)
+            return result
+
+        inflight_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            value = self._memory_lookup(key, now)
+            if value is not None:
+                return value
+            task = self._async_inflight.get(inflight_key)
+            owner = task is None
+            if owner:
+                task = asyncio.ensure_future(load_or_compute())
+                self._async_inflight[inflight_key] = task
+                task.add_done_callback(lambda _: self._async_inflight.pop(inflight_key, None))
+            else:
+                self.counters["inflight_joins"] += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Removes all entries from both tiers."""
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM responses")
+
+    def _memory_get(self, key: str, now: float) -> Optional[Any]:
+        """Returns a non-expired value from the memory tier, counting the hit."""
+        with self._lock:
+            return self._memory_lookup(key, now)
+
+    def _memory_lookup(self, key: str, now: float) -> Optional[Any]:
+        """Returns a non-expired value from the memory tier, counting the hit. Caller holds the lock."""
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if now - created > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        self.counters["memory_hits"] += 1
+        return value
+
+    def _disk_result(self, key: str, entry: Optional[tuple]) -> Optional[Any]:
+        """Returns the value of an entry read from the SQLite tier, keeping it in memory, or counts a miss."""
+        with self._lock:
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            created, value = entry
+            self._remember(key, created, value)
+            self.counters["disk_hits"] += 1
+        return value
+
+    def _remember(self, key: str, created: float, value: Any):
+        """Inserts into the memory tier, evicting the least recently used entries. Caller holds the lock."""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        """Reads a non-expired entry from the SQLite tier."""
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT created, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return row[0], json.loads(row[1])
+
+    def _disk_set(self, key: str, now: float, value: Any):
+        """Writes an entry to the SQLite tier and periodically enforces its size cap."""
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now))
+            self._disk_writes += 1
+            if self._disk_writes % PRUNE_INTERVAL:
+                return
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,))
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache backed by the default SQLite file."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(ROOT_DIR / DEFAULT_CACHE_FILE)
+    return _default_cache
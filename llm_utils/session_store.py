@@ -0,0 +1,212 @@
+"""Storage backends for the questionnaire state of a session, shared between app processes."""
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from llm_utils.car_catalog import PROPERTY_NAMES
+from llm_utils.transcript import Transcript
+
+
+DEFAULT_SESSION_FILE = ".sessions.sqlite3"
+DEFAULT_SECRET_FILE = ".session_secret"
+SECRET_ENV_VAR = "CARSHIP_SESSION_SECRET"
+PRUNE_INTERVAL = 256
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+class SessionState:
+    """Questionnaire state of a session; agents and other process-local objects are not part of it."""
+    __slots__ = ("person", "transcript", "last_properties", "next_question")
+
+    def __init__(self, person: Optional[Dict[str, float]] = None, transcript: Optional[Transcript] = None,
+                 last_properties: Optional[List[str]] = None,
+                 next_question: Optional[Tuple[List[str], str]] = None):
+        self.person = person if person is not None else dict.fromkeys(PROPERTY_NAMES, 0)
+        self.transcript = transcript if transcript is not None else Transcript()
+        self.last_properties = last_properties if last_properties is not None else []
+        self.next_question = next_question
+
+
+def dumps(state: SessionState) -> bytes:
+    """Serializes a session state into compressed compact JSON."""
+    data = {"person": state.person, "transcript": state.transcript.to_records(),
+            "last_properties": state.last_properties, "next_question": state.next_question}
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def loads(blob: bytes) -> SessionState:
+    """Restores a session state serialized by dumps."""
+    data = json.loads(zlib.decompress(blob))
+    next_question = tuple(data["next_question"]) if data["next_question"] else None
+    return SessionState(data["person"], Transcript.from_records(data["transcript"]),
+                        data["last_properties"], next_question)
+
+
+class SessionStore(ABC):
+    """Interface of the session state backends."""
+
+    def load(self, session_id: str) -> Optional[SessionState]:
+        """Returns the stored state of a session, or None for an unknown session."""
+        blob = self.load_blob(session_id)
+        return loads(blob) if blob is not None else None
+
+    def save(self, session_id: str, state: SessionState) -> bytes:
+        """Stores the state of a session and returns its serialized form."""
+        blob = dumps(state)
+        self.save_blob(session_id, blob)
+        return blob
+
+    @abstractmethod
+    def load_blob(self, session_id: str) -> Optional[bytes]:
+        """Returns the serialized state of a session."""
+
+    @abstractmethod
+    def save_blob(self, session_id: str, blob: bytes):
+        """Stores the serialized state of a session."""
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Removes a session."""
+
+
+class InMemorySessionStore(SessionStore):
+    """Keeps serialized sessions in process memory; sessions are lost on restart."""
+
+    def __init__(self):
+        self._sessions: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def load_blob(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def save_blob(self, session_id: str, blob: bytes):
+        with self._lock:
+            self._sessions[session_id] = blob
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Keeps serialized sessions in a SQLite file that several app processes can share.
+
+    Sessions not written for `ttl` seconds expire.
+    """
+
+    def __init__(self, path: Path, ttl: float = 7 * 24 * 3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, state BLOB NOT NULL, updated REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def load_blob(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, updated FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def save_blob(self, session_id: str, blob: bytes):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, updated) VALUES (?, ?, ?)",
+                (session_id, blob, now))
+            self._writes += 1
+            if self._writes % PRUNE_INTERVAL == 0:
+                self._db.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+_default_store: Optional[SessionStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Returns the process-wide session store backed by the default SQLite file."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SQLiteSessionStore(ROOT_DIR / DEFAULT_SESSION_FILE)
+    return _default_store
+
+
+def session_token(session_id: str, secret: bytes) -> str:
+    """Signs a session id into the token handed to the browser, e.g. in the session link."""
+    signature = hmac.new(secret, session_id.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+    return f"{session_id}.{signature}"
+
+
+def session_id_from_token(token: str, secret: bytes) -> Optional[str]:
+    """Returns the session id of a token, or None if it was not signed with the secret."""
+    session_id, _, signature = token.rpartition(".")
+    if not session_id or not hmac.compare_digest(session_token(session_id, secret), token):
+        return None
+    return session_id
+
+
+_secret: Optional[bytes] = None
+_secret_lock = threading.Lock()
+
+
+def get_session_secret() -> bytes:
+    """
+    Returns the key signing session tokens.
+
+    It is read from the CARSHIP_SESSION_SECRET environment variable, or else from a
+    random key file next to the default session file that the first process creates,
+    so all app processes sharing the session file accept each other's tokens.
+    """
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            if os.environ.get(SECRET_ENV_VAR):
+                _secret = os.environ[SECRET_ENV_VAR].encode("utf-8")
+            else:
+                _secret = _read_or_create_secret(ROOT_DIR / DEFAULT_SECRET_FILE)
+    return _secret
+
+
+def _read_or_create_secret(path: Path) -> bytes:
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process may still be writing the key it just created
+        for _ in range(50):
+            secret = path.read_bytes().strip()
+            if secret:
+                return secret
+            time.sleep(0.01)
+        raise RuntimeError(f"Session secret file {path} is empty")
+    secret = secrets.token_hex(32).encode("ascii")
+    with os.fdopen(fd, "wb") as file:
+        file.write(secret)
+    return secret
@@ -0,0 +1,149 @@
+"""KD-tree index over a car catalog for sub-linear weighted nearest-car lookup."""
+import heapq
+from typing import List, Optional, Tuple
+import numpy
+from llm_utils.car_catalog import CarCatalog
+
+
+class KDTree:
+    """Exact k-nearest-neighbour KD-tree over a point matrix using Euclidean distance."""
+
+    def __init__(self, points, leaf_size: int = 64):
+        points = numpy.asarray(points, dtype=numpy.float64)
+        self.leaf_size = max(1, leaf_size)
+        self.order = numpy.arange(points.shape[0])
+
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.children: List[Tuple[int, int]] = []
+        self.lower: List[numpy.ndarray] = []
+        self.upper: List[numpy.ndarray] = []
+        self._build(points)
+
+        # Points are stored in tree order so that every node covers a contiguous slice.
+        self.points = points[self.order]
+        self.lower = numpy.array(self.lower)
+        self.upper = numpy.array(self.upper)
+
+    def _build(self, points: numpy.ndarray):
+        """Split nodes on their widest dimension at the median until they fit a leaf."""
+        stack = [(self._add_node(points, 0, points.shape[0]), 0, points.shape[0])]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= self.leaf_size:
+                continue
+            spread = self.upper[node] - self.lower[node]
+            dim = int(numpy.argmax(spread))
+            if spread[dim] == 0:
+                continue
+
+            middle = (end - start) // 2
+            segment = self.order[start:end]
+            partition = numpy.argpartition(points[segment, dim], middle)
+            self.order[start:end] = segment[partition]
+            split = start + middle
+
+            left = self._add_node(points, start, split)
+            right = self._add_node(points, split, end)
+            self.children[node] = (left, right)
+            stack.append((left, start, split))
+            stack.append((right, split, end))
+
+    def _add_node(self, points: numpy.ndarray, start: int, end: int) -> int:
+        """Register a node covering order[start:end] and return its id."""
+        node_points = points[self.order[start:end]]
+        self.starts.append(start)
+        self.ends.append(end)
+        self.children.append((-1, -1))
+        self.lower.append(node_points.min(axis=0))
+        self.upper.append(node_points.max(axis=0))
+        return len(self.starts) - 1
+
+    def _box_sq_distance(self, node: int, point: numpy.ndarray) -> float:
+        """Squared distance from a point to the bounding box of a node."""
+        gap = numpy.maximum(self.lower[node] - point, 0.0) + numpy.maximum(point - self.upper[node], 0.0)
+        return float(gap @ gap)
+
+    def query(self, point, k: int, mask: Optional[numpy.ndarray] = None) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns the distances and original row indices of the k nearest points, closest first.
+
+        Rows where the optional boolean mask (in original row order) is False are skipped.
+        A k of zero or less returns no points.
+        """
+        if k <= 0:
+            return numpy.empty(0), numpy.empty(0, dtype=numpy.int64)
+        point = numpy.asarray(point, dtype=numpy.float64)
+        tree_mask = None if mask is None else mask[self.order]
+
+        best_sq = numpy.empty(0)
+        best_pos = numpy.empty(0, dtype=numpy.int64)
+        kth_sq = numpy.inf
+
+        heap = [(self._box_sq_distance(0, point), 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound > kth_sq:
+                break
+
+            left, right = self.children[node]
+            if left >= 0:
+                for child in (left, right):
+                    child_bound = self._box_sq_distance(child, point)
+                    if child_bound <= kth_sq:
+                        heapq.heappush(heap, (child_bound, child))
+                continue
+
+            start, end = self.starts[node], self.ends[node]
+            positions = numpy.arange(start, end)
+            diff = self.points[start:end] - point
+            sq_dist = numpy.einsum("ij,ij->i", diff, diff)
+            if tree_mask is not None:
+                keep = tree_mask[start:end]
+                positions, sq_dist = positions[keep], sq_dist[keep]
+                if not len(positions):
+                    continue
+
+            best_sq = numpy.concatenate((best_sq, sq_dist))
+            best_pos = numpy.concatenate((best_pos, positions))
+            if len(best_sq) > k:
+                keep = numpy.argpartition(best_sq, k - 1)[:k]
+                best_sq, best_pos = best_sq[keep], best_pos[keep]
+            if len(best_sq) == k:
+                kth_sq = float(best_sq.max())
+
+        order = numpy.argsort(best_sq, kind="stable")
+        return numpy.sqrt(best_sq[order]), self.order[best_pos[order]]
+
+
+class IndexedCatalog:
+    """Indexed matching backend answering exact weighted top-k queries on a CarCatalog."""
+
+    def __init__(self, catalog: CarCatalog, leaf_size: int = 1024, brute_force_below: int = 256):
+        self.catalog = catalog
+        self.brute_force_below = brute_force_below
+        # The tree is built on the weight-scaled matrix, so plain Euclidean distance
+        # in the tree equals the weighted distance used by the brute-force path.
+        self.tree = KDTree(catalog.scaled_matrix, leaf_size)
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    def top_k(self, persona, k: int = 3, where: Optional[dict] = None) -> List[Tuple[float, str]]:
+        """Returns the k closest cars to a persona as (distance, car_code) tuples, closest first."""
+        mask = self.catalog.filter_mask(where) if where else None
+        if mask is not None and mask.sum() < self.brute_force_below:
+            # Very selective filters are cheaper to scan directly than to search in the tree.
+            return self.catalog.top_k(persona, k, where)
+
+        scaled = numpy.asarray(persona, dtype=numpy.float64) * self.catalog.weights
+        distances, indices = self.tree.query(scaled, k, mask)
+        return [(float(distance), str(self.catalog.codes[index])) for distance, index in zip(distances, indices)]
+
+    def top_k_batch(self, personas_matrix, k: int = 3, where: Optional[dict] = None) -> List[List[Tuple[float, str]]]:
+        """Returns the top-k matches for every persona in a matrix."""
+        return [self.top_k(persona, k, where) for persona in numpy.atleast_2d(personas_matrix)]
+
+    def get_full_name(self, car_code: str) -> str:
+        """Returns the display name of a car code."""
+        return self.catalog.get_full_name(car_code)
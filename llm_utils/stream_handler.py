@@ -1,24 +1,90 @@
 """Module for handling streaming and debugging of llm outputs with custom callback handlers."""
+import asyncio
+import io
+import time
 from typing import Any, Dict, List
 from langchain.callbacks.base import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+class BufferedRenderer:
+    """
+    Accumulates streamed text and renders it to a container at a bounded rate.
+
+    Text is rendered when `interval` seconds passed or `max_pending_chars` characters
+    arrived since the last render, and once more on the final flush.
+    """
+
+    def __init__(self, container, initial_text="", interval=0.05, max_pending_chars=200):
+        self.container = container
+        self.interval = interval
+        self.max_pending_chars = max_pending_chars
+        self.buffer = io.StringIO()
+        self.buffer.write(initial_text)
+        self.pending_chars = 0
+        self.last_render = 0.0
+        self.appends = 0
+        self.renders = 0
+
+    @property
+    def text(self) -> str:
+        """Returns all text appended so far."""
+        return self.buffer.getvalue()
+
+    def append(self, text: str):
+        """Appends text and renders it if the time or size budget is exhausted."""
+        self.buffer.write(text)
+        self.appends += 1
+        self.pending_chars += len(text)
+        if (self.pending_chars >= self.max_pending_chars
+                or time.monotonic() - self.last_render >= self.interval):
+            self.flush()
+
+    def flush(self):
+        """Renders the pending text."""
+        if not self.pending_chars:
+            return
+        self.container.markdown(self.buffer.getvalue())
+        self.pending_chars = 0
+        self.last_render = time.monotonic()
+        self.renders += 1
+
+    def stats(self) -> dict:
+        """Returns how many tokens were received and how many renders they caused."""
+        return {"tokens": self.appends, "renders": self.renders}
 
 
 class StreamHandler(BaseCallbackHandler):
     """Handles real-time streaming of LLM output tokens to a Streamlit container."""
 
-    def __init__(self, container, initial_text=""):
-        self.container = container
-        self.text = initial_text
+    def __init__(self, container, initial_text="", interval=0.05, max_pending_chars=200):
+        self.renderer = BufferedRenderer(container, initial_text, interval, max_pending_chars)
+
+    @property
+    def text(self) -> str:
+        """Returns the accumulated text from LLM output."""
+        return self.renderer.text
 
     def on_llm_new_token(self, token: str, **kwargs) -> None:
         """Streams tokens to the container."""
-        self.text += token
-        self.container.markdown(self.text)
+        self.renderer.append(token)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        """Renders the remaining text."""
+        self.renderer.flush()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        """Renders the text received before the error."""
+        self.renderer.flush()
 
     def get_accumulated_response(self):
         """Returns the accumulated text from LLM output."""
         return self.text
 
+    def render_stats(self) -> dict:
+        """Returns how many tokens were received and how many renders they caused."""
+        return self.renderer.stats()
+
 
 class DebugHandler(BaseCallbackHandler):
     """Debug handler for printing out the prompts used in LLM requests."""
@@ -33,25 +99,95 @@ class DebugHandler(BaseCallbackHandler):
         #print(prompts)
 
 
+class SpecialTokenReached(Exception):
+    """Raised by StreamUntilSpecialTokenHandler to cancel generation at the special token."""
+
+    def __init__(self, text: str):
+        super().__init__("Special token reached")
+        self.text = text
+
+
 class StreamUntilSpecialTokenHandler(BaseCallbackHandler):
-    """Handles streaming LLM outputs to a container until a special token is encountered."""
+    """
+    Handles streaming LLM outputs to a container until a special token is encountered.
 
-    def __init__(self, container, initial_text="", special_token="␃"):
-        self.container = container
-        self.text = initial_text
+    The special token is detected even when it arrives merged with other text or split
+    across chunks. With `cancel_on_special_token` the handler raises SpecialTokenReached,
+    which aborts the underlying request; agents catch it and return the text so far.
+    """
+
+    def __init__(self, container, initial_text="", special_token="␃", interval=0.05, max_pending_chars=200,
+                 cancel_on_special_token=False):
+        self.renderer = BufferedRenderer(container, initial_text, interval, max_pending_chars)
         self.special_token = special_token
         self.special_token_reached = False
+        self.cancel_on_special_token = cancel_on_special_token
+        # Exceptions of handlers are only propagated to the caller with raise_error.
+        self.raise_error = cancel_on_special_token
+        self.held_back = ""
+
+    @property
+    def text(self) -> str:
+        """Returns the accumulated text from LLM output."""
+        return self.renderer.text
 
     def on_llm_new_token(self, token: str, **kwargs) -> None:
         """Streams tokens to the container, stopping if the special token is reached."""
         if self.special_token_reached:
             return
-        if token.strip() == self.special_token:
+
+        text = self.held_back + token
+        index = text.find(self.special_token)
+        if index >= 0:
+            self.held_back = ""
+            self.renderer.append(text[:index].rstrip())
             self.special_token_reached = True
+            self.renderer.flush()
+            if self.cancel_on_special_token:
+                raise SpecialTokenReached(self.text)
             return
-        self.text += token
-        self.container.markdown(self.text)
+
+        # Hold back a trailing partial special token until the next chunk decides it.
+        keep = _partial_suffix_length(text, self.special_token)
+        self.held_back = text[len(text) - keep:] if keep else ""
+        if len(text) > keep:
+            self.renderer.append(text[:len(text) - keep])
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        """Renders the remaining text."""
+        if self.held_back:
+            self.renderer.append(self.held_back)
+            self.held_back = ""
+        self.renderer.flush()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        """Renders the text received before the error."""
+        self.renderer.flush()
 
     def get_accumulated_response(self):
         """Returns the accumulated text from LLM output."""
         return self.text
+
+    def render_stats(self) -> dict:
+        """Returns how many tokens were received and how many renders they caused."""
+        return self.renderer.stats()
+
+
+class QueueHandler(BaseCallbackHandler):
+    """Puts streamed tokens into an asyncio queue, e.g. to relay them as server-sent events."""
+
+    run_inline = True  # Called on the event loop, where the queue lives
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.queue.put_nowait(token)
+
+
+def _partial_suffix_length(text: str, token: str) -> int:
+    """Returns the length of the longest suffix of text that is a proper prefix of token."""
+    for length in range(min(len(token) - 1, len(text)), 0, -1):
+        if token.startswith(text[-length:]):
+            return length
+    return 0
@@ -0,0 +1,40 @@
+"""Native structured output through forced tool calls, for providers that support them."""
+from typing import Optional, Type
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+
+def tool_schema(pydantic_object: Type[BaseModel]) -> dict:
+    """Returns the OpenAI tool definition of a pydantic model."""
+    parameters = pydantic_object.model_json_schema()
+    parameters.pop("title", None)
+    description = parameters.pop("description", None) or pydantic_object.__name__
+    return {"type": "function",
+            "function": {"name": pydantic_object.__name__, "description": description,
+                         "parameters": parameters}}
+
+
+def bind_structured_output(model, pydantic_object: Type[BaseModel]) -> Optional[Runnable]:
+    """
+    Binds the pydantic model as a forced tool call.
+
+    Returns None if the model does not support tool calling, so callers can fall back to
+    format instructions and text parsing.
+    """
+    try:
+        return model.bind_tools([tool_schema(pydantic_object)], tool_choice=pydantic_object.__name__)
+    except (NotImplementedError, AttributeError):
+        return None
+
+
+def tool_arguments(message: BaseMessage) -> str:
+    """
+    Returns the raw JSON arguments of the first tool call of a message.
+
+    Messages without a tool call return their content, which is then parsed as text.
+    """
+    tool_calls = message.additional_kwargs.get("tool_calls") or []
+    if tool_calls:
+        return tool_calls[0]["function"]["arguments"]
+    return message.content
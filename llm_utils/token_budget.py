@@ -0,0 +1,67 @@
+"""Tokenizer-aware prompt budgets: token counting, truncation and memory compaction."""
+import functools
+import logging
+import math
+from typing import List, Optional
+
+
+FALLBACK_CHARS_PER_TOKEN = 4
+DEFAULT_ENCODING = "cl100k_base"
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name: Optional[str] = None):
+    """
+    Returns the tiktoken encoding of a model, or None if tiktoken or its encoding files are unavailable.
+
+    Unknown model names use the cl100k_base encoding of the supported OpenAI models.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name) if model_name else tiktoken.get_encoding(DEFAULT_ENCODING)
+    except KeyError:
+        return get_encoding(None)
+    except Exception as e:
+        # tiktoken downloads encoding files on first use, which fails without network access
+        logger.warning("Token counting falls back to an estimate: %s", e)
+        return None
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """Counts the tokens of a text, estimating from its length without a tokenizer."""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: Optional[str] = None) -> str:
+    """Cuts a text down to at most `max_tokens` tokens, marking the cut with an ellipsis."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[:max(0, (max_tokens - 1) * FALLBACK_CHARS_PER_TOKEN)].rstrip() + "…"
+    return encoding.decode(encoding.encode(text)[:max_tokens - 1]).rstrip() + "…"
+
+
+def compact_turns(turns: List[str], window: int, summary_tokens: int, model_name: Optional[str] = None) -> List[str]:
+    """
+    Keeps the last `window` turns verbatim and compacts the older ones.
+
+    Older turns are reduced to their first line, cut to `summary_tokens` tokens each, and
+    merged into a single leading "Earlier:" turn.
+    """
+    if len(turns) <= window:
+        return list(turns)
+    older, recent = turns[:len(turns) - window], turns[len(turns) - window:]
+    summaries = [truncate_to_tokens(turn.strip().splitlines()[0] if turn.strip() else "", summary_tokens, model_name)
+                 for turn in older]
+    return ["Earlier: " + " | ".join(summary for summary in summaries if summary)] + recent
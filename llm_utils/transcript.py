@@ -0,0 +1,137 @@
+"""Compact per-session transcript storing every message once with pre-parsed payloads."""
+import json
+import sys
+from enum import Enum
+from typing import Iterator, List, Optional, Tuple, Union
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+
+class Role(str, Enum):
+    """Role of a transcript message; the values are the chat roles used in the UI."""
+    ASSISTANT = "assistant"  # Question with possible answers
+    USER = "user"  # Rating of the user's answer, or the user's own text
+    AI = "ai"  # Final recommendation
+
+
+class QuestionPayload:
+    """Pre-parsed QuestionAnswer."""
+    __slots__ = ("question", "answers")
+
+    def __init__(self, question: str, answers):
+        self.question = question
+        self.answers = tuple(answers)
+
+    def to_dict(self) -> dict:
+        return {"question": self.question, "answers": list(self.answers)}
+
+
+class RatingPayload:
+    """Pre-parsed PropertyRating with the ratings as (property name, value) pairs."""
+    __slots__ = ("reasoning", "properties")
+
+    def __init__(self, reasoning: str, properties):
+        self.reasoning = reasoning
+        # Property names repeat in every round, so all ratings share one string per name
+        self.properties = tuple((sys.intern(name), value) for name, value in properties)
+
+    def to_dict(self) -> dict:
+        return {"reasoning": self.reasoning,
+                "properties": [{"property_name": name, "property_value": value}
+                               for name, value in self.properties]}
+
+
+Payload = Union[QuestionPayload, RatingPayload, str]
+
+
+def parse_payload(content: str) -> Payload:
+    """Parses QuestionAnswer and PropertyRating JSON into payload records; other content stays text."""
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return content
+    try:
+        if isinstance(data, dict) and "question" in data and "answers" in data:
+            return QuestionPayload(data["question"], data["answers"])
+        if isinstance(data, dict) and "properties" in data:
+            return RatingPayload(data.get("reasoning", ""),
+                                 [(item["property_name"], item["property_value"]) for item in data["properties"]])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return content
+
+
+class Message:
+    """A transcript message with its role and payload."""
+    __slots__ = ("role", "payload")
+
+    def __init__(self, role: Role, payload: Payload):
+        self.role = role
+        self.payload = payload
+
+    @property
+    def content(self) -> str:
+        """Returns the message as the text the LLMs and the original JSON representation use."""
+        if isinstance(self.payload, str):
+            return self.payload
+        return json.dumps(self.payload.to_dict())
+
+
+class Transcript:
+    """Ordered session messages with views for display and for the LLM history."""
+    __slots__ = ("messages",)
+
+    def __init__(self, messages: Optional[List[Message]] = None):
+        self.messages = messages or []
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self.messages)
+
+    def __getitem__(self, index: int) -> Message:
+        return self.messages[index]
+
+    @property
+    def last(self) -> Optional[Message]:
+        """Returns the most recent message, or None for an empty transcript."""
+        return self.messages[-1] if self.messages else None
+
+    def append(self, role: Role, content: Union[str, Payload]) -> Message:
+        """Appends a message of an agent, parsing JSON content once."""
+        payload = parse_payload(content) if isinstance(content, str) else content
+        return self.append_text(role, payload)
+
+    def append_text(self, role: Role, text: Union[str, Payload]) -> Message:
+        """Appends a message as it is, e.g. the user's own text, which stays text even if it looks like JSON."""
+        message = Message(Role(role), text)
+        self.messages.append(message)
+        return message
+
+    def display_view(self) -> Iterator[Tuple[int, Message]]:
+        """Yields (index, message) for every message shown in the chat."""
+        for index, message in enumerate(self.messages):
+            if message.role != Role.USER:
+                yield index, message
+
+    def llm_history(self) -> List[BaseMessage]:
+        """Returns the transcript as LangChain messages."""
+        return [HumanMessage(role=message.role.value, content=message.content) if message.role == Role.USER
+                else AIMessage(role=message.role.value, content=message.content)
+                for message in self.messages]
+
+    def to_records(self) -> List[Tuple[str, str, bool]]:
+        """Returns the transcript as serializable (role, content, structured) records."""
+        return [(message.role.value, message.content, not isinstance(message.payload, str))
+                for message in self.messages]
+
+    @classmethod
+    def from_records(cls, records) -> "Transcript":
+        """Restores a transcript from records; (role, content) pairs of earlier versions are parsed like agent output."""
+        transcript = cls()
+        for role, content, *structured in records:
+            if not structured or structured[0]:
+                transcript.append(Role(role), content)
+            else:
+                transcript.append_text(Role(role), content)
+        return transcript
@@ -0,0 +1,207 @@
+"""Token and cost ledger of the agent calls with per-session and per-process budgets."""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from llm_utils.config_loader import get_config
+from llm_utils.deadlines import AgentError
+from llm_utils.instrumentation import Span, current_client
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+class BudgetExceededError(AgentError):
+    """Raised when a budget is exhausted and no cheaper model or cached content can stand in."""
+
+
+class UsageWriter:
+    """Writes ledger entries to SQLite from a background thread, one transaction per batch."""
+
+    def __init__(self, path: Path, batch_size: int = 100, flush_interval: float = 2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="usage-ledger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, entry: tuple):
+        """Queues an entry for the next batch."""
+        self._queue.put(entry)
+
+    def close(self):
+        """Writes the queued entries and stops the writer."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _write(self):
+        db = sqlite3.connect(str(self.path))
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "time REAL NOT NULL, session TEXT, client TEXT, agent TEXT NOT NULL, model TEXT NOT NULL, "
+            "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, cost REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS usage_session ON usage (session)")
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        closing = False
+        while not closing:
+            try:
+                entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                if entry is None:
+                    closing = True
+                else:
+                    batch.append(entry)
+            except queue.Empty:
+                pass
+            if batch and (closing or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                with db:
+                    db.executemany("INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+        db.close()
+
+
+class UsageLedger:
+    """
+    Sums tokens and estimated cost of every agent call per session, per client and per process.
+
+    Budgets are in USD. The session budget is charged to the client making the calls (a
+    browser tab, or a remote address of the service), so restarting the session does not
+    reset it. Once a client or the process is over budget, `over_budget` tells the agents
+    to degrade to a cheaper model or cached content.
+
+    At most `max_tracked` sessions and clients are kept in memory each; the least
+    recently charged ones are dropped first, which resets the budget of a client that
+    has been idle the longest.
+    """
+
+    def __init__(self, prices: Dict[str, Tuple[float, float]], session_budget: Optional[float] = None,
+                 process_budget: Optional[float] = None, writer: Optional[UsageWriter] = None,
+                 max_tracked: int = 10000):
+        self.prices = prices  # USD per 1000 prompt and completion tokens by model name
+        self.session_budget = session_budget
+        self.process_budget = process_budget
+        self.writer = writer
+        self.max_tracked = max_tracked
+        self.sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self.clients: "OrderedDict[str, float]" = OrderedDict()
+        self.total_cost = 0.0
+        self._lock = threading.Lock()
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """Returns the estimated cost of a call; models without a price are free."""
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def charge(self, span: Span):
+        """Books the tokens of a finished agent call."""
+        if not span.prompt_tokens and not span.completion_tokens:
+            return
+        cost = self.cost(span.model, span.prompt_tokens, span.completion_tokens)
+        with self._lock:
+            if span.session is not None:
+                usage = self._touch(self.sessions, span.session,
+                                    lambda: {"prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+                usage["prompt_tokens"] += span.prompt_tokens
+                usage["completion_tokens"] += span.completion_tokens
+                usage["cost"] += cost
+            if span.client is not None:
+                self.clients[span.client] = self._touch(self.clients, span.client, float) + cost
+            self.total_cost += cost
+        if self.writer is not None:
+            self.writer.append((span.start, span.session, span.client, span.agent, span.model,
+                                span.prompt_tokens, span.completion_tokens, cost))
+
+    def _touch(self, entries: OrderedDict, key: str, default: Callable[[], Any]):
+        """Returns the entry of a key as the most recent one, dropping the oldest entries over the cap."""
+        if key in entries:
+            entries.move_to_end(key)
+            return entries[key]
+        entries[key] = value = default()
+        while len(entries) > self.max_tracked:
+            entries.popitem(last=False)
+        return value
+
+    def session_usage(self, session_id: str) -> dict:
+        """Returns the tokens and cost of a session in this process."""
+        with self._lock:
+            return dict(self.sessions.get(session_id) or {"prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+
+    def over_budget(self, client: Optional[str] = None) -> bool:
+        """Returns whether the process or the client has spent its budget."""
+        with self._lock:
+            if self.process_budget is not None and self.total_cost >= self.process_budget:
+                return True
+            return (client is not None and self.session_budget is not None
+                    and self.clients.get(client, 0.0) >= self.session_budget)
+
+
+_default_ledger: Optional[UsageLedger] = None
+_default_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Returns the process-wide ledger with the prices and budgets of the config."""
+    global _default_ledger
+    with _default_ledger_lock:
+        if _default_ledger is None:
+            usage = get_config().usage
+            _default_ledger = UsageLedger(
+                usage.prices_per_1k_tokens, usage.session_budget_usd, usage.process_budget_usd,
+                UsageWriter(ROOT_DIR / usage.ledger_file) if usage.ledger_file else None,
+                usage.max_tracked)
+    return _default_ledger
+
+
+def budget_exceeded() -> bool:
+    """Returns whether calls of the current client should degrade."""
+    return get_usage_ledger().over_budget(current_client())
+
+
+def degraded_model_name() -> Optional[str]:
+    """Returns the cheaper model used once a budget is exceeded, if one is configured."""
+    return get_config().usage.degraded_model
+
+
+class DegradedAgent:
+    """The agent on the cheaper model, built on first use since most processes never exceed a budget."""
+
+    def __init__(self, build: Callable[[str], Any], model_name: str):
+        self.build = build
+        self.model_name = model_name
+        self._agent = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the agent, building it on the first call."""
+        if self._agent is None:
+            with self._lock:
+                if self._agent is None:
+                    self._agent = self.build(self.model_name)
+        return self._agent
+
+
+def degraded_agent(build: Callable[[str], Any], model_name: str) -> Optional[DegradedAgent]:
+    """Returns the lazily built agent on the degraded model, or None if none is configured other than `model_name`."""
+    model_name_degraded = degraded_model_name()
+    if not model_name_degraded or model_name_degraded == model_name:
+        return None
+    return DegradedAgent(build, model_name_degraded)
+
+
+def select_agent(agent, degraded: Optional[DegradedAgent] = None):
+    """Returns the agent to call: the given one within budget, otherwise the one on the cheaper model."""
+    if not budget_exceeded():
+        return agent
+    if degraded is None:
+        raise BudgetExceededError("The usage budget is exhausted.")
+    return degraded.get()
@@ -1,18 +1,22 @@
 """Streamlit app module for interactive chat management and display."""
 from typing import Optional
-import random
-import json
 import streamlit as st
-from langchain_core.messages import HumanMessage, AIMessage
-from streamlit_utils.ui_creator import display_question_answer, display_user_answer
-from streamlit_utils.initialization import initialize_session
+from langchain_core.messages import HumanMessage
+from streamlit_utils.ui_creator import display_answered_question, display_question_answer, display_user_answer
+from streamlit_utils.initialization import get_client_id, initialize_session, save_session, delete_session
 from streamlit_utils.status import display_progress
+from streamlit_utils.view_models import QuestionView, TranscriptViews, transcript_views
 from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
 from llm_utils.conversation import Conversation
-from llm_utils.questioning import Questioning
-from llm_utils.analysing import Analysing
-from llm_utils.prompt_assembly import prompt_assembly, get_non_zero_properties
-from llm_utils.matching import match_car, get_full_name
+from llm_utils.prompt_assembly import prompt_assembly
+from llm_utils.questionnaire import QuestionnaireEngine, is_complete
+from llm_utils.session_store import SessionState
+from llm_utils.deadlines import AgentError
+from llm_utils.instrumentation import client_context, session_context
+from llm_utils.transcript import Role, Transcript
+
+# Finished rounds shown as chat messages; older ones are folded into one block to keep reruns flat
+RECENT_ROUNDS = 6
 
 
 def get_conversation() -> Optional[Conversation]:
@@ -20,14 +24,19 @@ def get_conversation() -> Optional[Conversation]:
     return st.session_state.get("conversation", None)
 
 
-def get_questioning() -> Optional[Questioning]:
-    """Retrieve the current questioning instance from Streamlit's session state."""
-    return st.session_state.get("questioning", None)
+def get_engine() -> QuestionnaireEngine:
+    """Retrieve the questionnaire engine from Streamlit's session state."""
+    return st.session_state.engine
+
 
+def get_state() -> SessionState:
+    """Retrieve the questionnaire state of the session."""
+    return st.session_state.questionnaire
 
-def get_analysing() -> Optional[Analysing]:
-    """Retrieve the current analysing instance from Streamlit's session state."""
-    return st.session_state.get("analysing", None)
+
+def get_transcript() -> Transcript:
+    """Retrieve the session transcript from Streamlit's session state."""
+    return get_state().transcript
 
 
 def handle_submission():
@@ -35,23 +44,17 @@ def handle_submission():
     user_input = st.session_state.input_text
     user_prompt = prompt_assembly(st.session_state.user_inputs, user_input)
     user_message = HumanMessage(role="user", content=user_prompt)
-    st.session_state.messages.append(user_message)
-    st.session_state.conv_history.append(user_message)
+    get_transcript().append_text(Role.USER, user_prompt)
 
     conversation_instance = get_conversation()
 
     with st.chat_message("assistant"):
-        stream_handler = StreamUntilSpecialTokenHandler(st.empty())
+        stream_handler = StreamUntilSpecialTokenHandler(st.empty(), cancel_on_special_token=True)
 
         textual_response, json_response = conversation_instance(
             user_message, stream_handler)
 
-        st.session_state.conv_history.append(AIMessage(
-            role="assistant", content=textual_response))
-        st.session_state.conv_history.append(
-            AIMessage(role="assistant", content=json_response))
-        st.session_state.messages.append(AIMessage(
-            role="assistant", content=json_response))
+        get_transcript().append(Role.ASSISTANT, json_response)
 
     st.session_state.input_text = ""
 
@@ -60,102 +63,79 @@ def handle_submission():
 
 
 def handle_questioning():
-    properties = separate_and_select()
-    st.session_state.last_properties = properties
-
-    questioning_instance = get_questioning()
-    persona = get_non_zero_properties(st.session_state.person)
-
-    question_answer = questioning_instance(properties, persona)
-
-    with st.chat_message("assistant"):
-        st.session_state.conv_history.append(
-            AIMessage(role="assistant", content=question_answer))
-        st.session_state.messages.append(AIMessage(
-            role="assistant", content=question_answer))
+    """Ask the next question and show it."""
+    get_engine().ask(st.session_state.session_id, get_state())
 
     st.session_state.user_inputs = {}
+    save_session()
     st.rerun()
 
 
-def separate_and_select():
-    output = []
-    zero_properties = []
-    non_zero_properties = []
-
-    for property, value in st.session_state.person.items():
-        if value == 0:
-            zero_properties.append(property)
-        else:
-            non_zero_properties.append(property)
-
-    num_new_properties = random.choice([2, 3])
-    selected_zero_properties = random.sample(
-        zero_properties, min(num_new_properties, len(zero_properties)))
-
-    selected_non_zero_property = None
-    if len(selected_zero_properties) == 2 and non_zero_properties:
-        selected_non_zero_property = random.choice(non_zero_properties)
-
-    output.extend(selected_zero_properties)
-    if selected_non_zero_property:
-        output.append(selected_non_zero_property)
-    return output
-
-
-def analyze_response(response, chat_container):
-    """Analyze the response and display the UI elements."""
-    data = json.loads(response)
-    analysing_instance = get_analysing()
-
-    analysis = analysing_instance(
-        data["question"], st.session_state.user_inputs[data["question"]], st.session_state.last_properties)
-
-    st.session_state.conv_history.append(
-        HumanMessage(role="user", content=analysis))
-    st.session_state.messages.append(
-        HumanMessage(role="user", content=analysis))
-
-    update_person(analysis)
-    if all(value != 0 for value in st.session_state.person.values()):
-        calculate_match(chat_container)
-
-
-def update_person(analysis):
-    data = json.loads(analysis)
-    for property in data["properties"]:
-        if st.session_state.person[property["property_name"]] != 0:
-            st.session_state.person[property["property_name"]] = (
-                st.session_state.person[property["property_name"]] + property["property_value"]) / 2
-        else:
-            st.session_state.person[property["property_name"]
-                                    ] = property["property_value"]
+def analyze_response(question_answer):
+    """Analyze the answer to the last question."""
+    user_answer = st.session_state.user_inputs[question_answer.question]
+    get_engine().answer(st.session_state.session_id, get_state(), user_answer)
 
 
 def calculate_match(chat_container):
-    conversation_instance = get_conversation()
-    person_values = list(st.session_state.person.values())
-    matches = match_car(person_values)
+    """Stream the recommendation of the best matching cars."""
+    with chat_container.chat_message("ai"):
+        stream_handler = StreamUntilSpecialTokenHandler(st.empty(), cancel_on_special_token=True)
+        get_engine().recommend(get_state(), stream_handler, get_conversation())
+
+
+def display_rounds(chat_container, views: TranscriptViews):
+    """Show the finished rounds as static content, folding all but the recent ones into one block."""
+    archive, recent = views.split(RECENT_ROUNDS)
+    if archive:
+        with chat_container.expander("Earlier questions"):
+            st.markdown(archive)
+    for view in recent:
+        if isinstance(view, QuestionView):
+            with chat_container.chat_message("assistant"):
+                display_answered_question(view)
+        else:
+            with chat_container.chat_message("ai"):
+                st.markdown(view.text)
 
-    car_string = ""
 
-    for i in range(min(3, len(matches))):
-        car_code = matches[i][1]
-        car_full_name = get_full_name(car_code)
-        car_string += f"{i+1}. {car_full_name}\n"
+@st.experimental_fragment
+def active_round():
+    """Show the open question, the progress and the controls; answering reruns only this part of the page."""
+    transcript = get_transcript()
+    open_question = transcript_views(transcript).update()
+    if open_question is not None:
+        with st.chat_message("assistant"):
+            display_question_answer(open_question, open_question.index, open_question.index)
 
-    with chat_container.chat_message("ai"):
-        stream_handler = StreamUntilSpecialTokenHandler(st.empty())
+    if transcript:
+        display_progress(get_state().person)
+    st.divider()
+    col1, col2 = st.columns(2)
 
-        persona_string = get_non_zero_properties(st.session_state.person)
+    if col2.button("Restart Session"):
+        clear_cache()
+        st.rerun()
 
-        textual_response = conversation_instance(
-            persona_string, car_string, stream_handler)
+    button_text = "Submit"
+    if len(transcript) == 0:
+        button_text = "Start the Journey"
 
-        st.session_state.conv_history.append(AIMessage(
-            role="ai", content=textual_response))
-        st.session_state.messages.append(AIMessage(
-            role="ai", content=textual_response))
+    if col1.button(button_text, type="primary"):
+        # Fragment reruns do not pass through main(), so the agent calls are tagged with the client here
+        with client_context(get_client_id()):
+            try:
+                # An analysis without a following question means the last question failed; only ask again
+                if transcript.last is not None and transcript.last.role == Role.ASSISTANT:
+                    analyze_response(transcript.last.payload)
+                if not is_complete(get_state()):
+                    handle_questioning()
+            except AgentError as e:
+                st.error(f"{e} Please try again.")
+            else:
+                # The recommendation is streamed by the full rerun
+                save_session()
+                st.rerun()
 
 
 def handle_sidebar():
@@ -189,6 +169,7 @@ def model_selection(agent):
 
 
 def clear_cache():
+    delete_session()
     keys = list(st.session_state.keys())
     for key in keys:
         st.session_state.pop(key)
@@ -199,53 +180,36 @@ def main():
     st.set_page_config(page_title="Carship", page_icon="❤️",
                        initial_sidebar_state="collapsed", menu_items=None)
     initialize_session()
-    # handle_sidebar()
-
-    # with st.expander("Debug Info"):
-    # st.write(st.session_state)
-
-    st.title("Carship")
-    st.subheader(
-        "Every 3 minutes an electric mercedes finds a new owner on carship.")
-
-    if st.session_state.messages:
-        st.divider()
-
-    chat_container = st.container()
-
-    for index, msg in enumerate(st.session_state.messages):
-        if msg.role == "assistant":
-            with chat_container.chat_message("assistant"):
-                display_question_answer(
-                    msg.content, index, len(st.session_state.messages)-1)
-        elif msg.role == "ai":
-            with chat_container.chat_message("ai"):
-                st.markdown(msg.content)
-        else:
-            # display_user_answer(msg.content)
-            # chat_container.chat_message(msg.role).write(msg.content)
-            pass
-
-    if st.session_state.messages:
-        display_progress()
-    st.divider()
-    col1, col2 = st.columns(2)
-
-    if col2.button("Restart Session"):
-        clear_cache()
-        st.rerun()
-
-    button_text = "Submit"
-    if len(st.session_state.messages) == 0:
-        button_text = "Start the Journey"
-
-    if col1.button(button_text, type="primary"):
-        if len(st.session_state.messages) > 0:
-            analyze_response(
-                st.session_state.messages[-1].content, chat_container)
-        # if last message is not from "ai"
-        if len(st.session_state.messages) == 0 or st.session_state.messages[-1].role != "ai":
-            handle_questioning()
+    with session_context(st.session_state.session_id), client_context(get_client_id()):
+        try:
+            # handle_sidebar()
+
+            # with st.expander("Debug Info"):
+            # st.write(st.session_state)
+
+            st.title("Carship")
+            st.subheader(
+                "Every 3 minutes an electric mercedes finds a new owner on carship.")
+
+            transcript = get_transcript()
+            if transcript:
+                st.divider()
+
+            chat_container = st.container()
+            views = transcript_views(transcript)
+            views.update()
+            display_rounds(chat_container, views)
+
+            if is_complete(get_state()) and transcript.last.role != Role.AI:
+                try:
+                    calculate_match(chat_container)
+                except AgentError as e:
+                    st.error(f"{e} Please try again.")
+
+            active_round()
+        finally:
+            # Also runs on st.rerun(), which stops the script with an exception
+            save_session()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""Asynchronous HTTP service running the questionnaire without Streamlit.
+
+Start it from the repository root with `OPENAI_API_KEY=... python service.py --port 8080`.
+
+    POST /sessions                          start a session and get the first question
+    POST /sessions/{id}/answers {"answer"}  answer the open question, get the next one
+    GET  /sessions/{id}                     person, transcript and completion of a session
+    GET  /sessions/{id}/result              recommendation streamed as server-sent events
+    GET  /metrics                           agent call metrics in the Prometheus text format
+"""
+import argparse
+import asyncio
+import json
+import os
+import uuid
+import weakref
+from aiohttp import web
+from llm_utils.agent_pool import get_agent_pool
+from llm_utils.config_loader import get_config
+from llm_utils.deadlines import AgentError
+from llm_utils.instrumentation import client_context, get_instrumentation, session_context
+from llm_utils.question_bank import get_question_bank
+from llm_utils.questionnaire import QuestionnaireEngine, QuestionnaireError, is_complete
+from llm_utils.session_store import SQLiteSessionStore, get_session_store
+from llm_utils.stream_handler import QueueHandler
+from llm_utils.transcript import Role
+from llm_utils.usage_ledger import BudgetExceededError
+
+
+def session_lock(request: web.Request, session_id: str) -> asyncio.Lock:
+    """Returns the lock serializing the requests of one session."""
+    locks = request.app["locks"]
+    lock = locks.get(session_id)
+    if lock is None:
+        lock = locks[session_id] = asyncio.Lock()
+    return lock
+
+
+async def load_existing(engine: QuestionnaireEngine, session_id: str):
+    """Returns the state of a known session or raises 404."""
+    # The stores do blocking I/O, which must not stall the event loop
+    state = await asyncio.to_thread(engine.store.load, session_id)
+    if state is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": "Unknown session"}), content_type="application/json")
+    return state
+
+
+def question_json(message) -> dict:
+    """Returns the QuestionAnswer of a question message."""
+    return message.payload.to_dict()
+
+
+async def start_session(request: web.Request) -> web.Response:
+    engine: QuestionnaireEngine = request.app["engine"]
+    session_id = uuid.uuid4().hex
+    async with session_lock(request, session_id):
+        state = await engine.aload(session_id)
+        question = await engine.aask(session_id, state)
+        await engine.asave(session_id, state)
+    return web.json_response({"session_id": session_id, "question": question_json(question)}, status=201)
+
+
+async def answer(request: web.Request) -> web.Response:
+    engine: QuestionnaireEngine = request.app["engine"]
+    session_id = request.match_info["session_id"]
+    try:
+        user_answer = (await request.json())["answer"]
+        if not isinstance(user_answer, str):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({"error": 'Expected a JSON body with an "answer"'}, status=400)
+
+    async with session_lock(request, session_id):
+        state = await load_existing(engine, session_id)
+        analysis = await engine.aanswer(session_id, state, user_answer)
+        response = {"analysis": analysis.payload.to_dict(), "complete": is_complete(state)}
+        if not response["complete"]:
+            response["question"] = question_json(await engine.aask(session_id, state))
+        await engine.asave(session_id, state)
+    return web.json_response(response)
+
+
+async def get_session(request: web.Request) -> web.Response:
+    engine: QuestionnaireEngine = request.app["engine"]
+    state = await load_existing(engine, request.match_info["session_id"])
+    return web.json_response({"person": state.person, "complete": is_complete(state),
+                              "transcript": [{"role": message.role.value, "content": message.content}
+                                             for message in state.transcript]})
+
+
+async def result(request: web.Request) -> web.StreamResponse:
+    engine: QuestionnaireEngine = request.app["engine"]
+    session_id = request.match_info["session_id"]
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+
+    async with session_lock(request, session_id):
+        state = await load_existing(engine, session_id)
+        if not is_complete(state):
+            return web.json_response({"error": "The questionnaire is not complete yet"}, status=409)
+        await response.prepare(request)
+
+        if state.transcript.last is not None and state.transcript.last.role == Role.AI:
+            text = state.transcript.last.payload
+        else:
+            queue: asyncio.Queue = asyncio.Queue()
+            with session_context(session_id):
+                # The task runs in a copy of the current context, so its spans carry the session
+                task = asyncio.ensure_future(engine.arecommend(state, QueueHandler(queue)))
+            task.add_done_callback(lambda _: queue.put_nowait(None))
+            disconnected = False
+            while (token := await queue.get()) is not None:
+                if disconnected:
+                    continue
+                try:
+                    await response.write(f"event: token\ndata: {json.dumps(token)}\n\n".encode("utf-8"))
+                except ConnectionResetError:
+                    # The recommendation is still completed and stored for a later request
+                    disconnected = True
+            text = await task
+            await engine.asave(session_id, state)
+            if disconnected:
+                return response
+
+    await response.write(f"event: done\ndata: {json.dumps({'text': text})}\n\n".encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=get_instrumentation().metrics.render(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+@web.middleware
+async def error_middleware(request: web.Request, handler):
+    """Maps flow and agent errors to JSON error responses."""
+    try:
+        return await handler(request)
+    except QuestionnaireError as e:
+        return web.json_response({"error": str(e)}, status=409)
+    except BudgetExceededError as e:
+        return web.json_response({"error": str(e)}, status=429)
+    except AgentError as e:
+        return web.json_response({"error": str(e)}, status=503)
+
+
+def client_id(request: web.Request) -> str:
+    """
+    Returns the client a request is charged to: the remote address, or behind a reverse proxy
+    the last address in the configured header, i.e. the one the proxy itself added.
+
+    Set `usage.client_header` only behind a proxy that sets the header, as clients can send any value.
+    """
+    header = get_config().usage.client_header
+    forwarded = request.headers.get(header, "") if header else ""
+    return forwarded.split(",")[-1].strip() or request.remote
+
+
+@web.middleware
+async def client_middleware(request: web.Request, handler):
+    """Charges the agent calls of a request to its client, so new sessions do not reset its budget."""
+    with client_context(client_id(request)):
+        return await handler(request)
+
+
+def create_app(engine: QuestionnaireEngine) -> web.Application:
+    """Creates the service application around a questionnaire engine."""
+    app = web.Application(middlewares=[error_middleware, client_middleware])
+    app["engine"] = engine
+    app["locks"] = weakref.WeakValueDictionary()
+    app.router.add_post("/sessions", start_session)
+    app.router.add_post("/sessions/{session_id}/answers", answer)
+    app.router.add_get("/sessions/{session_id}", get_session)
+    app.router.add_get("/sessions/{session_id}/result", result)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the questionnaire over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--sessions", default=None, help="SQLite session file, shared with the Streamlit app by default")
+    parser.add_argument("--fuse", action="store_true", help="rate answers and ask the next question in one call")
+    parser.add_argument("--no-prefetch", action="store_true", help="do not prefetch the following question")
+    parser.add_argument("--no-question-bank", action="store_true", help="do not serve pre-generated questions")
+    args = parser.parse_args()
+
+    api_keys = {"openai": os.environ.get("OPENAI_API_KEY"), "google": os.environ.get("GOOGLE_API_KEY")}
+    question_bank = None if args.no_question_bank else get_question_bank()
+    store = SQLiteSessionStore(args.sessions) if args.sessions else get_session_store()
+    engine = QuestionnaireEngine(get_agent_pool(api_keys, question_bank), store,
+                                 prefetch_questions=not args.no_prefetch, fuse_analysing_questioning=args.fuse)
+    web.run_app(create_app(engine), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
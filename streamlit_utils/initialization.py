@@ -1,8 +1,14 @@
 """Initialization of the session state and models."""
+import uuid
+from typing import Optional
 import streamlit as st
-from llm_utils.conversation import Conversation
-from llm_utils.questioning import Questioning
-from llm_utils.analysing import Analysing
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from llm_utils.agent_pool import get_agent_pool
+from llm_utils.model_registry import get_model_registry
+from llm_utils.questionnaire import QuestionnaireEngine
+from llm_utils.question_bank import get_question_bank
+from llm_utils.session_store import (SessionState, dumps, get_session_secret, get_session_store, loads,
+                                     session_id_from_token, session_token)
 
 
 def get_api_key(provider):
@@ -32,6 +38,63 @@ def initialize_models():
     st.session_state["sel_model_conversation"] = st.session_state["supp_models_conversation"][0]
     st.session_state["sel_model_ui"] = st.session_state["supp_models_ui"][0]
 
+    st.session_state["prefetch_questions"] = True
+    st.session_state["fuse_analysing_questioning"] = False
+    st.session_state["serve_question_bank"] = True
+
+
+def get_session_id() -> str:
+    """
+    Get the session id from the signed token in the URL, creating a session if there is no valid one.
+
+    The signature keeps clients from choosing or forging session ids. The session link
+    itself is a bearer credential, which is an accepted risk: whoever has the link can
+    resume the session, including restarting and so deleting it.
+    """
+    token = st.query_params.get("session")
+    session_id = session_id_from_token(token, get_session_secret()) if token else None
+    if session_id is None:
+        session_id = uuid.uuid4().hex
+        st.query_params["session"] = session_token(session_id, get_session_secret())
+    return session_id
+
+
+def get_client_id() -> Optional[str]:
+    """Get the id of the browser tab's connection, which outlives a restarted session."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def load_session():
+    """Load the questionnaire state of the session from the session store."""
+    session_id = get_session_id()
+    blob = get_session_store().load_blob(session_id)
+    if session_id == st.session_state.get("session_id") and blob == st.session_state.get("session_blob"):
+        return  # This process holds the latest state already
+
+    st.session_state.session_id = session_id
+    st.session_state.session_blob = blob
+    st.session_state.questionnaire = loads(blob) if blob is not None else SessionState()
+    # The conversation memory is rebuilt from the transcript of the loaded state
+    st.session_state.pop("conversation", None)
+
+
+def save_session():
+    """Write the questionnaire state of the session to the session store if it changed."""
+    if "session_id" not in st.session_state:
+        return
+    blob = dumps(st.session_state.questionnaire)
+    if blob != st.session_state.get("session_blob"):
+        get_session_store().save_blob(st.session_state.session_id, blob)
+        st.session_state.session_blob = blob
+
+
+def delete_session():
+    """Remove the session from the session store and start a new one on the next run."""
+    if "session_id" in st.session_state:
+        get_session_store().delete(st.session_state.session_id)
+    st.query_params.clear()
+
 
 def initialize_session():
     """Set default values in the session state if not already initialized."""
@@ -43,40 +106,22 @@ def initialize_session():
     for provider in st.session_state["supported_providers"]:
         api_keys[provider] = get_api_key(provider)
 
+    get_model_registry().warm_up(api_keys)
+
+    load_session()
+
+    # Stateless agents come from the process-wide pool instead of being created per session
+    question_bank = get_question_bank() if st.session_state["serve_question_bank"] else None
+    pool = get_agent_pool(api_keys, question_bank)
+    if "engine" not in st.session_state:
+        st.session_state["engine"] = QuestionnaireEngine(
+            pool, get_session_store(), st.session_state["prefetch_questions"],
+            st.session_state["fuse_analysing_questioning"])
     if "conversation" not in st.session_state:
-        st.session_state["conversation"] = Conversation(api_keys)
-    if "questioning" not in st.session_state:
-        st.session_state["questioning"] = Questioning(api_keys)
-    if "analysing" not in st.session_state:
-        st.session_state["analysing"] = Analysing(api_keys)
-
-    if "messages" not in st.session_state:
-        st.session_state["messages"] = []
-    if "conv_history" not in st.session_state:
-        st.session_state["conv_history"] = []
+        st.session_state["conversation"] = st.session_state["engine"].conversation(st.session_state.questionnaire)
+
     if "user_inputs" not in st.session_state:
         st.session_state["user_inputs"] = {}
 
     if 'input_text' not in st.session_state:
         st.session_state.input_text = "I want to buy an electric car"
-
-    if 'last_properties' not in st.session_state:
-        st.session_state.last_properties = []
-
-    if 'person' not in st.session_state:
-        st.session_state.person = {
-            "Aged": 0,
-            "Male": 0,
-            "Wealthy": 0,
-            "Urban Living": 0,
-            "Comfort": 0,
-            "Information Needs": 0,
-            "Convenience": 0,
-            "Car Dependence": 0,
-            "Price Sensitivity": 0,
-            "Brand Loyalty": 0,
-            "Has Kids": 0,
-            "Digital Features": 0,
-            "Sustainability": 0,
-            "Drive Range": 0
-        }
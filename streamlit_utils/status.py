@@ -1,6 +1,6 @@
 import streamlit as st
 
-def display_progress():
+def display_progress(person):
     zero_count = 0
     non_zero_count = 0
 
@@ -21,7 +21,7 @@ def display_progress():
         "All done! Thanks for sticking around. Let’s see the results!"
     ]
 
-    for value in st.session_state.person.values():
+    for value in person.values():
         if value == 0:
             zero_count += 1
         else:
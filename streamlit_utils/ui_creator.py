@@ -1,19 +1,23 @@
 import streamlit as st
 import json
 from typing import List
+from streamlit_utils.view_models import view_markdown
 
 def display_question_answer(question_answer, message_index, last_message_index):
     key = f"{message_index}"
-    data = json.loads(question_answer)
-    selected_answer = display_question(data["answers"], data["question"], key)
+    selected_answer = display_question(question_answer.answers, question_answer.question, key)
     if selected_answer and message_index == last_message_index:
-        st.session_state.user_inputs[data["question"]] = selected_answer
+        st.session_state.user_inputs[question_answer.question] = selected_answer
 
     
 
+def display_answered_question(view):
+    """Displays an answered question as static text instead of widgets."""
+    st.markdown(view_markdown(view))
+
+
 def display_user_answer(question_answer):
-    data = json.loads(question_answer)
-    output = ", ".join(st.session_state.user_inputs[data["question"]])
+    output = ", ".join(st.session_state.user_inputs[question_answer.question])
     st.markdown(output)
 
 def display_question(options: List[str], label: str, key: str):
@@ -72,8 +76,7 @@ def display_slider(element, label, key):
 
 def display_radio_buttons(element, label, key):
     """Displays radio buttons UI element."""
-    options = element.get('options', [])
-    options.append("None")
+    options = [*element.get('options', []), "None"]
     selected_option = st.radio(label, options, key=key)
     return selected_option
 
@@ -0,0 +1,77 @@
+"""Immutable per-round view models of the transcript, built once per message and cached in the session."""
+from typing import List, NamedTuple, Optional, Tuple, Union
+import streamlit as st
+from llm_utils.transcript import QuestionPayload, Role, Transcript
+
+
+class QuestionView(NamedTuple):
+    """A question with its possible answers and, once answered, the user's answer."""
+    index: int
+    question: str
+    answers: Tuple[str, ...]
+    answer: Optional[str] = None
+
+
+class RecommendationView(NamedTuple):
+    """A recommendation of the conversational agent."""
+    index: int
+    text: str
+
+
+View = Union[QuestionView, RecommendationView]
+
+
+def view_markdown(view: View) -> str:
+    """Returns the static markdown of a finished round."""
+    if isinstance(view, RecommendationView):
+        return view.text
+    return f"**{view.question}**  \n{view.answer}" if view.answer else f"**{view.question}**"
+
+
+class TranscriptViews:
+    """Views of the finished rounds of one transcript; the open question is not cached, as it still changes."""
+    __slots__ = ("transcript", "finished", "consumed", "archive", "archived")
+
+    def __init__(self, transcript: Transcript):
+        self.transcript = transcript
+        self.finished: List[View] = []
+        self.consumed = 0  # Number of messages covered by the finished views
+        self.archive = ""  # Markdown of the oldest finished views, extended as rounds age
+        self.archived = 0
+
+    def split(self, recent: int) -> Tuple[str, List[View]]:
+        """Returns the markdown of all but the `recent` last finished views, and those views."""
+        end = max(len(self.finished) - recent, 0)
+        if end > self.archived:
+            parts = [view_markdown(view) for view in self.finished[self.archived:end]]
+            self.archive = "\n\n---\n\n".join(([self.archive] if self.archive else []) + parts)
+            self.archived = end
+        return self.archive, self.finished[self.archived:]
+
+    def update(self) -> Optional[QuestionView]:
+        """Builds the views of rounds finished since the last update and returns the open question, if any."""
+        messages = self.transcript.messages
+        index = self.consumed
+        while index < len(messages):
+            message = messages[index]
+            if message.role == Role.AI:
+                self.finished.append(RecommendationView(index, message.payload))
+            elif message.role == Role.ASSISTANT and isinstance(message.payload, QuestionPayload):
+                following = messages[index + 1] if index + 1 < len(messages) else None
+                if following is None:
+                    # Stays open until the answer is recorded
+                    return QuestionView(index, message.payload.question, message.payload.answers)
+                answer = following.payload if following.role == Role.USER and isinstance(following.payload, str) else None
+                self.finished.append(QuestionView(index, message.payload.question, message.payload.answers, answer))
+            index += 1
+            self.consumed = index
+        return None
+
+
+def transcript_views(transcript: Transcript) -> TranscriptViews:
+    """Returns the cached views of the transcript, building only the rounds finished since the last rerun."""
+    views = st.session_state.get("transcript_views")
+    # A restored session brings a new transcript object, whose views are built from scratch
+    if views is None or views.transcript is not transcript:
+        views = st.session_state["transcript_views"] = TranscriptViews(transcript)
+    return views
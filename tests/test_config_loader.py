@@ -0,0 +1,45 @@
+"""Tests of the reloading of the config files and of the agents applying them."""
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+import llm_utils.agents as agents
+from llm_utils.config_loader import ConfigError, ConfigFile, get_config, parse_config
+
+
+def test_failed_first_load_raises_on_every_get(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text("{broken")
+    config_file = ConfigFile(path, parse_config, check_interval=0)
+    for _ in range(2):
+        with pytest.raises(ConfigError):
+            config_file.get()
+
+
+def test_broken_edit_keeps_the_loaded_version_until_fixed(tmp_path):
+    path = tmp_path / "config.json"
+    data = get_config().model_dump()
+    path.write_text(json.dumps(data))
+    config_file = ConfigFile(path, parse_config, check_interval=0)
+    loaded = config_file.get()
+
+    path.write_text("{broken")
+    assert config_file.get() is loaded
+
+    data["ui_prompt"] = "Fixed"
+    path.write_text(json.dumps(data))
+    assert config_file.get().ui_prompt == "Fixed"
+    assert config_file.version == 2
+
+
+def test_refresh_config_swaps_the_prompt_and_chains_together(monkeypatch):
+    agent = agents.QuestioningAgent(FakeListChatModel(responses=["{}"]))
+    chain, counters = agent.chain, agent.counters
+    config = get_config().model_copy(update={"questioning_prompt": "Reloaded", "structured_output": True})
+    monkeypatch.setattr(agents, "get_config", lambda: config)
+
+    agent.refresh_config()
+
+    assert agent.config is config
+    assert agent.system_prompt == "Reloaded"
+    assert agent.chain is not chain
+    assert agent.counters is counters
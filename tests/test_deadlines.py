@@ -0,0 +1,148 @@
+"""Tests of the deadlines and hedged requests of the agent calls."""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+from langchain_core.language_models.chat_models import SimpleChatModel
+from openai import APITimeoutError
+from llm_utils import deadlines
+from llm_utils.agents import QuestioningAgent
+from llm_utils.deadlines import AgentTimeoutError, ahedged_call, hedged_call
+
+
+def after(seconds: float, result=None, error: Exception = None):
+    def call():
+        time.sleep(seconds)
+        if error is not None:
+            raise error
+        return result
+    return call
+
+
+def test_primary_wins_before_the_hedge():
+    hedges = []
+    assert hedged_call(after(0.01, "primary"), after(0, "backup"), 0.5, on_hedge=lambda: hedges.append(1)) == "primary"
+    assert hedges == []
+
+
+def test_faster_backup_wins_after_the_hedge():
+    hedges = []
+    assert hedged_call(after(0.5, "primary"), after(0.01, "backup"), 0.05,
+                       on_hedge=lambda: hedges.append(1)) == "backup"
+    assert hedges == [1]
+
+
+def test_backup_wins_when_the_primary_fails():
+    assert hedged_call(after(0.06, error=ValueError("bad")), after(0.01, "backup"), 0.05) == "backup"
+
+
+def test_last_error_is_raised_when_every_call_failed():
+    # The backup fails at about 0.06 s, the primary later at 0.2 s
+    with pytest.raises(ValueError):
+        hedged_call(after(0.2, error=ValueError("last")), after(0.01, error=KeyError("first")), 0.05)
+
+
+def test_deadline_raises_timeout():
+    start = time.monotonic()
+    with pytest.raises(AgentTimeoutError):
+        hedged_call(after(0.5, "late"), deadline=0.05)
+    assert time.monotonic() - start < 0.3
+
+
+def test_async_deadline_cancels_the_call():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with pytest.raises(AgentTimeoutError):
+            await ahedged_call(slow, deadline=0.05)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == [True]
+
+
+def test_calls_run_inline_once_the_executor_shut_down(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.shutdown()
+    monkeypatch.setattr(deadlines, "_executor", executor)
+    assert hedged_call(after(0, "inline"), deadline=1.0) == "inline"
+
+
+class RaisingModel(SimpleChatModel):
+    error: Exception
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "raising"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+@pytest.mark.parametrize("error", [
+    APITimeoutError(request=httpx.Request("POST", "https://api.openai.com")),
+    httpx.ReadTimeout("read timed out"),
+])
+def test_request_timeouts_are_recorded_as_timeouts(error, caplog):
+    agent = QuestioningAgent(RaisingModel(error=error))
+    spans = []
+    agent.record_span = lambda span, status=None: spans.append(span)
+
+    assert agent(["Aged"], "") is None
+    assert [span.status for span in spans] == ["timeout"]
+    assert spans[0].error.startswith(type(error).__name__)
+    assert agent.counters["timeouts"] == 1
+    assert [record.levelname for record in caplog.records if record.name == "llm_utils.agents"] == ["WARNING"]
+
+
+def test_unexpected_errors_are_logged_and_recorded_on_the_span(caplog):
+    agent = QuestioningAgent(RaisingModel(error=RuntimeError("connection reset")))
+    spans = []
+    agent.record_span = lambda span, status=None: spans.append(span)
+
+    assert agent(["Aged"], "") is None
+    assert (spans[0].status, spans[0].error) == ("error", "RuntimeError: connection reset")
+    assert spans[0].to_dict()["error"] == "RuntimeError: connection reset"
+    record, = [record for record in caplog.records if record.name == "llm_utils.agents"]
+    assert record.levelname == "ERROR" and record.exc_info is not None
+
+
+def test_no_request_is_sent_after_the_deadline():
+    model = RaisingModel(error=RuntimeError("must not be called"))
+    agent = QuestioningAgent(model)
+    with pytest.raises(AgentTimeoutError):
+        agent.attempt(agent.chain, "prompt", {}, expires=time.monotonic() - 1)
+    assert model.calls == 0
+
+
+def test_each_attempt_gets_the_remaining_deadline():
+    timeouts = []
+
+    class RecordingModel(SimpleChatModel):
+        @property
+        def _llm_type(self):
+            return "recording"
+
+        def _call(self, messages, stop=None, run_manager=None, **kwargs):
+            timeouts.append(kwargs["timeout"])
+            time.sleep(0.1)
+            if len(timeouts) == 1:
+                return "not json"
+            return json.dumps({"question": "Q?", "answers": ["a", "b"]})
+
+    agent = QuestioningAgent(RecordingModel())
+    agent.deadline, agent.retry_backoff = 2.0, 0.01
+
+    assert agent(["Aged"], "")["question"] == "Q?"
+    assert timeouts[0] <= 2.0 and timeouts[1] < timeouts[0] - 0.1
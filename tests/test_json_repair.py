@@ -0,0 +1,98 @@
+"""Tests of the local repair of malformed completions and the coercion to the schemas."""
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from pydantic import ValidationError
+from llm_utils import json_repair
+from llm_utils.agents import PropertyMatchingAgent
+from llm_utils.json_repair import coerce_to_schema, repair_and_validate, repair_json
+from llm_utils.pydantic_models import PropertyRating, QuestionAnswer, RatingAndQuestion
+
+RATING = {"reasoning": "Likes nature.", "properties": [{"property_name": "Aged", "property_value": 3},
+                                                       {"property_name": "Comfort", "property_value": 4}]}
+QUESTION = {"question": "Where do you drive?", "answers": ["City", "Mountains", "Coast"]}
+
+
+@pytest.mark.parametrize("text", [
+    "```json\n" + json.dumps(RATING) + "\n```",
+    "Here is the rating: " + json.dumps(RATING),
+    json.dumps(RATING)[:-2] + ",]}",
+    json.dumps(RATING)[:-2],
+    json.dumps(RATING) + "}]",
+])
+def test_common_defects_are_repaired(text):
+    assert repair_json(text) == RATING
+
+
+def test_truncated_completion_drops_the_incomplete_member():
+    text = json.dumps(QUESTION)
+    truncated = text[:text.index("Coast") + 2]
+
+    assert repair_json(truncated) == {"question": "Where do you drive?", "answers": ["City", "Mountains"]}
+
+
+def test_cut_off_string_is_not_taken_for_a_complete_value():
+    truncated = '{"question": "Where do you drive?", "answers": ["City", "Moun'
+
+    assert repair_and_validate(truncated + 'tains", "Co', QuestionAnswer).answers == ["City", "Mountains"]
+    # A single answer is not a question the user can answer
+    with pytest.raises(ValidationError):
+        repair_and_validate(truncated, QuestionAnswer)
+
+
+def test_list_items_that_lost_required_fields_are_dropped():
+    text = json.dumps(RATING)
+    truncated = text[:text.index('"property_value": 4')]
+
+    rating = repair_and_validate(truncated, PropertyRating)
+
+    assert [(p.property_name, p.property_value) for p in rating.properties] == [("Aged", 3)]
+
+
+def test_missing_required_fields_are_not_invented():
+    text = json.dumps({"rating": RATING, "next_question": QUESTION})
+    truncated = text[:text.index('"next_question"')]
+
+    with pytest.raises(ValidationError):
+        repair_and_validate(truncated, RatingAndQuestion)
+    with pytest.raises(ValueError):
+        repair_and_validate('{"reasoning": "Likes', PropertyRating)
+
+
+def test_numbers_are_coerced_and_clamped():
+    data = {"reasoning": "", "properties": [{"property_name": "Aged", "property_value": "4"},
+                                            {"property_name": "Comfort", "property_value": 9},
+                                            {"property_name": "City", "property_value": 2.6}]}
+
+    rating = PropertyRating.model_validate(coerce_to_schema(data, PropertyRating))
+
+    assert [p.property_value for p in rating.properties] == [4, 5, 3]
+
+
+def test_unrepairable_text_raises_value_error():
+    with pytest.raises(ValueError):
+        repair_json("no JSON here")
+
+
+def test_truncation_repair_tries_a_bounded_number_of_cuts(monkeypatch):
+    calls = []
+    loads = json.loads
+    monkeypatch.setattr(json_repair.json, "loads", lambda text: calls.append(text) or loads(text))
+    text = json.dumps({"items": list(range(200))})[:-2] + ', "x'
+
+    repair_json(text + "::")
+
+    assert len(calls) <= 3 + json_repair.MAX_CUTS
+
+
+def test_agent_parses_without_langchain_partial_json(monkeypatch):
+    agent = PropertyMatchingAgent(FakeListChatModel(responses=["{}"]))
+    calls = []
+    loads = json.loads
+    monkeypatch.setattr(json, "loads", lambda text, **kwargs: calls.append(text) or loads(text, **kwargs))
+
+    rating = agent.parse(json.dumps(RATING)[:-1] + ",}")
+
+    assert len(rating.properties) == 2
+    assert agent.counters["repaired"] == 1
+    assert len(calls) <= 3
@@ -0,0 +1,151 @@
+"""Tests of the speculative question prefetch of the QuestionnaireEngine."""
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+from llm_utils import prefetch
+from llm_utils.car_catalog import PROPERTY_NAMES
+from llm_utils.questionnaire import QuestionnaireEngine
+from llm_utils.session_store import InMemorySessionStore, SessionState
+
+
+class FakeQuestioning:
+    """Stands in for Questioning, numbering the questions it generates."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, properties, persona):
+        self.calls.append((list(properties), persona))
+        return json.dumps({"question": f"Question {len(self.calls)}", "answers": ["Yes", "No"]})
+
+    async def acall(self, properties, persona):
+        return self(properties, persona)
+
+
+def rating(ratings: dict) -> str:
+    return json.dumps({"reasoning": "", "properties": [{"property_name": name, "property_value": value}
+                                                       for name, value in ratings.items()]})
+
+
+def engine_with_prefetch(questioning: FakeQuestioning) -> QuestionnaireEngine:
+    pool = SimpleNamespace(questioning=questioning)
+    return QuestionnaireEngine(pool, InMemorySessionStore(), prefetch_questions=True)
+
+
+def prefetched_state(engine: QuestionnaireEngine) -> SessionState:
+    """Returns a session that was just asked about Aged and the known Comfort, with a prefetch started."""
+    person = dict.fromkeys(PROPERTY_NAMES, 0)
+    person.update({"Comfort": 4, "Wealthy": 2})
+    state = SessionState(person, last_properties=["Aged", "Comfort"])
+    engine.start_prefetch("session", state)
+    return state
+
+
+def test_prefetched_question_is_handed_over_when_only_the_asked_properties_were_rated():
+    questioning = FakeQuestioning()
+    engine = engine_with_prefetch(questioning)
+    state = prefetched_state(engine)
+
+    engine.analysed("session", state, "Yes", rating({"Aged": 3, "Comfort": 4}))
+    prefetched = engine.take_prefetched("session", state)
+
+    assert prefetched is not None
+    properties, question_answer = prefetched
+    assert "Aged" not in properties and "Comfort" not in properties
+    assert json.loads(question_answer)["question"] == "Question 1"
+
+
+def test_prefetched_question_is_rejected_when_a_known_rating_changed():
+    questioning = FakeQuestioning()
+    engine = engine_with_prefetch(questioning)
+    state = prefetched_state(engine)
+
+    # Comfort 4 and 2 average to 3: the persona the question was written for is outdated
+    engine.analysed("session", state, "No", rating({"Aged": 3, "Comfort": 2}))
+
+    assert not engine.prefetch_is_valid(state)({"Comfort": 4, "Wealthy": 2})
+    assert engine.take_prefetched("session", state) is None
+    assert engine.prefetcher("session").future is None
+
+
+def test_rejected_prefetch_is_regenerated_with_the_updated_persona():
+    questioning = FakeQuestioning()
+    engine = engine_with_prefetch(questioning)
+    state = prefetched_state(engine)
+    engine.analysed("session", state, "No", rating({"Aged": 3, "Comfort": 2}))
+    engine.prefetcher("session").future.result()
+
+    message = engine.ask("session", state)
+
+    assert message.payload.question != "Question 1"
+    properties, persona = questioning.calls[-1]
+    assert "Comfort 3" in persona and "Aged 3" in persona
+
+
+def test_prefetched_question_is_rejected_when_one_of_its_new_properties_was_rated():
+    questioning = FakeQuestioning()
+    engine = engine_with_prefetch(questioning)
+    state = prefetched_state(engine)
+    new_property = next(prop for prop in engine.prefetcher("session").properties if state.person[prop] == 0)
+
+    engine.analysed("session", state, "Yes", rating({"Aged": 3, "Comfort": 4, new_property: 5}))
+
+    assert engine.take_prefetched("session", state) is None
+
+
+def test_prefetch_runs_as_task_on_the_event_loop():
+    questioning = FakeQuestioning()
+    engine = engine_with_prefetch(questioning)
+
+    async def ask_twice():
+        state = SessionState(dict.fromkeys(PROPERTY_NAMES, 0))
+        await engine.aask("session", state)
+        assert isinstance(engine.prefetcher("session").future, asyncio.Task)
+        return await engine.aask("session", state)
+
+    message = asyncio.run(ask_twice())
+
+    assert message.payload.question == "Question 2"
+    assert len(questioning.calls) == 3
+
+
+def test_discarded_prefetch_task_is_cancelled():
+    class SlowQuestioning(FakeQuestioning):
+        async def acall(self, properties, persona):
+            await asyncio.sleep(10)
+
+    engine = engine_with_prefetch(SlowQuestioning())
+
+    async def discard():
+        engine.prefetcher("session", create=True).start(["Aged"], "")
+        task = engine.prefetcher("session").future
+        engine.discard_prefetch("session")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return task
+
+    assert asyncio.run(discard()).cancelled()
+
+
+def test_prefetch_is_skipped_while_every_thread_is_busy(monkeypatch):
+    monkeypatch.setattr(prefetch, "_slots", threading.BoundedSemaphore(2))
+    release = threading.Event()
+
+    class BlockingQuestioning(FakeQuestioning):
+        def __call__(self, properties, persona):
+            release.wait(5)
+            return super().__call__(properties, persona)
+
+    questioning = BlockingQuestioning()
+    engine = engine_with_prefetch(questioning)
+    prefetchers = [engine.prefetcher(f"session {i}", create=True) for i in range(3)]
+    try:
+        for prefetcher in prefetchers:
+            prefetcher.start(["Aged"], "")
+        assert prefetchers[-1].future is None
+        assert all(prefetcher.future is not None for prefetcher in prefetchers[:-1])
+    finally:
+        release.set()
+    for prefetcher in prefetchers[:-1]:
+        prefetcher.future.result()
@@ -0,0 +1,126 @@
+"""Tests of the two-tier response cache."""
+import asyncio
+import threading
+import time
+from llm_utils.response_cache import ResponseCache
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = ResponseCache(ttl=10)
+    cache.set("key", {"a": 1})
+
+    now[0] += 9
+    assert cache.get("key") == {"a": 1}
+    now[0] += 2
+    assert cache.get("key") is None
+
+
+def test_sqlite_tier_is_shared_between_instances(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    ResponseCache(path).set("key", {"a": 1})
+
+    cache = ResponseCache(path)
+    assert cache.get("key") == {"a": 1}
+    assert cache.get("key") == {"a": 1}
+    assert (cache.counters["disk_hits"], cache.counters["memory_hits"]) == (1, 1)
+
+
+def test_none_results_are_not_cached():
+    cache = ResponseCache()
+    calls = []
+    for _ in range(2):
+        assert cache.get_or_compute("key", lambda: calls.append(1)) is None
+    assert len(calls) == 2
+
+
+def test_concurrent_callers_compute_once():
+    cache = ResponseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"a": 1}
+
+    results = []
+    # Callers keep arriving before, during and just after the computation
+    threads = [threading.Timer(index * 0.005, lambda: results.append(cache.get_or_compute("key", compute)))
+               for index in range(30)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"a": 1}] * 30
+
+
+def test_caller_arriving_as_the_owner_finishes_does_not_compute_again():
+    cache = ResponseCache()
+    calls = []
+    owner_done = threading.Event()
+    disk_get = cache._disk_get
+
+    def slow_disk_get(key, now):
+        # Holds the late caller between a miss and the registration of an owner
+        if threading.current_thread().name == "late":
+            owner_done.wait(1)
+        return disk_get(key, now)
+
+    cache._disk_get = slow_disk_get
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"a": 1}
+
+    def owner():
+        cache.get_or_compute("key", compute)
+        owner_done.set()
+
+    results = []
+    first = threading.Thread(target=owner)
+    late = threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)), name="late")
+    first.start()
+    time.sleep(0.01)
+    late.start()
+    first.join()
+    late.join()
+
+    assert results == [{"a": 1}]
+    assert len(calls) == 1
+
+
+def test_async_callers_share_one_task(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"a": 1}
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_compute("key", compute) for _ in range(10)))
+
+    assert asyncio.run(run()) == [{"a": 1}] * 10
+    assert len(calls) == 1
+    assert ResponseCache(tmp_path / "cache.sqlite3").get("key") == {"a": 1}
+
+
+def test_failed_computation_is_raised_to_every_caller_and_retried():
+    cache = ResponseCache()
+
+    def fail():
+        raise ValueError("no response")
+
+    for _ in range(2):
+        try:
+            cache.get_or_compute("key", fail)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("expected the error")
+    assert cache.get_or_compute("key", lambda: {"a": 1}) == {"a": 1}
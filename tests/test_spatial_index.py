@@ -0,0 +1,77 @@
+"""Tests of the KD-tree matching backend against the brute-force catalog."""
+import numpy
+import pytest
+from llm_utils import matching
+from llm_utils.car_catalog import CarCatalog
+from llm_utils.spatial_index import IndexedCatalog
+
+
+@pytest.fixture
+def catalog():
+    rng = numpy.random.default_rng(7)
+    size = 2000
+    return CarCatalog(
+        [f"car-{index}" for index in range(size)],
+        rng.integers(0, 6, size=(size, 14)),
+        rng.uniform(0.5, 2.0, size=14),
+        metadata={"body_type": rng.choice(["suv", "sedan", "van"], size=size),
+                  "base_price_eur": rng.uniform(20000, 90000, size=size)})
+
+
+@pytest.fixture
+def personas():
+    return numpy.random.default_rng(11).uniform(0, 5, size=(20, 14))
+
+
+def distances_of(matches):
+    return [distance for distance, _ in matches]
+
+
+@pytest.mark.parametrize("where", [
+    None,
+    {"body_type": "suv"},
+    {"body_type": ["van", "sedan"], "base_price_eur": (30000, 60000)},
+    {"base_price_eur": (None, 21000)},
+])
+def test_tree_matches_brute_force(catalog, personas, where):
+    index = IndexedCatalog(catalog, leaf_size=32)
+    for persona in personas:
+        expected = catalog.top_k(persona, 10, where)
+        found = index.top_k(persona, 10, where)
+        # Ties may be ordered differently, the distances must agree
+        assert distances_of(found) == pytest.approx(distances_of(expected))
+        assert all(distance == pytest.approx(catalog.distances(persona)[int(code[4:])]) for distance, code in found)
+
+
+@pytest.mark.parametrize("where", [None, {"body_type": "van", "base_price_eur": (40000, 80000)}])
+def test_batches_of_both_backends_agree(catalog, personas, where):
+    index = IndexedCatalog(catalog, leaf_size=32)
+    brute_force = catalog.top_k_batch(personas, 5, where)
+    indexed = index.top_k_batch(personas, 5, where)
+
+    assert isinstance(brute_force, list) and isinstance(brute_force[0][0], tuple)
+    assert len(brute_force) == len(indexed) == len(personas)
+    for expected, found in zip(brute_force, indexed):
+        assert distances_of(found) == pytest.approx(distances_of(expected))
+    for expected, found in zip((catalog.top_k(persona, 5, where) for persona in personas), brute_force):
+        assert [code for _, code in found] == [code for _, code in expected]
+        assert distances_of(found) == pytest.approx(distances_of(expected))
+
+
+def test_k_beyond_the_filtered_cars_returns_all_of_them(catalog, personas):
+    where = {"base_price_eur": (None, 21000)}
+    count = int(catalog.filter_mask(where).sum())
+
+    assert len(catalog.top_k(personas[0], count + 5, where)) == count
+    assert len(IndexedCatalog(catalog, brute_force_below=0).top_k(personas[0], count + 5, where)) == count
+    assert [len(row) for row in catalog.top_k_batch(personas[:2], count + 5, where)] == [count, count]
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_k_of_zero_returns_no_cars(catalog, personas, monkeypatch, indexed):
+    monkeypatch.setattr(matching, "_default_catalog", catalog)
+    monkeypatch.setattr(matching, "_default_index", None)
+
+    assert matching.match_car(personas[0], k=0, indexed=indexed) == []
+    assert len(matching.match_car(personas[0], indexed=indexed)) == len(catalog)
+    assert catalog.top_k_batch(personas[:2], 0) == [[], []]
@@ -0,0 +1,47 @@
+"""Tests of native structured output and its fallback to format instructions, against fake chat models."""
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from benchmarks.bench_structured_output import CASES, FakeToolCallingChatModel
+from llm_utils.structured_output import tool_arguments
+
+CASE_IDS = [agent_class.__name__ for agent_class, _, _ in CASES]
+
+
+@pytest.mark.parametrize("agent_class, inputs, response", CASES, ids=CASE_IDS)
+def test_tool_binding_path(agent_class, inputs, response):
+    tool_model = FakeToolCallingChatModel(arguments=[json.dumps(response)])
+    agent = agent_class(tool_model)
+
+    assert agent.structured
+    assert agent.invoke(inputs) == response
+    assert tool_model.calls[-1]["tool_choice"] == agent_class.pydantic_object.__name__
+    assert tool_model.calls[-1]["tools"][0]["function"]["name"] == agent_class.pydantic_object.__name__
+    # The schema travels as the tool, not as format instructions in the prompt
+    assert agent.parser.get_format_instructions() not in agent.prompt.format(**inputs)
+
+
+@pytest.mark.parametrize("agent_class, inputs, response", CASES, ids=CASE_IDS)
+def test_tool_arguments_are_repaired_locally(agent_class, inputs, response):
+    # A trailing comma is repaired without calling the model again
+    tool_model = FakeToolCallingChatModel(arguments=[json.dumps(response)[:-1] + ",}"])
+    agent = agent_class(tool_model)
+
+    assert agent.invoke(inputs) == response
+    assert agent.counters["repaired"] == 1
+    assert agent.counters["retried"] == 0
+    assert len(tool_model.calls) == 1
+
+
+@pytest.mark.parametrize("agent_class, inputs, response", CASES, ids=CASE_IDS)
+def test_text_parser_fallback(agent_class, inputs, response):
+    agent = agent_class(FakeListChatModel(responses=[json.dumps(response)]))
+
+    assert not agent.structured
+    assert agent.parser.get_format_instructions() in agent.prompt.format(**inputs)
+    assert agent.invoke(inputs) == response
+
+
+def test_tool_arguments_falls_back_to_message_content():
+    assert tool_arguments(AIMessage(content='{"a": 1}')) == '{"a": 1}'
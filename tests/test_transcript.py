@@ -0,0 +1,43 @@
+"""Tests of the transcript payloads and their serialization."""
+import json
+from llm_utils.session_store import SessionState, dumps, loads
+from llm_utils.transcript import QuestionPayload, RatingPayload, Role, Transcript, parse_payload
+
+QUESTION_JSON = json.dumps({"question": "Where do you drive?", "answers": ["City", "Mountains"]})
+RATING_JSON = json.dumps({"reasoning": "", "properties": [{"property_name": "Comfort", "property_value": 4}]})
+
+
+def test_user_text_that_looks_like_json_stays_text():
+    transcript = Transcript()
+    transcript.append(Role.ASSISTANT, QUESTION_JSON)
+    answer = transcript.append_text(Role.USER, '{"properties": 1}')
+    rating = transcript.append(Role.USER, RATING_JSON)
+
+    assert answer.payload == '{"properties": 1}'
+    assert isinstance(rating.payload, RatingPayload)
+
+
+def test_structure_survives_the_session_store():
+    transcript = Transcript()
+    transcript.append(Role.ASSISTANT, QUESTION_JSON)
+    transcript.append_text(Role.USER, RATING_JSON)
+    transcript.append(Role.USER, RATING_JSON)
+
+    restored = loads(dumps(SessionState(transcript=transcript))).transcript
+
+    assert isinstance(restored[0].payload, QuestionPayload)
+    assert restored[1].payload == RATING_JSON
+    assert isinstance(restored[2].payload, RatingPayload)
+
+
+def test_records_of_earlier_versions_are_parsed():
+    restored = Transcript.from_records([("assistant", QUESTION_JSON), ("user", "City"), ("user", RATING_JSON)])
+
+    assert isinstance(restored[0].payload, QuestionPayload)
+    assert restored[1].payload == "City"
+    assert isinstance(restored[2].payload, RatingPayload)
+
+
+def test_payload_of_the_wrong_shape_stays_text():
+    assert parse_payload('{"properties": 1}') == '{"properties": 1}'
+    assert parse_payload('{"question": "Q", "answers": 1}') == '{"question": "Q", "answers": 1}'
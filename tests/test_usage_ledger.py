@@ -0,0 +1,101 @@
+"""Tests of the usage ledger, its budgets and the degraded agents."""
+import contextvars
+import threading
+import pytest
+from llm_utils import usage_ledger
+from llm_utils.instrumentation import Span, client_context
+from llm_utils.usage_ledger import BudgetExceededError, DegradedAgent, UsageLedger, degraded_agent, select_agent
+
+PRICES = {"expensive": (1.0, 2.0)}
+
+
+def span(prompt_tokens: int, completion_tokens: int, session="session", client="client", model="expensive"):
+    result = Span("QuestioningAgent", model, session, client)
+    result.prompt_tokens, result.completion_tokens = prompt_tokens, completion_tokens
+    return result
+
+
+def test_calls_are_charged_per_session_client_and_process():
+    ledger = UsageLedger(PRICES)
+    ledger.charge(span(1000, 500))
+    ledger.charge(span(2000, 0, session="other"))
+    ledger.charge(span(1000, 1000, model="free"))
+
+    assert ledger.cost("expensive", 1000, 500) == pytest.approx(2.0)
+    assert ledger.session_usage("session") == {"prompt_tokens": 2000, "completion_tokens": 1500, "cost": 2.0}
+    assert ledger.clients["client"] == pytest.approx(4.0)
+    assert ledger.total_cost == pytest.approx(4.0)
+    assert ledger.session_usage("unknown")["cost"] == 0.0
+
+
+def test_client_budget_outlives_its_sessions():
+    ledger = UsageLedger(PRICES, session_budget=3.0)
+    ledger.charge(span(1000, 500, session="first"))
+    assert not ledger.over_budget("client")
+
+    ledger.charge(span(1000, 0, session="second"))
+    assert ledger.over_budget("client")
+    assert not ledger.over_budget("someone else")
+    assert not ledger.over_budget(None)
+
+
+def test_process_budget_applies_to_every_client():
+    ledger = UsageLedger(PRICES, process_budget=2.0)
+    ledger.charge(span(2000, 0, client="heavy"))
+
+    assert ledger.over_budget("light") and ledger.over_budget(None)
+
+
+def test_least_recently_charged_entries_are_dropped_over_the_cap():
+    ledger = UsageLedger(PRICES, max_tracked=2)
+    for client in ("a", "b", "a", "c"):
+        ledger.charge(span(1000, 0, session=client, client=client))
+
+    assert list(ledger.clients) == ["a", "c"]
+    assert list(ledger.sessions) == ["a", "c"]
+    assert ledger.total_cost == pytest.approx(4.0)
+
+
+@pytest.fixture
+def exhausted(monkeypatch):
+    ledger = UsageLedger(PRICES, session_budget=1.0)
+    ledger.charge(span(1000, 0, client="exhausted"))
+    monkeypatch.setattr(usage_ledger, "_default_ledger", ledger)
+    return ledger
+
+
+def test_agent_within_budget_is_kept(exhausted):
+    with client_context("fresh"):
+        assert select_agent("agent") == "agent"
+
+
+def test_exhausted_budget_without_degraded_agent_raises(exhausted):
+    with client_context("exhausted"), pytest.raises(BudgetExceededError):
+        select_agent("agent")
+
+
+def test_degraded_agent_is_built_once_on_first_use(exhausted):
+    built = []
+    degraded = DegradedAgent(lambda model_name: built.append(model_name) or f"agent on {model_name}", "cheap")
+    assert built == []
+
+    with client_context("exhausted"):
+        results = []
+        threads = [threading.Thread(target=contextvars.copy_context().run,
+                                    args=(lambda: results.append(select_agent("agent", degraded)),))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert results == ["agent on cheap"] * 10
+    assert built == ["cheap"]
+
+
+@pytest.mark.parametrize("configured, expected", [(None, None), ("", None), ("expensive", None), ("cheap", "cheap")])
+def test_degraded_agent_needs_another_configured_model(monkeypatch, configured, expected):
+    monkeypatch.setattr(usage_ledger, "degraded_model_name", lambda: configured)
+    degraded = degraded_agent(lambda model_name: model_name, "expensive")
+
+    assert (degraded.model_name if degraded is not None else None) == expected